@@ -1,38 +1,184 @@
 # backend/app/main.py
-from fastapi import FastAPI, Depends, HTTPException, Response
+from fastapi import BackgroundTasks, FastAPI, Depends, File, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import func, select, text, true
+import asyncio
 import csv
+import json
+import math
+import os
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager
 from io import StringIO
-from datetime import datetime, timedelta
+from typing import Optional
+from datetime import date, datetime, timedelta
 import redis
 import logging
 
-from .database import get_db, engine
-from .models import Video, Variant, Experiment, MetricsRaw, MetricsAgg
+from .database import (
+    get_db, get_read_db, SessionLocal, engine, replica_engine, replica_monitor,
+    STICKY_COOKIE, READ_YOUR_WRITES_SEC
+)
+from .models import (
+    Video, Variant, Experiment, MetricsRaw, MetricsAgg, ChannelExperimentOutcome, ChannelVariantDaily
+)
 from .schemas import (
     VideoCreate, VideoResponse, VariantCreate, VariantResponse,
     ExperimentCreate, ExperimentResponse, ExperimentResults
 )
 from .utils import normalize_url
-from .statistics import calculate_z_test
-from .tasks import trigger_youtube_ingest
+from .statistics import (
+    calculate_z_test, calculate_z_tests, calculate_bayesian_results, calculate_sample_sizes,
+    calculate_powers, simulate_power, estimate_daily_traffic, plan_experiment, METRIC_COUNTS
+)
+from .change_detection import get_gate
+from .results_stream import ResultsBroadcaster
+from .backfill import BackfillError, backfill, detect_format, open_text
+from .survey_routes import router as survey_router
+from .thumbnails import ThumbnailError, get_thumbnail_cache, prefetch_thumbnail
+from .profiling import (
+    token_valid, new_profile_id, try_begin_request_profile, end_request_profile,
+    list_profiles, load_profile
+)
+
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Crowd Test API", version="1.0.0")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Uploaded backfill files wait here for an export worker; must be shared with the workers
+BACKFILL_DIR = os.getenv("BACKFILL_DIR", "/tmp/crowdtest-backfill")
+# Power analysis at experiment creation: the MDE assumed when stop_rules has none,
+# and the longest an experiment may need before it counts as under-powered
+POWER_DEFAULT_MDE = float(os.getenv("POWER_DEFAULT_MDE", "0.1"))
+POWER_MAX_DAYS = float(os.getenv("POWER_MAX_DAYS", "28"))
+POWER_TRAFFIC_DAYS = int(os.getenv("POWER_TRAFFIC_DAYS", "14"))
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",")
+    if origin.strip()
+]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Process-wide resources
+    
+    Nothing here connects eagerly: the Redis pool and the database engine open
+    connections on first use, so a cold pod is ready as soon as it is imported.
+    Schema changes are applied by Alembic, never at startup.
+    """
+    app.state.redis = redis.from_url(REDIS_URL)
+    try:
+        yield
+    finally:
+        await results_broadcaster.stop()
+        app.state.redis.close()
+        engine.dispose()
+        if replica_engine is not engine:
+            replica_engine.dispose()
+
+app = FastAPI(title="Crowd Test API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-logger = logging.getLogger(__name__)
+app.include_router(survey_router)
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# POST endpoints that only read
+READ_ONLY_POSTS = {"/experiments/results:batch", "/experiments/power"}
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """
+    Pin a client's reads to the primary briefly after it writes
+    
+    Replica reads can otherwise miss a row the same client created a moment
+    ago. The route actually used is echoed in X-DB-Route.
+    """
+    response = await call_next(request)
+    if (replica_monitor is not None and request.method in WRITE_METHODS
+            and request.url.path not in READ_ONLY_POSTS and response.status_code < 400):
+        response.set_cookie(
+            STICKY_COOKIE, f"{time.time() + READ_YOUR_WRITES_SEC:.3f}",
+            max_age=int(math.ceil(READ_YOUR_WRITES_SEC)), httponly=True, samesite="lax"
+        )
+    route = getattr(request.state, "db_route", None)
+    if route:
+        response.headers["X-DB-Route"] = route
+    return response
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """
+    Sample stacks for this request when X-Profile carries PROFILE_TOKEN
+    
+    The collapsed stacks are saved when the response body has been sent and
+    can be fetched from GET /profiles/{X-Profile-Id}. X-Profile: busy means
+    another request was already being profiled.
+    """
+    if not token_valid(request.headers.get("x-profile")):
+        return await call_next(request)
+    profiler = try_begin_request_profile()
+    if profiler is None:
+        response = await call_next(request)
+        response.headers["X-Profile"] = "busy"
+        return response
+    
+    profile_id = new_profile_id("req")
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await run_in_threadpool(end_request_profile, profile_id, profiler)
+        raise
+    
+    body = response.body_iterator
+    async def profiled_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await run_in_threadpool(end_request_profile, profile_id, profiler)
+    
+    response.body_iterator = profiled_body()
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+def _require_profile_token(request: Request):
+    if not token_valid(request.headers.get("x-profile-token")):
+        # Indistinguishable from a missing route while profiling is disabled
+        raise HTTPException(status_code=404, detail="Not found")
+
+@app.get("/profiles")
+def get_profiles(request: Request):
+    """Stored request and task profiles, newest first"""
+    _require_profile_token(request)
+    return {"profiles": list_profiles()}
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str, request: Request):
+    """Collapsed stacks (flamegraph.pl / speedscope input) for one profile"""
+    _require_profile_token(request)
+    try:
+        collapsed = load_profile(profile_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed)
 
 @app.get("/health")
-async def health_check():
+def health_check(request: Request):
     """Health check endpoint"""
     health_status = {
         "api": "ok",
@@ -47,10 +193,18 @@ async def health_check():
     except Exception as e:
         health_status["database"] = f"error: {str(e)}"
     
+    # Check replica (only when one is configured)
+    if replica_monitor is not None:
+        if replica_monitor.healthy():
+            health_status["replica"] = f"ok (lag {replica_monitor.lag:.1f}s)"
+        elif replica_monitor.lag is None:
+            health_status["replica"] = "unreachable, reads use primary"
+        else:
+            health_status["replica"] = f"lagging {replica_monitor.lag:.1f}s, reads use primary"
+    
     # Check Redis
     try:
-        r = redis.from_url("redis://localhost:6379")
-        r.ping()
+        request.app.state.redis.ping()
         health_status["redis"] = "ok"
     except Exception as e:
         health_status["redis"] = f"error: {str(e)}"
@@ -82,7 +236,8 @@ def create_or_get_video(video_data: VideoCreate, db: Session = Depends(get_db)):
     return video
 
 @app.post("/videos/{video_id}/variants", response_model=VariantResponse)
-def create_variant(video_id: str, variant_data: VariantCreate, db: Session = Depends(get_db)):
+def create_variant(video_id: str, variant_data: VariantCreate, background_tasks: BackgroundTasks,
+                   db: Session = Depends(get_db)):
     """Create a variant for a video"""
     # Verify video exists
     video = db.query(Video).filter(Video.id == video_id).first()
@@ -108,8 +263,45 @@ def create_variant(video_id: str, variant_data: VariantCreate, db: Session = Dep
     db.add(variant)
     db.commit()
     db.refresh(variant)
+    
+    # Warm the thumbnail cache after the response so the first dashboard render hits it
+    if thumbnail_url:
+        background_tasks.add_task(prefetch_thumbnail, thumbnail_url)
     return variant
 
+# Variants can be re-pointed at another thumbnail; the content URL never changes
+VARIANT_THUMBNAIL_MAX_AGE = 3600
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+
+def _thumbnail_response(digest: str, request: Request, cache_control: str) -> Response:
+    cached = get_thumbnail_cache().open(digest)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Content-Location": f"/thumbnails/{digest}"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    path, content_type = cached
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+@app.get("/variants/{variant_id}/thumbnail")
+def get_variant_thumbnail(variant_id: uuid.UUID, request: Request, db: Session = Depends(get_read_db)):
+    """A variant's thumbnail from the local cache, fetched from its origin on a miss"""
+    variant = db.query(Variant).filter(Variant.id == variant_id).first()
+    if not variant or not variant.thumbnail_url:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    try:
+        digest = get_thumbnail_cache().get(variant.thumbnail_url)
+    except ThumbnailError as e:
+        logger.warning(f"Thumbnail for variant {variant_id} unavailable: {str(e)}")
+        raise HTTPException(status_code=502, detail="Thumbnail origin unavailable")
+    return _thumbnail_response(digest, request, f"public, max-age={VARIANT_THUMBNAIL_MAX_AGE}")
+
+@app.get("/thumbnails/{digest}")
+def get_thumbnail(digest: str, request: Request):
+    """Cached thumbnail by content digest; immutable, so browsers never revalidate"""
+    return _thumbnail_response(digest, request, f"public, max-age={THUMBNAIL_MAX_AGE}, immutable")
+
 @app.post("/experiments", response_model=ExperimentResponse)
 def create_experiment(experiment_data: ExperimentCreate, db: Session = Depends(get_db)):
     """Create a new experiment"""
@@ -122,13 +314,43 @@ def create_experiment(experiment_data: ExperimentCreate, db: Session = Depends(g
     if variant_count < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 variants to run experiment")
     
+    # Refuse experiments that could not reach their sample size within the time limit
+    stop_rules = dict(experiment_data.stop_rules or {})
+    # Results read every metric other than CTR as like rate
+    metric = "ctr" if experiment_data.primary_metric == "ctr" else "like_rate"
+    try:
+        max_days = float(stop_rules["max_hours"]) / 24 if stop_rules.get("max_hours") else POWER_MAX_DAYS
+        plan = plan_experiment(
+            db, video.id, metric, variant_count,
+            mde=stop_rules.get("mde", POWER_DEFAULT_MDE),
+            alpha=stop_rules.get("pvalue", 0.05),
+            power=stop_rules.get("power", 0.8),
+            relative=stop_rules.get("mde_type", "relative") == "relative",
+            baseline_rate=stop_rules.get("baseline_rate"),
+            max_days=max_days,
+            traffic_days=POWER_TRAFFIC_DAYS
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid power analysis inputs: {str(e)}")
+    if plan["underpowered"] and not stop_rules.get("allow_underpowered"):
+        raise HTTPException(status_code=400, detail={
+            "message": f"Experiment needs about {plan['expected_days']} days of traffic to reach "
+                       f"{plan['power']:.0%} power (limit {max_days:g} days); raise mde, add traffic "
+                       f"or set stop_rules.allow_underpowered",
+            "power_analysis": plan
+        })
+    if plan["total"]:
+        # Stopping before the planned sample size would inflate false positives
+        stop_rules["min_samples"] = max(stop_rules.get("min_samples") or 0, plan["total"])
+    stop_rules["power_analysis"] = plan
+    
     experiment = Experiment(
         name=experiment_data.name,
         video_id=experiment_data.video_id,
         primary_metric=experiment_data.primary_metric,
         secondary_metrics=experiment_data.secondary_metrics or [],
         start_at=datetime.utcnow(),
-        stop_rules=experiment_data.stop_rules or {},
+        stop_rules=stop_rules,
         status="running"
     )
     db.add(experiment)
@@ -136,23 +358,336 @@ def create_experiment(experiment_data: ExperimentCreate, db: Session = Depends(g
     db.refresh(experiment)
     return experiment
 
+POWER_WHAT_IF_DAYS = (7, 14, 21, 28, 42, 56)
+MAX_POWER_GRID = 10000
+MAX_POWER_SIMULATIONS = 20000
+
+@app.post("/experiments/power")
+def experiment_power_analysis(payload: dict, db: Session = Depends(get_read_db)):
+    """
+    Sample-size planning for a prospective experiment
+    
+    Body: mde (number or list), alpha, power (number or list each),
+    baseline_rate (number or list; default: the video's recent rate), video_id,
+    primary_metric ("ctr" | "like_rate"), variants, mde_type ("relative" |
+    "absolute"), simulations (Monte Carlo check of the first grid row), seed.
+    """
+    primary_metric = payload.get("primary_metric", "ctr")
+    relative = payload.get("mde_type", "relative") == "relative"
+    variants = payload.get("variants")
+    traffic = {"daily_trials": None, "baseline_rate": None, "days": POWER_TRAFFIC_DAYS}
+    try:
+        if payload.get("video_id"):
+            video_id = uuid.UUID(str(payload["video_id"]))
+            if primary_metric not in ("ctr", "like_rate"):
+                raise ValueError("primary_metric must be ctr or like_rate")
+            traffic = estimate_daily_traffic(db, video_id, primary_metric, POWER_TRAFFIC_DAYS)
+            if variants is None:
+                variants = db.query(Variant).filter(Variant.video_id == video_id).count()
+        variants = max(2, int(variants or 2))
+        baselines = payload.get("baseline_rate", traffic["baseline_rate"])
+        if baselines is None:
+            raise ValueError("baseline_rate is required when the video has no recent metrics")
+        if payload.get("mde") is None:
+            raise ValueError("mde is required")
+        grid = calculate_sample_sizes(
+            baselines, payload["mde"], payload.get("alpha", 0.05), payload.get("power", 0.8),
+            variants, relative
+        )
+        simulations = int(payload.get("simulations", 0))
+        seed = int(payload.get("seed", 0))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(grid["per_variant"]) > MAX_POWER_GRID:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_POWER_GRID} grid points per request")
+    if not 0 <= simulations <= MAX_POWER_SIMULATIONS:
+        raise HTTPException(status_code=400, detail=f"simulations must be between 0 and {MAX_POWER_SIMULATIONS}")
+    
+    daily = traffic["daily_trials"]
+    plans = []
+    for i in range(len(grid["per_variant"])):
+        per_variant = grid["per_variant"][i]
+        if math.isnan(per_variant):
+            plans.append({key: float(grid[key][i]) for key in ("baseline", "mde", "alpha", "power")}
+                         | {"per_variant": None, "total": None, "expected_days": None})
+            continue
+        plans.append({
+            "baseline": float(grid["baseline"][i]),
+            "mde": float(grid["mde"][i]),
+            "alpha": float(grid["alpha"][i]),
+            "power": float(grid["power"][i]),
+            "per_variant": int(per_variant),
+            "total": int(per_variant) * variants,
+            "expected_days": round(int(per_variant) * variants / daily, 1) if daily else None
+        })
+    
+    result = {
+        "primary_metric": primary_metric,
+        "mde_type": "relative" if relative else "absolute",
+        "variants": variants,
+        "traffic": traffic,
+        "plans": plans
+    }
+    first = plans[0]
+    if daily and first["per_variant"]:
+        # Power the first plan's effect reaches after each candidate duration
+        per_variant_by_days = [daily * d / variants for d in POWER_WHAT_IF_DAYS]
+        reached = calculate_powers(first["baseline"], first["mde"], per_variant_by_days,
+                                   first["alpha"], variants, relative)
+        result["what_if"] = [
+            {"days": d, "per_variant": int(n), "power": round(float(p), 4)}
+            for d, n, p in zip(POWER_WHAT_IF_DAYS, per_variant_by_days, reached)
+        ]
+    if simulations and first["per_variant"]:
+        result["simulation"] = simulate_power(
+            first["baseline"], first["mde"], first["per_variant"], first["alpha"], variants,
+            relative, simulations, seed
+        )
+    return result
+
+# Upper bound on experiments per batch request
+MAX_BATCH_EXPERIMENTS = 200
+BATCH_VARIANT_FIELDS = (
+    "variant_id", "variant_key", "views", "likes", "impressions", "clicks", "ctr", "like_rate"
+)
+
+def _parse_experiment_ids(ids: list) -> list:
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids is required")
+    if len(ids) > MAX_BATCH_EXPERIMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_EXPERIMENTS} experiments per request")
+    try:
+        return list(dict.fromkeys(str(uuid.UUID(str(i))) for i in ids))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be experiment UUIDs")
+
+def compute_batch_results(db: Session, experiment_ids: list) -> dict:
+    """
+    Results for many experiments from one query and one vectorized z-test
+    
+    Follows the single-experiment endpoint: latest daily metrics per variant,
+    primary-metric CTR test between the first two variants with data.
+    """
+    latest = select(MetricsAgg).where(
+        MetricsAgg.variant_id == Variant.id
+    ).order_by(MetricsAgg.date.desc()).limit(1).lateral("latest")
+    rows = db.query(
+        Experiment.id, Experiment.status, Experiment.primary_metric,
+        Variant.id, Variant.variant_key,
+        latest.c.views, latest.c.likes, latest.c.impressions, latest.c.clicks
+    ).outerjoin(
+        Variant, Variant.video_id == Experiment.video_id
+    ).outerjoin(
+        latest, true()
+    ).filter(
+        Experiment.id.in_(experiment_ids)
+    ).order_by(Experiment.id, Variant.created_at, Variant.variant_key).all()
+    
+    experiments = {}
+    for experiment_id, status, primary_metric, variant_id, variant_key, views, likes, impressions, clicks in rows:
+        entry = experiments.setdefault(str(experiment_id), {
+            "status": status,
+            "primary_metric": primary_metric,
+            "variants": [],
+            "statistical_results": None,
+            "winner": None
+        })
+        # Variants without metrics yet are left out, as in /experiments/{id}/results
+        if variant_id is None or impressions is None:
+            continue
+        views, likes, impressions, clicks = views or 0, likes or 0, impressions or 0, clicks or 0
+        entry["variants"].append([
+            str(variant_id), variant_key, views, likes, impressions, clicks,
+            clicks / impressions if impressions > 0 else 0,
+            likes / views if views > 0 else 0
+        ])
+    
+    # One z-test pass over every experiment that has a testable pair
+    tested = [
+        entry for entry in experiments.values()
+        if entry["primary_metric"] == "ctr" and len(entry["variants"]) >= 2
+        and entry["variants"][0][4] > 0 and entry["variants"][1][4] > 0
+    ]
+    if tested:
+        tests = calculate_z_tests(
+            [e["variants"][0][5] for e in tested], [e["variants"][0][4] for e in tested],
+            [e["variants"][1][5] for e in tested], [e["variants"][1][4] for e in tested]
+        )
+        for i, entry in enumerate(tested):
+            p_value = float(tests["p_value"][i])
+            entry["statistical_results"] = {
+                "z_statistic": float(tests["z_statistic"][i]),
+                "p_value": p_value,
+                "variant_a_ci": tests["variant_a_ci"][i].tolist(),
+                "variant_b_ci": tests["variant_b_ci"][i].tolist(),
+                "significant": p_value < 0.05
+            }
+            if p_value < 0.05:
+                a, b = entry["variants"][0], entry["variants"][1]
+                entry["winner"] = a[1] if a[6] > b[6] else b[1]
+    
+    return {
+        "variant_fields": list(BATCH_VARIANT_FIELDS),
+        "experiments": experiments,
+        "missing": [i for i in experiment_ids if i not in experiments]
+    }
+
+@app.post("/experiments/results:batch")
+def get_batch_experiment_results(payload: dict, db: Session = Depends(get_read_db)):
+    """Results for many experiments in one round trip; body: {"ids": [...]}"""
+    return compute_batch_results(db, _parse_experiment_ids(payload.get("ids") or []))
+
+@app.get("/experiments/results:batch")
+def get_batch_experiment_results_query(ids: str = "", db: Session = Depends(get_read_db)):
+    """Same as the POST form with ?ids=a,b,c"""
+    return compute_batch_results(db, _parse_experiment_ids([i for i in ids.split(",") if i.strip()]))
+
+LEADERBOARD_SORTS = ("lift", "significance")
+LEADERBOARD_MAX_LIMIT = 100
+
+def _leaderboard_entry(outcome: ChannelExperimentOutcome, alpha: float) -> dict:
+    return {
+        "experiment_id": str(outcome.experiment_id),
+        "name": outcome.name,
+        "status": outcome.status,
+        "video_id": str(outcome.video_id),
+        "start_at": outcome.start_at,
+        "as_of": outcome.as_of,
+        "variants": outcome.variants,
+        "control": {
+            "variant_key": outcome.control_key,
+            "successes": outcome.control_successes,
+            "trials": outcome.control_trials,
+            "rate": outcome.control_rate
+        },
+        "leader": {
+            "variant_id": str(outcome.leader_variant_id),
+            "variant_key": outcome.leader_key,
+            "title": outcome.leader_title,
+            "thumbnail_url": outcome.leader_thumbnail_url,
+            "successes": outcome.leader_successes,
+            "trials": outcome.leader_trials,
+            "rate": outcome.leader_rate
+        },
+        "lift": outcome.lift,
+        "z_statistic": outcome.z_statistic,
+        "p_value": outcome.p_value,
+        "significant": outcome.p_value is not None and outcome.p_value < alpha
+    }
+
+@app.get("/channels/{channel_id}/leaderboard")
+def get_channel_leaderboard(channel_id: str, metric: str = "ctr", sort: str = "lift", limit: int = 20,
+                            status: Optional[str] = None, min_trials: int = 0, alpha: float = 0.05,
+                            significant_only: bool = False, days: int = 28,
+                            db: Session = Depends(get_read_db)):
+    """
+    A channel's experiments ranked by how much their leading variant beats the control
+    
+    Reads only the rollup tables (see rollups.py), so the cost does not grow with
+    metrics history. sort=lift puts significant results (p < alpha) first and
+    orders each group by lift; sort=significance orders by p-value. min_trials
+    applies to both the control and the leader. The summary is the channel's
+    traffic over the last `days` days.
+    """
+    if metric not in METRIC_COUNTS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {list(METRIC_COUNTS)}")
+    if sort not in LEADERBOARD_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {list(LEADERBOARD_SORTS)}")
+    if not 1 <= limit <= LEADERBOARD_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LEADERBOARD_MAX_LIMIT}")
+    if not 0 < alpha < 1:
+        raise HTTPException(status_code=400, detail="alpha must be between 0 and 1")
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    
+    outcomes = ChannelExperimentOutcome
+    query = db.query(outcomes).filter(
+        outcomes.channel_id == channel_id,
+        outcomes.primary_metric == metric,
+        outcomes.lift.isnot(None),
+        func.least(outcomes.control_trials, outcomes.leader_trials) >= min_trials
+    )
+    if status:
+        query = query.filter(outcomes.status == status)
+    if significant_only:
+        query = query.filter(outcomes.p_value < alpha)
+    if sort == "lift":
+        query = query.order_by((outcomes.p_value < alpha).desc(), outcomes.lift.desc(), outcomes.p_value)
+    else:
+        query = query.order_by(outcomes.p_value, outcomes.lift.desc())
+    ranked = query.order_by(outcomes.experiment_id).limit(limit).all()
+    
+    # Channel totals from the daily increments
+    since = date.today() - timedelta(days=days - 1)
+    impressions, clicks, views, likes = db.query(
+        func.coalesce(func.sum(ChannelVariantDaily.impressions), 0),
+        func.coalesce(func.sum(ChannelVariantDaily.clicks), 0),
+        func.coalesce(func.sum(ChannelVariantDaily.views), 0),
+        func.coalesce(func.sum(ChannelVariantDaily.likes), 0)
+    ).filter(
+        ChannelVariantDaily.channel_id == channel_id,
+        ChannelVariantDaily.date >= since
+    ).one()
+    experiments, refreshed_at = db.query(
+        func.count(outcomes.experiment_id), func.max(outcomes.updated_at)
+    ).filter(outcomes.channel_id == channel_id).one()
+    
+    return {
+        "channel_id": channel_id,
+        "metric": metric,
+        "sort": sort,
+        "alpha": alpha,
+        "summary": {
+            "since": since,
+            "days": days,
+            "experiments": experiments,
+            "impressions": int(impressions),
+            "clicks": int(clicks),
+            "views": int(views),
+            "likes": int(likes),
+            "ctr": int(clicks) / int(impressions) if impressions else 0,
+            "like_rate": int(likes) / int(views) if views else 0,
+            "refreshed_at": refreshed_at
+        },
+        "experiments": [_leaderboard_entry(outcome, alpha) for outcome in ranked]
+    }
+
 @app.get("/experiments/{experiment_id}", response_model=ExperimentResponse)
-def get_experiment(experiment_id: str, db: Session = Depends(get_db)):
+def get_experiment(experiment_id: str, db: Session = Depends(get_read_db)):
     """Get experiment details"""
     experiment = db.query(Experiment).filter(Experiment.id == experiment_id).first()
     if not experiment:
         raise HTTPException(status_code=404, detail="Experiment not found")
     return experiment
 
+# P(best) a variant needs before the Bayesian mode declares it the winner
+BAYES_WINNER_PROB = 0.95
+
+def _validate_results_params(method: str, draws: int):
+    if method not in ("frequentist", "bayes"):
+        raise HTTPException(status_code=400, detail="method must be 'frequentist' or 'bayes'")
+    if not 1000 <= draws <= 200000:
+        raise HTTPException(status_code=400, detail="draws must be between 1000 and 200000")
+
 @app.get("/experiments/{experiment_id}/results", response_model=ExperimentResults)
-def get_experiment_results(experiment_id: str, db: Session = Depends(get_db)):
-    """Get experiment results with statistical analysis"""
+def get_experiment_results(experiment_id: str, method: str = "frequentist", seed: int = 0,
+                           draws: int = 10000, db: Session = Depends(get_read_db)):
+    """Get experiment results with statistical analysis (method=frequentist|bayes)"""
+    _validate_results_params(method, draws)
+    
     experiment = db.query(Experiment).filter(Experiment.id == experiment_id).first()
     if not experiment:
         raise HTTPException(status_code=404, detail="Experiment not found")
     
+    return ExperimentResults(**compute_experiment_results(db, experiment, method, seed, draws))
+
+def compute_experiment_results(db: Session, experiment: Experiment, method: str = "frequentist",
+                               seed: int = 0, draws: int = 10000) -> dict:
+    """Latest metrics per variant plus the statistical comparison for one experiment"""
     # Get variants
-    variants = db.query(Variant).filter(Variant.video_id == experiment.video_id).all()
+    variants = db.query(Variant).filter(
+        Variant.video_id == experiment.video_id
+    ).order_by(Variant.created_at, Variant.variant_key).all()
     
     # Get latest aggregated metrics for each variant
     results = []
@@ -189,7 +724,31 @@ def get_experiment_results(experiment_id: str, db: Session = Depends(get_db)):
     statistical_results = None
     winner = None
     
-    if len(results) >= 2:
+    if method == "bayes" and results:
+        # Beta-Binomial posteriors for every variant at once, both metrics
+        ctr_posteriors = calculate_bayesian_results(
+            [r["clicks"] for r in results], [r["impressions"] for r in results], draws=draws, seed=seed
+        )
+        like_posteriors = calculate_bayesian_results(
+            [r["likes"] for r in results], [r["views"] for r in results], draws=draws, seed=seed
+        )
+        for result, ctr_post, like_post in zip(results, ctr_posteriors, like_posteriors):
+            result["bayes"] = {"ctr": ctr_post, "like_rate": like_post}
+        
+        primary = ctr_posteriors if experiment.primary_metric == "ctr" else like_posteriors
+        best = max(range(len(results)), key=lambda i: primary[i]["prob_best"])
+        statistical_results = {
+            "method": "bayes",
+            "metric": experiment.primary_metric,
+            "draws": draws,
+            "seed": seed,
+            "prob_best": {r["variant_key"]: p["prob_best"] for r, p in zip(results, primary)},
+            "expected_loss": {r["variant_key"]: p["expected_loss"] for r, p in zip(results, primary)}
+        }
+        if len(results) >= 2 and primary[best]["prob_best"] >= BAYES_WINNER_PROB:
+            winner = results[best]["variant_key"]
+    
+    elif len(results) >= 2:
         # Use primary metric for comparison
         if experiment.primary_metric == "ctr":
             # Compare CTR between first two variants
@@ -214,16 +773,82 @@ def get_experiment_results(experiment_id: str, db: Session = Depends(get_db)):
                 if statistical_results["significant"]:
                     winner = variant_a["variant_key"] if variant_a["ctr"] > variant_b["ctr"] else variant_b["variant_key"]
     
-    return ExperimentResults(
-        experiment_id=str(experiment.id),
-        status=experiment.status,
-        variants=results,
-        statistical_results=statistical_results,
-        winner=winner
+    return {
+        "experiment_id": str(experiment.id),
+        "status": experiment.status,
+        "variants": results,
+        "statistical_results": statistical_results,
+        "winner": winner
+    }
+
+async def _compute_results_payload(experiment_id: str, method: str) -> dict:
+    """
+    Fresh results for the push stream, computed off the event loop
+    
+    Pushes follow an ingest commit on the primary; a replica within its lag
+    budget may not have replayed it yet, and nothing would correct the stale
+    payload until the next ingest, so these reads use the primary.
+    """
+    def compute():
+        db = SessionLocal()
+        try:
+            experiment = db.query(Experiment).filter(Experiment.id == experiment_id).first()
+            if not experiment:
+                return {"experiment_id": experiment_id, "error": "Experiment not found"}
+            return jsonable_encoder(compute_experiment_results(db, experiment, method))
+        finally:
+            db.close()
+    
+    return await run_in_threadpool(compute)
+
+results_broadcaster = ResultsBroadcaster(_compute_results_payload)
+
+# Comment line sent on idle streams so proxies keep the connection open
+SSE_KEEPALIVE_SEC = 15
+
+@app.get("/experiments/{experiment_id}/stream")
+async def stream_experiment_results(experiment_id: uuid.UUID, request: Request, method: str = "frequentist"):
+    """
+    Server-sent events with the experiment's results
+
+    Sends the current results immediately, then again only when ingestion
+    reports new data for this experiment.
+    """
+    _validate_results_params(method, 10000)
+    experiment_id = str(experiment_id)
+    # Subscribe before computing the initial payload so no update falls in between;
+    # one that does arrive meanwhile is just sent a second time
+    queue = await results_broadcaster.subscribe(experiment_id, method)
+    try:
+        initial = await _compute_results_payload(experiment_id, method)
+    except Exception:
+        results_broadcaster.unsubscribe(experiment_id, method, queue)
+        raise
+    if initial.get("error"):
+        results_broadcaster.unsubscribe(experiment_id, method, queue)
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    
+    async def events():
+        try:
+            yield f"event: results\ndata: {json.dumps(initial)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: results\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            results_broadcaster.unsubscribe(experiment_id, method, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @app.get("/experiments/{experiment_id}/export.csv")
-def export_experiment_csv(experiment_id: str, db: Session = Depends(get_db)):
+def export_experiment_csv(experiment_id: str, db: Session = Depends(get_read_db)):
     """Export experiment data as CSV"""
     experiment = db.query(Experiment).filter(Experiment.id == experiment_id).first()
     if not experiment:
@@ -276,9 +901,67 @@ def export_experiment_csv(experiment_id: str, db: Session = Depends(get_db)):
 @app.post("/ingest/youtube")
 def trigger_youtube_ingest_endpoint():
     """Trigger YouTube data ingestion (internal use)"""
+    # Celery and the ingest pipeline load on first use, not on every API cold start
+    from .tasks import trigger_youtube_ingest
     trigger_youtube_ingest.delay()
     return {"message": "YouTube ingestion triggered"}
 
+@app.get("/ingest/stats")
+def ingest_stats():
+    """Snapshot write counters, including writes suppressed because nothing changed"""
+    return get_gate().stats()
+
+@app.post("/backfill/metrics")
+def upload_metrics_backfill(file: UploadFile = File(...), format: Optional[str] = None,
+                            source: str = "backfill", wait: bool = False):
+    """
+    Upload historical metrics (CSV or NDJSON, optionally gzipped)
+    
+    By default the file is queued for an export worker and a task id is
+    returned; wait=true loads it in this request and returns the report.
+    """
+    try:
+        fmt = format or detect_format(file.filename or "")
+    except BackfillError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if wait:
+        conn = engine.raw_connection()
+        try:
+            report = backfill(open_text(file.file, file.filename or ""), fmt, conn, source)
+        except BackfillError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            conn.close()
+        if report["agg_upserted"] and report["first_date"]:
+            from .backend_tasks import enqueue_rollup_refresh
+            enqueue_rollup_refresh(report["video_ids"], date.fromisoformat(report["first_date"]))
+        return report
+    
+    # Keep the .gz suffix so the worker knows to decompress
+    os.makedirs(BACKFILL_DIR, exist_ok=True)
+    suffix = ".gz" if (file.filename or "").lower().endswith(".gz") else ""
+    path = os.path.join(BACKFILL_DIR, f"{uuid.uuid4()}.{fmt}{suffix}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out, length=1 << 20)
+    
+    from .backend_tasks import backfill_metrics
+    task = backfill_metrics.delay(path, fmt, source, delete_after=True)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.get("/backfill/{task_id}")
+def get_backfill_status(task_id: str):
+    """State of a queued backfill, with its report once finished"""
+    from .celery_worker import celery_app
+    
+    task = celery_app.AsyncResult(task_id)
+    response = {"task_id": task_id, "status": task.state.lower()}
+    if task.successful():
+        response["report"] = task.result
+    elif task.failed():
+        response["error"] = str(task.result)
+    return response
+
 @app.post("/tools/normalize-url")
 def normalize_url_endpoint(url: str):
     """Test URL normalization"""
@@ -287,15 +970,3 @@ def normalize_url_endpoint(url: str):
         "original": url,
         "normalized": normalized
     }
-# === attach CORS & survey routes (append) ===
-from fastapi.middleware.cors import CORSMiddleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000","http://127.0.0.1:3000"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-    allow_credentials=True,
-)
-
-from .survey_routes import router as survey_router
-app.include_router(survey_router)
@@ -1,6 +1,6 @@
 # backend/app/models.py
-from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, ForeignKey, Date, BigInteger
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, ForeignKey, Date, BigInteger, Boolean, SmallInteger, Float
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -92,6 +92,131 @@ class MetricsAgg(Base):
         {"schema": None},
     )
 
+# Channel rollups (see rollups.py); rebuilt from metrics_agg, never written by the API
+class ChannelVariantDaily(Base):
+    __tablename__ = "channel_variant_daily"
+    
+    variant_id = Column(UUID(as_uuid=True), ForeignKey("variants.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    channel_id = Column(Text, nullable=False)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+    variant_key = Column(Text, nullable=False)
+    # Increments of the cumulative counters over the previous stored day
+    views = Column(BigInteger, nullable=False)
+    likes = Column(BigInteger, nullable=False)
+    impressions = Column(BigInteger, nullable=False)
+    clicks = Column(BigInteger, nullable=False)
+    watch_time_sec = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class ChannelExperimentOutcome(Base):
+    __tablename__ = "channel_experiment_outcomes"
+    
+    experiment_id = Column(UUID(as_uuid=True), ForeignKey("experiments.id", ondelete="CASCADE"), primary_key=True)
+    channel_id = Column(Text, nullable=False)
+    video_id = Column(UUID(as_uuid=True), ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+    name = Column(Text, nullable=False)
+    status = Column(Text, nullable=False)
+    primary_metric = Column(Text, nullable=False)
+    start_at = Column(DateTime(timezone=True), nullable=False)
+    variants = Column(Integer, nullable=False)
+    # Date of the latest metrics the outcome is based on
+    as_of = Column(Date)
+    control_key = Column(Text)
+    control_successes = Column(BigInteger)
+    control_trials = Column(BigInteger)
+    leader_variant_id = Column(UUID(as_uuid=True))
+    leader_key = Column(Text)
+    leader_title = Column(Text)
+    leader_thumbnail_url = Column(Text)
+    leader_successes = Column(BigInteger)
+    leader_trials = Column(BigInteger)
+    control_rate = Column(Float)
+    leader_rate = Column(Float)
+    # Relative: (leader_rate - control_rate) / control_rate
+    lift = Column(Float)
+    z_statistic = Column(Float)
+    p_value = Column(Float)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+# Survey tables (schema from migrations/versions/001_init.py)
+class User(Base):
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True)
+    username = Column(String(50), nullable=False, unique=True, index=True)
+    email = Column(String(100), nullable=False, unique=True, index=True)
+    hashed_password = Column(String(255), nullable=False)
+    is_active = Column(Boolean, nullable=False, server_default="true")
+    is_admin = Column(Boolean, nullable=False, server_default="false")
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class Survey(Base):
+    __tablename__ = "surveys"
+    
+    id = Column(Integer, primary_key=True)
+    title = Column(String(200), nullable=False)
+    description = Column(Text)
+    creator_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    is_active = Column(Boolean, nullable=False, server_default="true")
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    # Refuse repeat submissions (same IP and user agent) instead of flagging them
+    reject_duplicates = Column(Boolean, nullable=False, server_default="false")
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+    
+    questions = relationship("Question", back_populates="survey", order_by="Question.order_index")
+    responses = relationship("Response", back_populates="survey")
+
+class Question(Base):
+    __tablename__ = "questions"
+    
+    id = Column(Integer, primary_key=True)
+    survey_id = Column(Integer, ForeignKey("surveys.id", ondelete="CASCADE"), nullable=False, index=True)
+    question_text = Column(Text, nullable=False)
+    question_type = Column(String(50), nullable=False)
+    is_required = Column(Boolean, nullable=False, server_default="false")
+    order_index = Column(Integer, nullable=False, server_default="0")
+    options = Column(JSONB)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+    
+    survey = relationship("Survey", back_populates="questions")
+
+class Response(Base):
+    __tablename__ = "responses"
+    
+    id = Column(Integer, primary_key=True)
+    survey_id = Column(Integer, ForeignKey("surveys.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    ip_address = Column(String(45))
+    user_agent = Column(Text)
+    # An earlier anonymous response came from the same IP and user agent
+    suspected_duplicate = Column(Boolean, nullable=False, server_default="false")
+    submitted_at = Column(DateTime, nullable=False, server_default=func.now())
+    
+    survey = relationship("Survey", back_populates="responses")
+    answers = relationship("Answer", back_populates="response")
+
+class Answer(Base):
+    __tablename__ = "answers"
+    
+    id = Column(Integer, primary_key=True)
+    response_id = Column(Integer, ForeignKey("responses.id", ondelete="CASCADE"), nullable=False, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False, index=True)
+    answer_text = Column(Text)
+    answer_data = Column(JSONB)
+    # Coded choice answers (see choice_codes): option position / bitmask of positions,
+    # with answer_text and answer_data left NULL
+    choice_index = Column(SmallInteger)
+    choice_mask = Column(BigInteger)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    
+    response = relationship("Response", back_populates="answers")
+    question = relationship("Question")
+
 # Create unique constraint for metrics_agg
 from sqlalchemy import UniqueConstraint
 MetricsAgg.__table_args__ = (
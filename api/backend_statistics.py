@@ -1,7 +1,18 @@
 # backend/app/statistics.py
 import math
-from scipy import stats
-from typing import Tuple
+from datetime import date, timedelta
+from functools import lru_cache
+from statistics import NormalDist
+from typing import List, Sequence, Tuple
+from sqlalchemy import func, cast, true, Numeric
+from sqlalchemy.orm import Session
+
+from .backend_models import Question, Response, Answer, MetricsAgg
+from .choice_codes import MAX_MASK_OPTIONS
+
+CHOICE_QUESTION_TYPES = ("radio", "dropdown", "checkbox")
+# Beta(alpha, beta) is sampled as a Normal once both parameters reach this size
+BETA_NORMAL_APPROX_MIN = 30
 
 def calculate_z_test(clicks_a: int, impressions_a: int, 
                     clicks_b: int, impressions_b: int) -> Tuple[float, float, Tuple[float, float], Tuple[float, float]]:
@@ -36,8 +47,8 @@ def calculate_z_test(clicks_a: int, impressions_a: int,
     # Calculate z-statistic
     z_stat = (p1 - p2) / se
     
-    # Calculate p-value (two-tailed)
-    p_value = 2 * (1 - stats.norm.cdf(abs(z_stat)))
+    # Calculate p-value (two-tailed): 2 * (1 - Phi(|z|)) == erfc(|z| / sqrt(2))
+    p_value = math.erfc(abs(z_stat) / math.sqrt(2))
     
     # Calculate 95% confidence intervals
     z_critical = 1.96  # 95% confidence level
@@ -58,6 +69,53 @@ def calculate_z_test(clicks_a: int, impressions_a: int,
     
     return z_stat, p_value, ci_a, ci_b
 
+def calculate_z_tests(successes_a: Sequence[int], trials_a: Sequence[int],
+                      successes_b: Sequence[int], trials_b: Sequence[int],
+                      z_critical: float = 1.96) -> dict:
+    """
+    Vectorized calculate_z_test over many (A, B) pairs at once
+    
+    Element i gives the same numbers as calculate_z_test on pair i.
+    
+    Returns:
+        Arrays z_statistic, p_value (n,) and variant_a_ci, variant_b_ci (n, 2)
+    """
+    import numpy as np
+    
+    s1 = np.asarray(successes_a, dtype=np.float64)
+    n1 = np.asarray(trials_a, dtype=np.float64)
+    s2 = np.asarray(successes_b, dtype=np.float64)
+    n2 = np.asarray(trials_b, dtype=np.float64)
+    
+    valid = (n1 > 0) & (n2 > 0)
+    safe_n1 = np.where(valid, n1, 1.0)
+    safe_n2 = np.where(valid, n2, 1.0)
+    p1 = np.where(valid, s1 / safe_n1, 0.0)
+    p2 = np.where(valid, s2 / safe_n2, 0.0)
+    p_pool = np.where(valid, (s1 + s2) / (safe_n1 + safe_n2), 0.0)
+    se = np.sqrt(p_pool * (1 - p_pool) * (1 / safe_n1 + 1 / safe_n2))
+    
+    testable = valid & (se > 0)
+    z_stat = np.where(testable, (p1 - p2) / np.where(testable, se, 1.0), 0.0)
+    # numpy has no erfc; this is the only per-element Python call
+    p_value = np.where(testable, _erfc(np.abs(z_stat) / math.sqrt(2)), 1.0)
+    
+    half_a = z_critical * np.sqrt(p1 * (1 - p1) / safe_n1)
+    half_b = z_critical * np.sqrt(p2 * (1 - p2) / safe_n2)
+    ci_a = np.stack([np.maximum(0, p1 - half_a), np.minimum(1, p1 + half_a)], axis=1)
+    ci_b = np.stack([np.maximum(0, p2 - half_b), np.minimum(1, p2 + half_b)], axis=1)
+    
+    return {
+        "z_statistic": z_stat,
+        "p_value": p_value,
+        "variant_a_ci": ci_a,
+        "variant_b_ci": ci_b
+    }
+
+def _erfc(x):
+    import numpy as np
+    return np.frompyfunc(math.erfc, 1, 1)(x).astype(np.float64)
+
 def calculate_like_rate_test(likes_a: int, views_a: int,
                            likes_b: int, views_b: int) -> Tuple[float, float, Tuple[float, float], Tuple[float, float]]:
     """
@@ -66,6 +124,82 @@ def calculate_like_rate_test(likes_a: int, views_a: int,
     """
     return calculate_z_test(likes_a, views_a, likes_b, views_b)
 
+@lru_cache(maxsize=1024)
+def _beta_posteriors(successes: Tuple[int, ...], trials: Tuple[int, ...], draws: int,
+                     seed: int, credible: float) -> Tuple[Tuple[float, float, float, float, float], ...]:
+    """
+    Monte Carlo summary of independent Beta(1 + s, 1 + n - s) posteriors
+    
+    Cached on the counts themselves, so a new ingest (new counts) is a new cache
+    entry and repeated dashboard polls of unchanged data are free.
+    """
+    import numpy as np
+    
+    s = np.asarray(successes, dtype=np.float64)
+    n = np.asarray(trials, dtype=np.float64)
+    alpha = 1.0 + s
+    beta = 1.0 + np.maximum(n - s, 0.0)
+    
+    # Closed-form posterior moments
+    mean = alpha / (alpha + beta)
+    sd = np.sqrt(alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1)))
+    # With enough successes and failures the Beta is indistinguishable from a Normal,
+    # which is several times cheaper to sample and has a closed-form interval
+    normal = (alpha >= BETA_NORMAL_APPROX_MIN) & (beta >= BETA_NORMAL_APPROX_MIN)
+    
+    # One (variants x draws) matrix; every statistic below is a single vectorized pass
+    rng = np.random.default_rng(seed)
+    samples = np.empty((len(s), draws))
+    samples[normal] = mean[normal, None] + sd[normal, None] * rng.standard_normal((int(normal.sum()), draws))
+    if not normal.all():
+        samples[~normal] = rng.beta(alpha[~normal, None], beta[~normal, None], size=(int((~normal).sum()), draws))
+    
+    best = samples.max(axis=0)
+    prob_best = np.bincount(samples.argmax(axis=0), minlength=len(s)) / draws
+    expected_loss = (best - samples).mean(axis=1)
+    
+    z = NormalDist().inv_cdf(0.5 + credible / 2)
+    lower = np.clip(mean - z * sd, 0.0, 1.0)
+    upper = np.clip(mean + z * sd, 0.0, 1.0)
+    if not normal.all():
+        tail = (1 - credible) / 2
+        lower[~normal], upper[~normal] = np.quantile(samples[~normal], [tail, 1 - tail], axis=1)
+    
+    return tuple(
+        (float(mean[i]), float(lower[i]), float(upper[i]), float(prob_best[i]), float(expected_loss[i]))
+        for i in range(len(s))
+    )
+
+def calculate_bayesian_results(successes: Sequence[int], trials: Sequence[int], draws: int = 10000,
+                               seed: int = 0, credible: float = 0.95) -> List[dict]:
+    """
+    Beta-Binomial comparison of any number of variants
+    
+    Args:
+        successes: Clicks (CTR) or likes (like rate) per variant
+        trials: Impressions (CTR) or views (like rate) per variant
+        draws: Monte Carlo draws per variant
+        seed: Random seed; the same seed and counts always give the same result
+        credible: Credible interval mass
+    
+    Returns:
+        Per variant: posterior mean, credible interval, P(best) and expected loss
+    """
+    if not successes:
+        return []
+    summaries = _beta_posteriors(
+        tuple(int(x) for x in successes), tuple(int(x) for x in trials), draws, seed, credible
+    )
+    return [
+        {
+            "posterior_mean": mean,
+            "credible_interval": (lower, upper),
+            "prob_best": prob_best,
+            "expected_loss": expected_loss
+        }
+        for mean, lower, upper, prob_best, expected_loss in summaries
+    ]
+
 def check_stop_conditions(experiment_data: dict, stop_rules: dict) -> bool:
     """
     Check if experiment should be stopped based on stop rules
@@ -100,4 +234,337 @@ def check_stop_conditions(experiment_data: dict, stop_rules: dict) -> bool:
     if statistical_results and statistical_results.get('p_value', 1.0) < p_threshold:
         return True
     
-    return False
\ No newline at end of file
+    return False
+
+# Successes and trials columns in metrics_agg per primary metric
+METRIC_COUNTS = {"ctr": ("clicks", "impressions"), "like_rate": ("likes", "views")}
+
+def _effect_rates(baseline, mde, relative: bool):
+    """Control and treatment rates for a relative (+5% = 0.05) or absolute MDE"""
+    return baseline, (baseline * (1 + mde) if relative else baseline + mde)
+
+def calculate_sample_size(baseline: float, mde: float, alpha: float = 0.05, power: float = 0.8,
+                          variants: int = 2, relative: bool = True) -> int:
+    """
+    Trials per variant for the pooled two-proportion z-test to detect `mde`
+    
+    Alpha is split over the variants - 1 comparisons against the control
+    (Bonferroni), matching how multi-variant experiments are read.
+    
+    Returns:
+        Impressions (CTR) or views (like rate) needed in every variant
+    """
+    p1, p2 = _effect_rates(baseline, mde, relative)
+    if not (0 < p1 < 1 and 0 < p2 < 1) or p1 == p2:
+        raise ValueError("baseline and baseline + mde must be distinct rates between 0 and 1")
+    if not (0 < alpha < 1 and 0 < power < 1):
+        raise ValueError("alpha and power must be between 0 and 1")
+    
+    comparisons = max(1, variants - 1)
+    z_alpha = NormalDist().inv_cdf(1 - alpha / (2 * comparisons))
+    z_beta = NormalDist().inv_cdf(power)
+    p_bar = (p1 + p2) / 2
+    n = (z_alpha * math.sqrt(2 * p_bar * (1 - p_bar)) + z_beta * math.sqrt(p1 * (1 - p1) + p2 * (1 - p2))) ** 2
+    return math.ceil(n / (p2 - p1) ** 2)
+
+def _inv_norm(q):
+    import numpy as np
+    return np.frompyfunc(NormalDist().inv_cdf, 1, 1)(q).astype(np.float64)
+
+def calculate_sample_sizes(baselines, mdes, alphas=0.05, powers=0.8,
+                           variants: int = 2, relative: bool = True) -> dict:
+    """
+    Vectorized calculate_sample_size over every combination of the inputs
+    
+    Each argument may be a scalar or a sequence; the grid is their outer
+    product, flattened in baselines x mdes x alphas x powers order. Invalid
+    combinations get a NaN sample size instead of raising.
+    
+    Returns:
+        Arrays baseline, mde, alpha, power and per_variant, all of one length
+    """
+    import numpy as np
+    
+    b, m, a, pw = (
+        g.ravel() for g in np.meshgrid(
+            np.atleast_1d(np.asarray(baselines, dtype=np.float64)),
+            np.atleast_1d(np.asarray(mdes, dtype=np.float64)),
+            np.atleast_1d(np.asarray(alphas, dtype=np.float64)),
+            np.atleast_1d(np.asarray(powers, dtype=np.float64)),
+            indexing="ij"
+        )
+    )
+    p1, p2 = _effect_rates(b, m, relative)
+    valid = (p1 > 0) & (p1 < 1) & (p2 > 0) & (p2 < 1) & (p1 != p2) & (a > 0) & (a < 1) & (pw > 0) & (pw < 1)
+    
+    comparisons = max(1, variants - 1)
+    # Placeholders keep inv_cdf in its domain on invalid rows; they are masked below
+    z_alpha = _inv_norm(np.where(valid, 1 - a / (2 * comparisons), 0.5))
+    z_beta = _inv_norm(np.where(valid, pw, 0.5))
+    p_bar = (p1 + p2) / 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = (z_alpha * np.sqrt(2 * p_bar * (1 - p_bar)) + z_beta * np.sqrt(p1 * (1 - p1) + p2 * (1 - p2))) ** 2
+        per_variant = np.where(valid, np.ceil(n / (p2 - p1) ** 2), np.nan)
+    
+    return {"baseline": b, "mde": m, "alpha": a, "power": pw, "per_variant": per_variant}
+
+def calculate_powers(baseline: float, mde: float, per_variant, alpha: float = 0.05,
+                     variants: int = 2, relative: bool = True):
+    """
+    Power reached with `per_variant` trials in every variant (vectorized over per_variant)
+    
+    The inverse of calculate_sample_size: what-if tables evaluate it at the
+    sample sizes expected after each candidate duration.
+    """
+    import numpy as np
+    
+    n = np.asarray(per_variant, dtype=np.float64)
+    p1, p2 = _effect_rates(baseline, mde, relative)
+    if not (0 < p1 < 1 and 0 < p2 < 1) or p1 == p2:
+        raise ValueError("baseline and baseline + mde must be distinct rates between 0 and 1")
+    comparisons = max(1, variants - 1)
+    z_alpha = NormalDist().inv_cdf(1 - alpha / (2 * comparisons))
+    p_bar = (p1 + p2) / 2
+    x = (abs(p2 - p1) * np.sqrt(n) - z_alpha * math.sqrt(2 * p_bar * (1 - p_bar))) / math.sqrt(
+        p1 * (1 - p1) + p2 * (1 - p2)
+    )
+    # Standard normal CDF through erfc, as in calculate_z_tests
+    return np.where(n > 0, 0.5 * _erfc(-x / math.sqrt(2)), 0.0)
+
+def simulate_power(baseline: float, mde: float, per_variant: int, alpha: float = 0.05,
+                   variants: int = 2, relative: bool = True, simulations: int = 2000, seed: int = 0) -> dict:
+    """
+    Monte Carlo check of a sample-size plan
+    
+    Simulates `simulations` experiments with binomial counts and reads each one
+    with calculate_z_tests at the Bonferroni-adjusted alpha.
+    
+    Returns:
+        power: share of runs where the first treatment is significant in the right direction
+        false_positive_rate: share of runs with no true effect where any treatment is significant
+    """
+    import numpy as np
+    
+    p1, p2 = _effect_rates(baseline, mde, relative)
+    comparisons = max(1, variants - 1)
+    threshold = alpha / comparisons
+    rng = np.random.default_rng(seed)
+    trials = np.full(simulations * comparisons, per_variant)
+    
+    def significant(treatment_rate: float):
+        control = np.repeat(rng.binomial(per_variant, p1, size=simulations), comparisons)
+        treatment = rng.binomial(per_variant, treatment_rate, size=simulations * comparisons)
+        tests = calculate_z_tests(treatment, trials, control, trials)
+        hit = tests["p_value"] < threshold
+        return hit.reshape(simulations, comparisons), tests["z_statistic"].reshape(simulations, comparisons)
+    
+    hit, z = significant(p2)
+    right_direction = z[:, 0] > 0 if p2 > p1 else z[:, 0] < 0
+    null_hit, _ = significant(p1)
+    return {
+        "simulations": simulations,
+        "power": float((hit[:, 0] & right_direction).mean()),
+        "false_positive_rate": float(null_hit.any(axis=1).mean())
+    }
+
+def estimate_daily_traffic(db: Session, video_id, primary_metric: str = "ctr", days: int = 14) -> dict:
+    """
+    Recent trials per day and baseline rate of a video, summed over its variants
+    
+    metrics_agg holds cumulative counters, so the traffic of the window is the
+    growth between each variant's first and last day in it.
+    
+    Returns:
+        daily_trials (None without two days of data), baseline_rate (None without data), days
+    """
+    successes_col, trials_col = (getattr(MetricsAgg, c) for c in METRIC_COUNTS[primary_metric])
+    since = date.today() - timedelta(days=days)
+    rows = db.query(
+        func.min(MetricsAgg.date), func.max(MetricsAgg.date),
+        func.min(successes_col), func.max(successes_col),
+        func.min(trials_col), func.max(trials_col)
+    ).filter(
+        MetricsAgg.video_id == video_id, MetricsAgg.date >= since
+    ).group_by(MetricsAgg.variant_id).all()
+    
+    daily_trials = gained_successes = gained_trials = total_successes = total_trials = 0
+    for first_day, last_day, min_s, max_s, min_n, max_n in rows:
+        total_successes += max_s or 0
+        total_trials += max_n or 0
+        span = (last_day - first_day).days
+        if span >= 1:
+            daily_trials += ((max_n or 0) - (min_n or 0)) / span
+            gained_successes += (max_s or 0) - (min_s or 0)
+            gained_trials += (max_n or 0) - (min_n or 0)
+    
+    # Recent rate when the window saw traffic, else the lifetime rate
+    if gained_trials:
+        baseline_rate = gained_successes / gained_trials
+    elif total_trials:
+        baseline_rate = total_successes / total_trials
+    else:
+        baseline_rate = None
+    return {"daily_trials": daily_trials or None, "baseline_rate": baseline_rate, "days": days}
+
+def plan_experiment(db: Session, video_id, primary_metric: str, variants: int, mde: float,
+                    alpha: float = 0.05, power: float = 0.8, relative: bool = True,
+                    baseline_rate: float = None, max_days: float = 28, traffic_days: int = 14) -> dict:
+    """
+    Sample size and expected duration of an experiment on a video
+    
+    Returns:
+        The inputs, per_variant and total trials, daily_trials, expected_days,
+        power_at_max_days and underpowered (expected_days > max_days).
+        per_variant is None when no baseline rate is known.
+    """
+    if primary_metric not in METRIC_COUNTS:
+        raise ValueError(f"primary_metric must be one of {list(METRIC_COUNTS)}")
+    traffic = estimate_daily_traffic(db, video_id, primary_metric, traffic_days)
+    baseline = baseline_rate if baseline_rate is not None else traffic["baseline_rate"]
+    plan = {
+        "primary_metric": primary_metric,
+        "baseline_rate": baseline,
+        "mde": mde,
+        "mde_type": "relative" if relative else "absolute",
+        "alpha": alpha,
+        "power": power,
+        "variants": variants,
+        "max_days": max_days,
+        "daily_trials": traffic["daily_trials"],
+        "per_variant": None,
+        "total": None,
+        "expected_days": None,
+        "power_at_max_days": None,
+        "underpowered": False
+    }
+    if baseline is None or not 0 < baseline < 1:
+        return plan
+    
+    per_variant = calculate_sample_size(baseline, mde, alpha, power, variants, relative)
+    plan.update(per_variant=per_variant, total=per_variant * variants)
+    daily = traffic["daily_trials"]
+    if daily:
+        plan["expected_days"] = round(per_variant * variants / daily, 1)
+        plan["power_at_max_days"] = round(float(
+            calculate_powers(baseline, mde, daily * max_days / variants, alpha, variants, relative)
+        ), 4)
+        plan["underpowered"] = plan["expected_days"] > max_days
+    return plan
+
+def _option_label(options: List[str], choice_index: int) -> str:
+    """Label for a coded choice; positions past the current options are kept visible"""
+    if 0 <= choice_index < len(options):
+        return options[choice_index]
+    return f"#{choice_index}"
+
+def calculate_survey_statistics(db: Session, survey_id: int) -> dict:
+    """
+    Calculate response statistics for a survey
+    
+    Returns:
+        Dictionary shaped like the frontend's SurveyStatistics type:
+        total_responses, completion_rate and per-question statistics
+    """
+    total_responses = db.query(func.count(Response.id)).filter(
+        Response.survey_id == survey_id
+    ).scalar() or 0
+    
+    questions = db.query(Question).filter(
+        Question.survey_id == survey_id
+    ).order_by(Question.order_index).all()
+    
+    # Answer counts per question
+    answer_counts = dict(
+        db.query(Answer.question_id, func.count(Answer.id))
+        .join(Question, Answer.question_id == Question.id)
+        .filter(Question.survey_id == survey_id)
+        .group_by(Answer.question_id)
+        .all()
+    )
+    
+    # Option counts for single choice questions: coded answers group on the smallint
+    # position, answers outside the options (stored as text) on answer_text
+    option_counts = {}
+    options_by_question = {q.id: q.options or [] for q in questions}
+    single_choice = db.query(Answer.question_id, Answer.choice_index, Answer.answer_text, func.count(Answer.id)).join(
+        Question, Answer.question_id == Question.id
+    ).filter(
+        Question.survey_id == survey_id,
+        Question.question_type.in_(("radio", "dropdown"))
+    ).group_by(Answer.question_id, Answer.choice_index, Answer.answer_text)
+    for question_id, choice_index, option, count in single_choice:
+        if choice_index is not None:
+            option = _option_label(options_by_question.get(question_id, []), choice_index)
+        counts = option_counts.setdefault(question_id, {})
+        counts[option] = counts.get(option, 0) + count
+    
+    # Multiple choice answers coded as a bitmask: one sum per option bit, in a single pass
+    checkbox_questions = [q for q in questions if q.question_type == "checkbox"]
+    width = min(max((len(q.options or []) for q in checkbox_questions), default=0), MAX_MASK_OPTIONS)
+    if width:
+        bit_sums = [func.sum(Answer.choice_mask.op(">>")(bit).op("&")(1)) for bit in range(width)]
+        multi_coded = db.query(Answer.question_id, *bit_sums).join(
+            Question, Answer.question_id == Question.id
+        ).filter(
+            Question.survey_id == survey_id,
+            Question.question_type == "checkbox",
+            Answer.choice_mask.isnot(None)
+        ).group_by(Answer.question_id)
+        for question_id, *sums in multi_coded:
+            options = options_by_question.get(question_id, [])
+            counts = option_counts.setdefault(question_id, {})
+            for bit, option in enumerate(options[:width]):
+                counts[option] = counts.get(option, 0) + int(sums[bit] or 0)
+    
+    # Uncoded multiple choice answers keep the selected options in answer_data["selected"]
+    selected = func.jsonb_array_elements_text(Answer.answer_data["selected"]).table_valued("value")
+    multi_choice = db.query(Answer.question_id, selected.c.value, func.count()).select_from(Answer).join(
+        Question, Answer.question_id == Question.id
+    ).join(selected, true()).filter(
+        Question.survey_id == survey_id,
+        Question.question_type == "checkbox",
+        Answer.choice_mask.is_(None)
+    ).group_by(Answer.question_id, selected.c.value)
+    for question_id, option, count in multi_choice:
+        counts = option_counts.setdefault(question_id, {})
+        counts[option] = counts.get(option, 0) + count
+    
+    # Average score for rating questions
+    rating_averages = dict(
+        db.query(Answer.question_id, func.avg(cast(Answer.answer_text, Numeric)))
+        .join(Question, Answer.question_id == Question.id)
+        .filter(Question.survey_id == survey_id, Question.question_type == "rating")
+        .group_by(Answer.question_id)
+        .all()
+    )
+    
+    question_statistics = []
+    required_rates = []
+    for question in questions:
+        response_count = answer_counts.get(question.id, 0)
+        if question.is_required and total_responses:
+            required_rates.append(response_count / total_responses)
+        
+        statistics = {}
+        if question.question_type in CHOICE_QUESTION_TYPES:
+            counts = option_counts.get(question.id, {})
+            statistics["options"] = {
+                option: counts.get(option, 0) for option in (question.options or counts.keys())
+            }
+        elif question.question_type == "rating" and rating_averages.get(question.id) is not None:
+            statistics["average"] = float(rating_averages[question.id])
+        
+        question_statistics.append({
+            "question_id": question.id,
+            "question_text": question.question_text,
+            "question_type": question.question_type,
+            "response_count": response_count,
+            "statistics": statistics
+        })
+    
+    return {
+        "survey_id": survey_id,
+        "total_responses": total_responses,
+        "completion_rate": sum(required_rates) / len(required_rates) if required_rates else 1.0,
+        "question_statistics": question_statistics
+    }
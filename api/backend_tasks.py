@@ -1,37 +1,184 @@
 # backend/app/tasks.py
-from celery import Celery
-from celery.schedules import crontab
 import os
 import logging
 import random
 from datetime import datetime, date, timedelta
-import requests
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.dialects.postgresql import insert
 
+from .celery_worker import celery_app
 from .database import engine
 from .models import Video, Variant, Experiment, MetricsRaw, MetricsAgg
+from .youtube_client import get_client, QuotaExceeded, MAX_IDS_PER_REQUEST
+from .change_detection import get_gate, snapshot_fingerprint
+from .results_stream import publish_experiment_update
+from .ingest_scheduler import get_scheduler, compute_next_interval, experiment_signals
+from .backfill import backfill_file
+from .rollups import refresh_rollups
 
-# Configure Celery
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-celery_app = Celery('crowdtest', broker=REDIS_URL, backend=REDIS_URL)
-
-# Configure Celery beat schedule
-celery_app.conf.beat_schedule = {
-    'ingest-youtube-data': {
-        'task': 'app.tasks.ingest_youtube_data',
-        'schedule': crontab(minute='*/5'),  # Every 5 minutes
-    },
-}
-
-celery_app.conf.timezone = 'UTC'
+# Celery app, queues and beat schedule live in celery_worker.py
 
 logger = logging.getLogger(__name__)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-@celery_app.task(bind=True, autoretry_for=(Exception,), retry_backoff=60, retry_kwargs={'max_retries': 3})
+# (video external_id, variant_key)
+VariantKey = Tuple[str, str]
+
+COUNTER_FIELDS = ('views', 'likes', 'comments', 'shares', 'impressions', 'clicks', 'watch_time_sec')
+
+def fetch_youtube_metrics_batch(keys: List[VariantKey]) -> Dict[VariantKey, Dict[str, int]]:
+    """
+    Fetch current counters for many variants in as few API calls as possible
+    
+    Only the counters the source reports are returned; ingestion leaves the
+    others as they are. The Data API reports views, likes and comments per video,
+    not per variant, so they are attributed only to a video's sole variant:
+    copying them to every variant would make all arms identical. Experiments
+    have at least two variants, so until a per-variant source replaces this
+    function (as the benchmark's does, see benchmarks/run.py) their keys are
+    skipped with a warning and counted as unattributed by the ingest tasks.
+    """
+    variant_keys: Dict[str, List[str]] = {}
+    for external_id, variant_key in keys:
+        variant_keys.setdefault(external_id, []).append(variant_key)
+    sole = {external_id: found[0] for external_id, found in variant_keys.items() if len(found) == 1}
+    skipped = len(keys) - len(sole)
+    if skipped:
+        logger.warning(
+            f"No per-variant metrics source: skipped {skipped} of {len(keys)} variant keys "
+            f"on {len(variant_keys) - len(sole)} videos with several variants"
+        )
+    if not sole:
+        return {}
+    statistics = get_client().get_video_statistics(sole)
+    return {(external_id, sole[external_id]): counters for external_id, counters in statistics.items()}
+
+def fetch_youtube_metrics(external_id: str, variant_key: str) -> Optional[Dict[str, int]]:
+    """Fetch current counters for a single variant"""
+    return fetch_youtube_metrics_batch([(external_id, variant_key)]).get((external_id, variant_key))
+
+def _previous_counter(variant_id, field: str, today: date):
+    """Latest stored value of a counter before `today`, for counters a snapshot does not report"""
+    column = getattr(MetricsAgg, field)
+    return func.coalesce(
+        select(column).where(
+            MetricsAgg.variant_id == variant_id, MetricsAgg.date < today
+        ).order_by(MetricsAgg.date.desc()).limit(1).scalar_subquery(),
+        0
+    )
+
+def daily_metrics_upsert(video_id, variant_id, today: date, counters: Dict[str, int]):
+    """
+    UPSERT of today's metrics_agg row that writes only the reported counters
+    
+    Counters are cumulative, so a new day starts unreported counters from the
+    previous day instead of zero, and an existing row keeps them as they are.
+    """
+    stmt = insert(MetricsAgg).values(
+        video_id=video_id,
+        variant_id=variant_id,
+        date=today,
+        **{
+            f: counters[f] if f in counters else _previous_counter(variant_id, f, today)
+            for f in COUNTER_FIELDS
+        }
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=['video_id', 'variant_id', 'date'],
+        set_={f: getattr(stmt.excluded, f) for f in counters}
+    )
+
+def _ingest_experiments(db, experiments) -> dict:
+    """Fetch and store the latest metrics for the given experiments"""
+    variants_by_video = {}
+    for variant in db.query(Variant).filter(
+        Variant.video_id.in_({experiment.video_id for experiment in experiments})
+    ).order_by(Variant.created_at, Variant.variant_key):
+        variants_by_video.setdefault(variant.video_id, []).append(variant)
+    
+    # One batched fetch for every variant instead of one call per variant
+    keys = [
+        (experiment.video.external_id, variant.variant_key)
+        for experiment in experiments
+        for variant in variants_by_video.get(experiment.video_id, [])
+    ]
+    try:
+        statistics = fetch_youtube_metrics_batch(keys)
+    except QuotaExceeded as e:
+        logger.warning(f"Skipping ingestion: {str(e)}")
+        return {"status": "quota_exceeded", "experiments": len(experiments)}
+    unattributed = sum(1 for key in keys if not statistics.get(key))
+    if keys and unattributed == len(keys):
+        logger.error(f"No metrics for any of the {len(keys)} variants of {len(experiments)} experiments")
+    
+    gate = get_gate()
+    today = date.today()
+    refreshed_videos = set()
+    for experiment in experiments:
+        try:
+            # Each variant's own counters; variants the source knows nothing about are skipped
+            metrics = {}
+            for variant in variants_by_video.get(experiment.video_id, []):
+                metrics_data = statistics.get((experiment.video.external_id, variant.variant_key)) or {}
+                counters = {f: int(metrics_data[f]) for f in COUNTER_FIELDS if metrics_data.get(f) is not None}
+                if counters:
+                    metrics[variant] = counters
+            if not metrics:
+                continue
+            
+            # Skip variants whose counters have not changed since the last write
+            changed = gate.changed({
+                str(variant.id): snapshot_fingerprint(counters, today) for variant, counters in metrics.items()
+            })
+            
+            for variant, counters in metrics.items():
+                if str(variant.id) not in changed:
+                    continue
+                
+                # Store raw metrics; counters the source does not report stay NULL
+                raw_metric = MetricsRaw(
+                    video_id=experiment.video_id,
+                    variant_id=variant.id,
+                    ts=datetime.utcnow(),
+                    source='youtube',
+                    **{f: counters.get(f) for f in COUNTER_FIELDS}
+                )
+                db.add(raw_metric)
+                
+                # Aggregate to daily metrics (UPSERT)
+                db.execute(daily_metrics_upsert(experiment.video_id, variant.id, today, counters))
+            
+            if changed:
+                db.commit()
+            # Only remember fingerprints once the rows are durable
+            gate.record(changed, [str(v.id) for v in metrics if str(v.id) not in changed])
+            if changed:
+                # Open results streams recompute only when there is new data
+                publish_experiment_update(str(experiment.id))
+                refreshed_videos.add(str(experiment.video_id))
+            
+        except Exception as e:
+            logger.error(f"Error ingesting experiment {experiment.id}: {str(e)}")
+            db.rollback()
+    
+    if refreshed_videos:
+        enqueue_rollup_refresh(sorted(refreshed_videos), today)
+    
+    return {"status": "success", "experiments": len(experiments), "unattributed": unattributed}
+
+def enqueue_rollup_refresh(video_ids: Optional[List[str]], since: date) -> None:
+    """Best-effort: a refresh that is never queued is caught up by the next one for the video"""
+    try:
+        refresh_channel_rollups.delay(video_ids, since.isoformat())
+    except Exception as e:
+        logger.warning(f"Could not queue rollup refresh from {since}: {str(e)}")
+
+# Backoff happens per HTTP request inside the YouTube client, so the task itself is not retried
+@celery_app.task(bind=True, name='backend_tasks.ingest_youtube_data')
 def ingest_youtube_data(self):
     """
     Ingest YouTube data for all running experiments
@@ -47,58 +194,96 @@ def ingest_youtube_data(self):
         
         logger.info(f"Found {len(running_experiments)} running experiments")
         
-        for experiment in running_experiments:
+        result = _ingest_experiments(db, running_experiments)
+        logger.info("YouTube data ingestion completed")
+        return result
+    finally:
+        db.close()
+
+@celery_app.task(name='backend_tasks.dispatch_due_ingests')
+def dispatch_due_ingests():
+    """
+    Dispatch ingestion only for experiments whose next poll time has passed
+    """
+    db = SessionLocal()
+    try:
+        running_ids = [
+            str(row.id) for row in db.query(Experiment.id).filter(Experiment.status == "running")
+        ]
+        running_variant_ids = [
+            str(row.id) for row in db.query(Variant.id).join(
+                Experiment, Experiment.video_id == Variant.video_id
+            ).filter(Experiment.status == "running")
+        ]
+    finally:
+        db.close()
+    
+    scheduler = get_scheduler()
+    scheduler.sync(running_ids)
+    # Stopped experiments and deleted variants leave the change-detection state
+    pruned = get_gate().retain(running_variant_ids)
+    if pruned:
+        logger.info(f"Dropped change-detection state of {pruned} variants no longer ingested")
+    due = scheduler.claim_due()
+    
+    # Keep the YouTube client's multi-ID batching by dispatching due experiments in chunks
+    for start in range(0, len(due), MAX_IDS_PER_REQUEST):
+        ingest_experiments.delay(due[start:start + MAX_IDS_PER_REQUEST])
+    
+    logger.info(f"Dispatched ingestion for {len(due)} of {len(running_ids)} running experiments")
+    return {"status": "success", "dispatched": len(due), "running": len(running_ids)}
+
+@celery_app.task(name='backend_tasks.ingest_experiments')
+def ingest_experiments(experiment_ids: List[str]):
+    """
+    Ingest the given experiments and schedule each one's next poll
+    """
+    db = SessionLocal()
+    try:
+        experiments = db.query(Experiment).filter(
+            Experiment.id.in_(experiment_ids),
+            Experiment.status == "running"
+        ).all()
+        
+        result = _ingest_experiments(db, experiments)
+        if result["status"] != "success":
+            # Claimed experiments come due again when their lease expires
+            return result
+        
+        scheduler = get_scheduler()
+        for experiment in experiments:
+            interval = compute_next_interval(**experiment_signals(db, experiment))
+            scheduler.reschedule(experiment.id, interval)
+            logger.debug(f"Next poll of experiment {experiment.id} in {interval:.0f}s")
+        return result
+    finally:
+        db.close()
+
+@celery_app.task(name='backend_tasks.backfill_metrics')
+def backfill_metrics(path: str, fmt: Optional[str] = None, source: str = "backfill",
+                     delete_after: bool = False):
+    """
+    Bulk-load historical metrics from a CSV/NDJSON file (see backfill.py)
+    """
+    try:
+        report = backfill_file(path, fmt, source)
+        if report["agg_upserted"] and report["first_date"]:
+            enqueue_rollup_refresh(report["video_ids"], date.fromisoformat(report["first_date"]))
+        return report
+    finally:
+        if delete_after:
             try:
-                # Get variants for this experiment
-                variants = db.query(Variant).filter(
-                    Variant.video_id == experiment.video_id
-                ).all()
-                
-                for variant in variants:
-                    # Fetch metrics for this variant
-                    metrics_data = fetch_youtube_metrics(
-                        experiment.video.external_id, 
-                        variant.variant_key
-                    )
-                    
-                    if metrics_data:
-                        # Store raw metrics
-                        raw_metric = MetricsRaw(
-                            video_id=experiment.video_id,
-                            variant_id=variant.id,
-                            ts=datetime.utcnow(),
-                            views=metrics_data.get('views', 0),
-                            likes=metrics_data.get('likes', 0),
-                            comments=metrics_data.get('comments', 0),
-                            shares=metrics_data.get('shares', 0),
-                            impressions=metrics_data.get('impressions', 0),
-                            clicks=metrics_data.get('clicks', 0),
-                            watch_time_sec=metrics_data.get('watch_time_sec', 0),
-                            source='youtube'
-                        )
-                        db.add(raw_metric)
-                        
-                        # Aggregate to daily metrics (UPSERT)
-                        today = date.today()
-                        stmt = insert(MetricsAgg).values(
-                            video_id=experiment.video_id,
-                            variant_id=variant.id,
-                            date=today,
-                            views=metrics_data.get('views', 0),
-                            likes=metrics_data.get('likes', 0),
-                            comments=metrics_data.get('comments', 0),
-                            shares=metrics_data.get('shares', 0),
-                            impressions=metrics_data.get('impressions', 0),
-                            clicks=metrics_data.get('clicks', 0),
-                            watch_time_sec=metrics_data.get('watch_time_sec', 0)
-                        )
-                        
-                        # On conflict, update the values
-                        stmt = stmt.on_conflict_do_update(
-                            index_elements=['video_id', 'variant_id', 'date'],
-                            set_=dict(
-                                views=stmt.excluded.views,
-                                likes=stmt.excluded.likes,
-                                comments=stmt.excluded.comments,
-                                shares=stmt.excluded.shares,
-                                impressions=stmt.excluded.impressions
\ No newline at end of file
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove backfill file {path}: {str(e)}")
+
+@celery_app.task(name='backend_tasks.refresh_channel_rollups')
+def refresh_channel_rollups(video_ids: Optional[List[str]] = None, since: Optional[str] = None):
+    """
+    Update the channel rollups for videos whose metrics changed (all videos when None)
+    """
+    db = SessionLocal()
+    try:
+        return refresh_rollups(db, video_ids, date.fromisoformat(since) if since else None)
+    finally:
+        db.close()
@@ -0,0 +1,416 @@
+"""
+Bulk backfill of historical per-variant metrics
+
+Files are streamed into a temporary staging table with COPY (as text, so a bad
+value never aborts the load), validated in line-number chunks, and merged with
+two set-based statements:
+
+    metrics_raw   every valid snapshot not already stored for (variant_id, ts)
+    metrics_agg   the last snapshot of each UTC day, upserted on _video_variant_date_uc
+
+Counters are cumulative, so the daily upsert keeps the larger of the stored and
+incoming values and never moves live data backwards.
+
+Input columns (CSV header or NDJSON keys): `ts` plus either `variant_id` or
+`external_id` + `variant_key`, and any of the counter columns. Validation uses
+pg_input_is_valid (PostgreSQL 16+).
+
+    python -m api.backfill history.csv.gz
+    python -m api.backfill - --format ndjson < history.ndjson
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+from typing import Dict, IO, Iterator, List, Optional
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = ("views", "likes", "comments", "shares", "impressions", "clicks", "watch_time_sec")
+KEY_COLUMNS = ("variant_id", "external_id", "variant_key")
+INPUT_COLUMNS = KEY_COLUMNS + ("ts",) + COUNTER_COLUMNS
+FORMATS = ("csv", "ndjson")
+
+# Rows validated per statement; bounds the size of each validation pass
+CHUNK_ROWS = int(os.getenv("BACKFILL_CHUNK_ROWS", "200000"))
+# Rejected lines kept in the report for inspection
+REJECT_SAMPLE = 20
+
+
+class BackfillError(ValueError):
+    """The file cannot be loaded at all (unknown format, missing columns...)"""
+
+
+def _copy_error(error: psycopg2.Error, fmt: str) -> BackfillError:
+    """BackfillError for a COPY the server refused, pointing at the offending line"""
+    text = str(error).strip()
+    message = error.diag.message_primary or text.splitlines()[0]
+    match = re.search(r"COPY \w+, line (\d+)", error.diag.context or text)
+    if not match:
+        return BackfillError(f"Malformed {fmt.upper()} file: {message}")
+    line = int(match.group(1))
+    if fmt == "csv":
+        # COPY starts after the header, which was read separately
+        return BackfillError(f"Malformed CSV at line {line + 1}: {message}")
+    return BackfillError(f"Malformed NDJSON at record {line}: {message}")
+
+
+def detect_format(filename: str) -> str:
+    name = filename.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    raise BackfillError(f"Cannot tell the format of {filename}; pass csv or ndjson explicitly")
+
+
+def open_text(binary: IO[bytes], filename: str = "") -> IO[str]:
+    """Text view of an uploaded or on-disk file, transparently gunzipped"""
+    if filename.lower().endswith(".gz"):
+        binary = gzip.GzipFile(fileobj=binary)
+    return io.TextIOWrapper(binary, encoding="utf-8", newline="")
+
+
+def _copy_escape(value) -> str:
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class NdjsonCopyReader:
+    """
+    File-like object turning NDJSON lines into COPY text rows
+
+    Only one read() worth of rows is held in memory. Lines that are not JSON
+    objects are staged with their parse error so they show up as rejects.
+    """
+
+    columns = INPUT_COLUMNS + ("parse_error",)
+
+    def __init__(self, lines: IO[str]):
+        self._lines = lines
+        self._buffer = ""
+
+    def _rows(self, size: int) -> Iterator[str]:
+        produced = 0
+        for line in self._lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("not a JSON object")
+                values = [record.get(c) for c in INPUT_COLUMNS] + [None]
+            except ValueError as e:
+                values = [None] * len(INPUT_COLUMNS) + [f"invalid JSON: {e}"]
+            row = "\t".join(_copy_escape(v) for v in values) + "\n"
+            produced += len(row)
+            yield row
+            if produced >= size:
+                return
+
+    def read(self, size: int = 1 << 16) -> str:
+        if size is None or size < 0:
+            size = 1 << 16
+        if len(self._buffer) < size:
+            self._buffer += "".join(self._rows(size - len(self._buffer)))
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+STAGING_DDL = f"""
+-- Timestamps without an offset are UTC
+SET LOCAL TIME ZONE 'UTC';
+CREATE TEMP TABLE backfill_staging (
+    line_no bigserial,
+    {", ".join(f"{c} text" for c in INPUT_COLUMNS)},
+    parse_error text
+) ON COMMIT DROP;
+CREATE TEMP TABLE backfill_typed (
+    line_no bigint NOT NULL,
+    video_id uuid NOT NULL,
+    variant_id uuid NOT NULL,
+    ts timestamptz NOT NULL,
+    {", ".join(f"{c} integer NOT NULL" for c in COUNTER_COLUMNS)}
+) ON COMMIT DROP;
+CREATE TEMP TABLE backfill_rejects (
+    line_no bigint NOT NULL,
+    reason text NOT NULL
+) ON COMMIT DROP;
+"""
+
+# Distinct keys are resolved once, then hash-joined against every chunk
+RESOLVE_VARIANTS_SQL = """
+CREATE TEMP TABLE backfill_variants ON COMMIT DROP AS
+SELECT k.variant_id, k.external_id, k.variant_key, v.id AS resolved_id, v.video_id AS resolved_video_id
+FROM (
+    SELECT DISTINCT coalesce(variant_id, '') AS variant_id, coalesce(external_id, '') AS external_id,
+           coalesce(variant_key, '') AS variant_key
+    FROM backfill_staging
+) k
+LEFT JOIN LATERAL (
+    SELECT v.id, v.video_id FROM variants v
+    WHERE v.id = CASE WHEN pg_input_is_valid(k.variant_id, 'uuid') THEN k.variant_id::uuid END
+    UNION ALL
+    SELECT v.id, v.video_id FROM variants v JOIN videos vid ON vid.id = v.video_id
+    WHERE k.variant_id = '' AND vid.external_id = k.external_id AND v.variant_key = k.variant_key
+    LIMIT 1
+) v ON true;
+ANALYZE backfill_variants;
+"""
+
+# CASE, not OR: the cast must only run on values already known to parse
+_BAD_COUNTER = " OR ".join(
+    f"(CASE WHEN s.{c} IS NULL THEN false "
+    f"WHEN pg_input_is_valid(s.{c}, 'integer') THEN s.{c}::integer < 0 ELSE true END)"
+    for c in COUNTER_COLUMNS
+)
+
+VALIDATE_CHUNK_SQL = f"""
+WITH checked AS (
+    SELECT s.*, k.resolved_id, k.resolved_video_id,
+        CASE
+            WHEN s.parse_error IS NOT NULL THEN s.parse_error
+            WHEN s.ts IS NULL OR NOT pg_input_is_valid(s.ts, 'timestamptz') THEN 'invalid ts'
+            WHEN {_BAD_COUNTER} THEN 'invalid counter'
+            WHEN k.resolved_id IS NULL THEN 'unknown variant'
+        END AS reason
+    FROM backfill_staging s
+    LEFT JOIN backfill_variants k
+        ON k.variant_id = coalesce(s.variant_id, '')
+       AND k.external_id = coalesce(s.external_id, '')
+       AND k.variant_key = coalesce(s.variant_key, '')
+    WHERE s.line_no > %(lo)s AND s.line_no <= %(hi)s
+),
+rejected AS (
+    INSERT INTO backfill_rejects (line_no, reason)
+    SELECT line_no, reason FROM checked WHERE reason IS NOT NULL
+)
+INSERT INTO backfill_typed (line_no, video_id, variant_id, ts, {", ".join(COUNTER_COLUMNS)})
+SELECT line_no, resolved_video_id, resolved_id,
+       CASE WHEN reason IS NULL THEN ts::timestamptz END,
+       {", ".join(f"CASE WHEN reason IS NULL THEN coalesce({c}::integer, 0) END" for c in COUNTER_COLUMNS)}
+FROM checked
+WHERE reason IS NULL
+"""
+
+# Last occurrence of a (variant, ts) in the file wins; stored snapshots are left alone
+MERGE_RAW_SQL = f"""
+INSERT INTO metrics_raw (video_id, variant_id, ts, {", ".join(COUNTER_COLUMNS)}, source)
+SELECT t.video_id, t.variant_id, t.ts, {", ".join(f"t.{c}" for c in COUNTER_COLUMNS)}, %(source)s
+FROM (
+    SELECT DISTINCT ON (variant_id, ts) *
+    FROM backfill_typed
+    ORDER BY variant_id, ts, line_no DESC
+) t
+WHERE NOT EXISTS (
+    SELECT 1 FROM metrics_raw m WHERE m.variant_id = t.variant_id AND m.ts = t.ts
+)
+"""
+
+MERGE_AGG_SQL = f"""
+INSERT INTO metrics_agg (video_id, variant_id, date, {", ".join(COUNTER_COLUMNS)})
+SELECT DISTINCT ON (variant_id, (ts AT TIME ZONE 'UTC')::date)
+       video_id, variant_id, (ts AT TIME ZONE 'UTC')::date, {", ".join(COUNTER_COLUMNS)}
+FROM backfill_typed
+ORDER BY variant_id, (ts AT TIME ZONE 'UTC')::date, ts DESC, line_no DESC
+ON CONFLICT ON CONSTRAINT _video_variant_date_uc DO UPDATE SET
+    {", ".join(f"{c} = GREATEST(metrics_agg.{c}, EXCLUDED.{c})" for c in COUNTER_COLUMNS)}
+"""
+
+
+def _csv_columns(stream: IO[str]) -> List[str]:
+    header = stream.readline()
+    if not header:
+        raise BackfillError("Empty file")
+    columns = [c.strip().lower() for c in next(csv.reader([header]))]
+    unknown = set(columns) - set(INPUT_COLUMNS)
+    if unknown:
+        raise BackfillError(f"Unknown columns: {', '.join(sorted(unknown))}")
+    if len(set(columns)) != len(columns):
+        raise BackfillError("Duplicate columns in header")
+    return columns
+
+
+def _check_key_columns(columns: List[str]) -> None:
+    if "ts" not in columns:
+        raise BackfillError("Missing required column: ts")
+    if "variant_id" not in columns and not {"external_id", "variant_key"} <= set(columns):
+        raise BackfillError("Rows need variant_id, or external_id and variant_key")
+
+
+def backfill(stream: IO[str], fmt: str, conn, source: str = "backfill",
+             chunk_rows: int = CHUNK_ROWS, dry_run: bool = False) -> Dict[str, object]:
+    """
+    Load one file through staging into metrics_raw / metrics_agg
+
+    Args:
+        stream: Text stream positioned at the start of the file
+        fmt: "csv" (with header) or "ndjson"
+        conn: psycopg2 connection; the whole load is one transaction
+        source: metrics_raw.source for the inserted snapshots
+        chunk_rows: Staged rows validated per statement
+        dry_run: Validate and report, then roll back
+
+    Returns:
+        Row counts, rejects by reason with a sample of line numbers, the earliest
+        merged date and the videos merged into, phase timings and rows/sec
+    """
+    if fmt not in FORMATS:
+        raise BackfillError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+    timings = {}
+    started = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(STAGING_DDL)
+
+            # Stage; only the row structure can fail here, values are checked below
+            try:
+                if fmt == "csv":
+                    columns = _csv_columns(stream)
+                    _check_key_columns(columns)
+                    cur.copy_expert(
+                        f"COPY backfill_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                        stream, size=1 << 20,
+                    )
+                else:
+                    reader = NdjsonCopyReader(stream)
+                    cur.copy_expert(
+                        f"COPY backfill_staging ({', '.join(reader.columns)}) FROM STDIN",
+                        reader, size=1 << 20,
+                    )
+            except psycopg2.DataError as e:
+                # BadCopyFileFormat (wrong column count, unterminated quote), NUL bytes...
+                raise _copy_error(e, fmt)
+            except UnicodeDecodeError as e:
+                raise BackfillError(f"File is not valid UTF-8: {str(e)}")
+            cur.execute("SELECT count(*), coalesce(max(line_no), 0) FROM backfill_staging")
+            staged, last_line = cur.fetchone()
+            timings["copy_sec"] = time.perf_counter() - started
+
+            # Validate
+            phase = time.perf_counter()
+            cur.execute("ANALYZE backfill_staging")
+            cur.execute(RESOLVE_VARIANTS_SQL)
+            for lo in range(0, last_line, chunk_rows):
+                cur.execute(VALIDATE_CHUNK_SQL, {"lo": lo, "hi": lo + chunk_rows})
+                logger.info(f"Backfill validated lines {lo + 1}-{min(lo + chunk_rows, last_line)}")
+            cur.execute("SELECT reason, count(*) FROM backfill_rejects GROUP BY reason ORDER BY 2 DESC")
+            rejects_by_reason = dict(cur.fetchall())
+            cur.execute(
+                "SELECT line_no, reason FROM backfill_rejects ORDER BY line_no LIMIT %s", (REJECT_SAMPLE,)
+            )
+            reject_sample = [{"line": line, "reason": reason} for line, reason in cur.fetchall()]
+            valid = staged - sum(rejects_by_reason.values())
+            timings["validate_sec"] = time.perf_counter() - phase
+
+            # Merge
+            phase = time.perf_counter()
+            raw_inserted = agg_upserted = 0
+            first_date, video_ids = None, []
+            if valid and not dry_run:
+                cur.execute("ANALYZE backfill_typed")
+                cur.execute(MERGE_RAW_SQL, {"source": source})
+                raw_inserted = cur.rowcount
+                cur.execute(MERGE_AGG_SQL)
+                agg_upserted = cur.rowcount
+                # Rollups of these videos are stale from here on (see rollups.py)
+                cur.execute(
+                    "SELECT min((ts AT TIME ZONE 'UTC')::date), array_agg(DISTINCT video_id::text) "
+                    "FROM backfill_typed"
+                )
+                first_date, video_ids = cur.fetchone()
+            timings["merge_sec"] = time.perf_counter() - phase
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    total = time.perf_counter() - started
+    report = {
+        "format": fmt,
+        "dry_run": dry_run,
+        "rows_staged": staged,
+        "rows_valid": valid,
+        "rows_rejected": staged - valid,
+        "rejects_by_reason": rejects_by_reason,
+        "reject_sample": reject_sample,
+        "raw_inserted": raw_inserted,
+        "agg_upserted": agg_upserted,
+        "first_date": first_date.isoformat() if first_date else None,
+        "video_ids": sorted(video_ids or []),
+        **{k: round(v, 3) for k, v in timings.items()},
+        "total_sec": round(total, 3),
+        "rows_per_sec": round(staged / total, 1) if total else 0.0,
+    }
+    logger.info(
+        f"Backfill: {staged} rows staged, {valid} valid, {raw_inserted} raw inserted, "
+        f"{agg_upserted} daily rows upserted in {total:.1f}s ({report['rows_per_sec']:.0f} rows/s)"
+    )
+    return report
+
+
+def backfill_file(path: str, fmt: Optional[str] = None, source: str = "backfill",
+                  chunk_rows: int = CHUNK_ROWS, dry_run: bool = False) -> Dict[str, object]:
+    """Backfill from a file on disk (optionally .gz) using the app's database"""
+    from .database import engine
+
+    fmt = fmt or detect_format(path)
+    conn = engine.raw_connection()
+    try:
+        with open(path, "rb") as f:
+            return backfill(open_text(f, path), fmt, conn, source, chunk_rows, dry_run)
+    finally:
+        conn.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill historical metrics from CSV or NDJSON")
+    parser.add_argument("path", help="Input file (.csv, .ndjson, .jsonl, optionally .gz) or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Required when reading stdin")
+    parser.add_argument("--source", default="backfill", help="metrics_raw.source for inserted rows")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--dry-run", action="store_true", help="Validate and report without writing")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        if args.path == "-":
+            if not args.format:
+                parser.error("--format is required when reading stdin")
+            from .database import engine
+
+            conn = engine.raw_connection()
+            try:
+                report = backfill(open_text(sys.stdin.buffer), args.format, conn,
+                                  args.source, args.chunk_rows, args.dry_run)
+            finally:
+                conn.close()
+        else:
+            report = backfill_file(args.path, args.format, args.source, args.chunk_rows, args.dry_run)
+    except BackfillError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    print(json.dumps(report, indent=2))
+    return 0 if report["rows_valid"] or not report["rows_staged"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""
+Benchmark and load-test tooling for the API and Celery workers.
+
+Run with ``python -m api.benchmarks.run --help`` from the repository root.
+"""
@@ -0,0 +1,250 @@
+"""
+Fake YouTube metrics source and local HTTP stand-ins for the YouTube Data API
+and the thumbnail image origin
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeMetricsSource:
+    """
+    Deterministic cumulative counters per (video, variant)
+
+    Counters grow monotonically between calls like real cumulative statistics;
+    with `change_rate` < 1 some calls return the previous counters unchanged.
+    `latency_ms` simulates the round trip of the real API.
+    """
+
+    def __init__(self, seed: int = 42, latency_ms: float = 0.0, change_rate: float = 1.0):
+        self.rng = random.Random(seed)
+        self.latency_ms = latency_ms
+        self.change_rate = change_rate
+        self.calls = 0
+        self._totals: Dict[tuple, Dict[str, int]] = {}
+
+    def __call__(self, external_id: str, variant_key: str) -> Dict[str, int]:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        totals = self._totals.setdefault((external_id, variant_key), {
+            "views": 0, "likes": 0, "comments": 0, "shares": 0,
+            "impressions": 0, "clicks": 0, "watch_time_sec": 0,
+        })
+        if self.rng.random() >= self.change_rate:
+            return dict(totals)
+        impressions = self.rng.randint(0, 500)
+        clicks = int(impressions * self.rng.uniform(0.02, 0.08))
+        totals["impressions"] += impressions
+        totals["clicks"] += clicks
+        totals["views"] += clicks
+        totals["likes"] += int(clicks * 0.03)
+        totals["watch_time_sec"] += clicks * 120
+        return dict(totals)
+
+    def batch(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, int]]:
+        """Drop-in for backend_tasks.fetch_youtube_metrics_batch"""
+        return {key: self(*key) for key in keys}
+
+
+class FakeYouTubeServer:
+    """
+    Local HTTP stand-in for GET /videos?part=statistics&id=a,b,c
+
+    Honours If-None-Match with 304s, and can inject 503s (`error_rate`, or
+    `fail_next` for the next N requests), answer 403 quotaExceeded after
+    `quota_requests` successful requests, leave videos unchanged between
+    polls (`change_rate`) and omit statistics keys (`hidden`, like a creator
+    hiding likes) to exercise the client.
+    """
+
+    def __init__(self, source: FakeMetricsSource = None, change_rate: float = 1.0,
+                 error_rate: float = 0.0, seed: int = 42, quota_requests: Optional[int] = None,
+                 hidden: Iterable[str] = ()):
+        self.source = source or FakeMetricsSource(seed=seed)
+        self.change_rate = change_rate
+        self.error_rate = error_rate
+        self.fail_next = 0
+        self.quota_requests = quota_requests
+        self.hidden = set(hidden)
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "not_modified": 0, "errors": 0}
+        self._videos: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _statistics(self, video_id: str) -> Dict[str, str]:
+        if video_id not in self._videos or self.rng.random() < self.change_rate:
+            self._videos[video_id] = self.source(video_id, "video")
+        totals = self._videos[video_id]
+        statistics = {
+            "viewCount": str(totals["views"]),
+            "likeCount": str(totals["likes"]),
+            "commentCount": str(totals["comments"]),
+        }
+        return {key: value for key, value in statistics.items() if key not in self.hidden}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if not parsed.path.rstrip("/").endswith("/videos"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                query = parse_qs(parsed.query)
+                with fake._lock:
+                    fake.stats["requests"] += 1
+                    if fake.fail_next > 0 or fake.rng.random() < fake.error_rate:
+                        fake.fail_next = max(0, fake.fail_next - 1)
+                        fake.stats["errors"] += 1
+                        self.send_response(503)
+                        self.send_header("Retry-After", "0")
+                        self.end_headers()
+                        return
+                    if fake.quota_requests is not None:
+                        if fake.quota_requests <= 0:
+                            body = json.dumps({"error": {"errors": [{"reason": "quotaExceeded"}]}}).encode()
+                            self.send_response(403)
+                            self.send_header("Content-Type", "application/json")
+                            self.send_header("Content-Length", str(len(body)))
+                            self.end_headers()
+                            self.wfile.write(body)
+                            return
+                        fake.quota_requests -= 1
+                    ids = [i for i in query.get("id", [""])[0].split(",") if i]
+                    body = json.dumps({
+                        "kind": "youtube#videoListResponse",
+                        "items": [{"id": i, "statistics": fake._statistics(i)} for i in ids],
+                    }).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    with fake._lock:
+                        fake.stats["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "FakeYouTubeServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeThumbnailOrigin:
+    """
+    Local HTTP stand-in for an image host: GET /vi/<video>/<name>.jpg
+
+    Each path gets a deterministic JPEG-signed payload of `image_bytes`; only
+    `distinct_images` different payloads exist, so several URLs return the same
+    bytes (like YouTube's placeholder for videos without a custom thumbnail).
+    With `redirect_to` set, every image request is answered with a 302 there.
+    """
+
+    def __init__(self, distinct_images: int = 100, image_bytes: int = 16 * 1024,
+                 latency_ms: float = 0.0, redirect_to: Optional[str] = None):
+        self.distinct_images = distinct_images
+        self.image_bytes = image_bytes
+        self.latency_ms = latency_ms
+        self.redirect_to = redirect_to
+        self.stats = {"requests": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def image(self, path: str) -> bytes:
+        index = int(hashlib.sha1(path.encode()).hexdigest(), 16) % self.distinct_images
+        seed = hashlib.sha256(str(index).encode()).digest()
+        body = (seed * (self.image_bytes // len(seed) + 1))[:self.image_bytes - 5]
+        return b"\xff\xd8\xff\xe0" + body + b"\xd9"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if not path.startswith("/vi/") or not path.endswith(".jpg"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if fake.latency_ms:
+                    time.sleep(fake.latency_ms / 1000)
+                if fake.redirect_to:
+                    with fake._lock:
+                        fake.stats["requests"] += 1
+                    self.send_response(302)
+                    self.send_header("Location", fake.redirect_to)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = fake.image(path)
+                with fake._lock:
+                    fake.stats["requests"] += 1
+                    fake.stats["bytes"] += len(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "FakeThumbnailOrigin":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,121 @@
+"""
+Seed a benchmark database with videos, variants, experiments, metrics and surveys
+"""
+import random
+import uuid
+from datetime import datetime, date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert, text
+
+from ..backend_models import Video, Variant, Experiment, MetricsRaw, MetricsAgg
+
+BENCH_TABLES = [
+    "answers", "responses", "questions", "surveys", "users",
+    "metrics_agg", "metrics_raw", "experiments", "variants", "videos",
+]
+
+
+def reset_database(engine) -> None:
+    """Truncate every table the benchmark seeds (bench database only!)"""
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(BENCH_TABLES)} RESTART IDENTITY CASCADE"))
+
+
+def seed_database(engine, videos: int = 50, variants_per_video: int = 3, days: int = 30,
+                  snapshots_per_day: int = 4, surveys: int = 100, seed: int = 42) -> Dict[str, List]:
+    """
+    Insert a deterministic data set and return the ids the load driver needs
+
+    Metrics are cumulative counters, like the ones ingest_youtube_data stores:
+    each day's metrics_agg row is the last snapshot of that day.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    start_day = today - timedelta(days=days - 1)
+
+    video_rows, variant_rows, experiment_rows = [], [], []
+    raw_rows, agg_rows = [], []
+
+    for v in range(videos):
+        video_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        video_rows.append({
+            "id": video_id,
+            "platform": "youtube",
+            "external_id": f"bench{v:06d}",
+            "title": f"Benchmark video {v}",
+            "channel_id": f"channel{v % 10:02d}",
+        })
+        experiment_rows.append({
+            "id": uuid.UUID(int=rng.getrandbits(128), version=4),
+            "name": f"Benchmark experiment {v}",
+            "video_id": video_id,
+            "primary_metric": "ctr",
+            "secondary_metrics": ["like_rate"],
+            "start_at": datetime.combine(start_day, datetime.min.time()),
+            "stop_rules": {"min_samples": 10000, "pvalue": 0.05},
+            "status": "running",
+        })
+
+        for k in range(variants_per_video):
+            variant_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            variant_rows.append({
+                "id": variant_id,
+                "video_id": video_id,
+                "variant_key": chr(65 + k),
+                "title": f"Variant {chr(65 + k)}",
+                "thumbnail_url": f"https://img.example.com/{v}/{k}.jpg",
+            })
+
+            ctr = rng.uniform(0.02, 0.08)
+            like_rate = rng.uniform(0.01, 0.05)
+            totals = dict.fromkeys(
+                ("views", "likes", "comments", "shares", "impressions", "clicks", "watch_time_sec"), 0
+            )
+            for d in range(days):
+                day = start_day + timedelta(days=d)
+                for s in range(snapshots_per_day):
+                    impressions = rng.randint(200, 2000)
+                    clicks = int(impressions * ctr)
+                    totals["impressions"] += impressions
+                    totals["clicks"] += clicks
+                    totals["views"] += clicks
+                    totals["likes"] += int(clicks * like_rate)
+                    totals["comments"] += rng.randint(0, 3)
+                    totals["shares"] += rng.randint(0, 2)
+                    totals["watch_time_sec"] += clicks * rng.randint(30, 300)
+                    raw_rows.append({
+                        "video_id": video_id,
+                        "variant_id": variant_id,
+                        "ts": datetime.combine(day, datetime.min.time())
+                        + timedelta(hours=24 * s / snapshots_per_day),
+                        "source": "bench",
+                        **totals,
+                    })
+                agg_rows.append({"video_id": video_id, "variant_id": variant_id, "date": day, **totals})
+
+    with engine.begin() as conn:
+        conn.execute(insert(Video.__table__), video_rows)
+        conn.execute(insert(Variant.__table__), variant_rows)
+        conn.execute(insert(Experiment.__table__), experiment_rows)
+        conn.execute(insert(MetricsRaw.__table__), raw_rows)
+        conn.execute(insert(MetricsAgg.__table__), agg_rows)
+
+        # Surveys reference a creator in the 001_init schema
+        conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password) "
+            "VALUES ('bench', 'bench@example.com', 'x') ON CONFLICT DO NOTHING"
+        ))
+        creator_id = conn.execute(text("SELECT id FROM users WHERE username = 'bench'")).scalar_one()
+        conn.execute(
+            text("INSERT INTO surveys (title, description, creator_id) VALUES (:title, :description, :creator_id)"),
+            [
+                {"title": f"Benchmark survey {i}", "description": "seeded", "creator_id": creator_id}
+                for i in range(surveys)
+            ],
+        )
+
+    return {
+        "experiment_ids": [str(row["id"]) for row in experiment_rows],
+        "external_ids": [row["external_id"] for row in video_rows],
+    }
@@ -0,0 +1,180 @@
+"""
+Cold-start benchmark: import time of the API and the Celery workers, and
+latency of the first request after startup
+
+Every measurement runs in a fresh interpreter so nothing is already cached
+in sys.modules. Usage (from the repository root):
+
+    python -m api.benchmarks.startup --runs 5 --path /health
+
+Results are written as JSON so runs can be compared across commits with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+from .run import DEFAULT_DATABASE_URL, git_commit
+
+# Modules each process type imports before it can serve work
+TARGETS = {
+    "api": ["api.backend_main"],
+    "worker": ["api.celery_worker", "api.celery_tasks", "api.backend_tasks"],
+}
+
+# Runs inside the child: start the app's lifespan and time the first two requests
+FIRST_REQUEST_SNIPPET = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from api.backend_main import app
+imported = time.perf_counter()
+import httpx
+
+async def main():
+    timings = {"import_ms": (imported - started) * 1000}
+    async with app.router.lifespan_context(app):
+        timings["lifespan_ms"] = (time.perf_counter() - imported) * 1000
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for key in ("first_request_ms", "second_request_ms"):
+                t = time.perf_counter()
+                response = await client.get(sys.argv[1])
+                timings[key] = (time.perf_counter() - t) * 1000
+                timings["status"] = response.status_code
+    timings["ready_ms"] = timings["import_ms"] + timings["lifespan_ms"] + timings["first_request_ms"]
+    print(json.dumps(timings))
+
+asyncio.run(main())
+"""
+
+
+def _child_env(database_url: str) -> Dict[str, str]:
+    env = dict(os.environ, DATABASE_URL=database_url)
+    # Bytecode is assumed to be compiled, as it is in a built image
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """Cumulative microseconds per module from `python -X importtime` output"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        cumulative[name] = int(cum)
+    return cumulative
+
+
+def measure_imports(modules: List[str], runs: int, env: Dict[str, str]) -> Dict[str, object]:
+    """Wall time of importing `modules` plus the heaviest top-level packages"""
+    totals = []
+    heaviest: Dict[str, List[int]] = {}
+    code = "; ".join(f"import {m}" for m in modules)
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, env=env,
+        )
+        if proc.returncode != 0:
+            raise SystemExit(f"Importing {modules} failed:\n{proc.stderr[-2000:]}")
+        cumulative = parse_importtime(proc.stderr)
+        totals.append(sum(cumulative.get(m, 0) for m in modules) / 1000)
+        for name, micros in cumulative.items():
+            if "." not in name:
+                heaviest.setdefault(name, []).append(micros)
+
+    top = sorted(heaviest.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:10]
+    return {
+        "import_ms_median": round(statistics.median(totals), 1),
+        "import_ms_min": round(min(totals), 1),
+        "top_packages_ms": {name: round(statistics.median(v) / 1000, 1) for name, v in top},
+    }
+
+
+def measure_first_request(path: str, runs: int, env: Dict[str, str]) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-c", FIRST_REQUEST_SNIPPET, path],
+            capture_output=True, text=True, env=env,
+        )
+        if proc.returncode != 0:
+            raise SystemExit(f"First-request run failed:\n{proc.stderr[-2000:]}")
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    result = {
+        key: round(statistics.median(s[key] for s in samples), 1)
+        for key in ("import_ms", "lifespan_ms", "first_request_ms", "second_request_ms", "ready_ms")
+    }
+    result["status"] = samples[-1]["status"]
+    return result
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    """Print median deltas against an earlier result file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('commit')})")
+    for section, key in (("api", "import_ms_median"), ("worker", "import_ms_median"),
+                         ("first_request", "ready_ms"), ("first_request", "first_request_ms")):
+        old = baseline.get(section, {}).get(key)
+        new = current.get(section, {}).get(key)
+        if old and new is not None:
+            print(f"  {section + '.' + key:36s} {old:>8.1f} -> {new:>8.1f} ms ({100 * (new - old) / old:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API and worker cold starts")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", DEFAULT_DATABASE_URL))
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--path", default="/health", help="Endpoint used for the first request")
+    parser.add_argument("--output", help="Result file (default: bench_results/startup-<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to diff against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    env = _child_env(args.database_url)
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k != "database_url"},
+        },
+    }
+    for name, modules in TARGETS.items():
+        result[name] = measure_imports(modules, args.runs, env)
+        print(f"{name:8s} import {result[name]['import_ms_median']:>8.1f} ms (median of {args.runs})  "
+              f"heaviest: {', '.join(list(result[name]['top_packages_ms'])[:5])}")
+    result["first_request"] = measure_first_request(args.path, args.runs, env)
+    fr = result["first_request"]
+    print(f"api      ready {fr['ready_ms']:>9.1f} ms  (import {fr['import_ms']:.1f}, lifespan {fr['lifespan_ms']:.1f}, "
+          f"first {args.path} {fr['first_request_ms']:.1f}, second {fr['second_request_ms']:.1f}, "
+          f"status {fr['status']})")
+
+    output = args.output or os.path.join(
+        "bench_results",
+        f"startup-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{result['meta']['commit'] or 'nogit'}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,95 @@
 """
 Celery Worker Configuration
+
+Single Celery app for every task in the project. Tasks are routed into
+dedicated queues so latency-critical ingestion never waits behind batch work:
+
+    ingest       YouTube ingestion (short, time-sensitive)
+    stats        Survey statistics and channel rollup refreshes
+    export       Reports, data exports and bulk backfills (long-running)
+    maintenance  Cleanup and notifications
+
+Run one worker per queue with its profile, e.g. `python -m api.celery_worker worker ingest`.
 """
 from celery import Celery
 from celery.schedules import crontab
+from kombu import Exchange, Queue
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .profiling import install_celery_hooks
+
 # Initialize Celery
 celery_app = Celery(
     "survey_system",
     broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"),
     backend=os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"),
-    include=["celery_tasks"]
+    include=["api.celery_tasks", "api.backend_tasks"]
 )
 
+QUEUES = ("ingest", "stats", "export", "maintenance")
+
+# Task name -> queue
+TASK_ROUTES = {
+    "backend_tasks.dispatch_due_ingests": "ingest",
+    "backend_tasks.ingest_experiments": "ingest",
+    "backend_tasks.ingest_youtube_data": "ingest",
+    "backend_tasks.backfill_metrics": "export",
+    "backend_tasks.refresh_channel_rollups": "stats",
+    "celery_tasks.update_survey_statistics": "stats",
+    "celery_tasks.rebuild_survey_sketches": "stats",
+    "celery_tasks.generate_daily_report": "export",
+    "celery_tasks.export_survey_data": "export",
+    "celery_tasks.cleanup_old_responses": "maintenance",
+    "celery_tasks.send_survey_notification": "maintenance",
+}
+
+# Long tasks acknowledged only after they finish, so they are redelivered when their
+# worker host disappears. Only tasks that are safe to run twice belong here: the
+# backfill merge skips stored snapshots, exports write a new file, cleanup deletes by age.
+ACKS_LATE_TASKS = {
+    "backend_tasks.backfill_metrics",
+    "celery_tasks.generate_daily_report",
+    "celery_tasks.export_survey_data",
+    "celery_tasks.cleanup_old_responses",
+}
+
+# Per-queue worker settings; time limits are in seconds. Every pool is prefork:
+# the solo pool cannot enforce time limits
+WORKER_PROFILES = {
+    "ingest": {
+        "concurrency": 8,
+        "prefetch_multiplier": 1,
+        "pool": "prefork",
+        "soft_time_limit": 2 * 60,
+        "time_limit": 3 * 60,
+    },
+    "stats": {
+        "concurrency": 2,
+        "prefetch_multiplier": 1,
+        "pool": "prefork",
+        "soft_time_limit": 5 * 60,
+        "time_limit": 6 * 60,
+    },
+    "export": {
+        "concurrency": 2,
+        "prefetch_multiplier": 1,
+        "pool": "prefork",
+        "soft_time_limit": 25 * 60,
+        "time_limit": 30 * 60,
+    },
+    "maintenance": {
+        "concurrency": 1,
+        "prefetch_multiplier": 1,
+        "pool": "prefork",
+        "soft_time_limit": 25 * 60,
+        "time_limit": 30 * 60,
+    },
+}
+
 # Celery configuration
 celery_app.conf.update(
     task_serializer="json",
@@ -24,14 +98,37 @@ celery_app.conf.update(
     timezone="Asia/Taipei",
     enable_utc=True,
     task_track_started=True,
+    # Each queue needs its own exchange and routing key: bare Queue(name)s all bind to the
+    # default exchange with the default routing key, so every task would reach every queue
+    task_queues=[Queue(name, Exchange(name), routing_key=name) for name in QUEUES],
+    task_default_queue="maintenance",
+    task_default_exchange="maintenance",
+    task_default_routing_key="maintenance",
+    task_routes={name: {"queue": queue} for name, queue in TASK_ROUTES.items()},
+    # Time limits follow the queue a task is routed to, whichever worker runs it.
+    # A late-acked task whose own process dies (OOM, hard time limit) is still acked
+    # and failed, since task_reject_on_worker_lost stays off: requeueing it would
+    # kill the next worker too, forever.
+    task_annotations={
+        name: {
+            "soft_time_limit": WORKER_PROFILES[queue]["soft_time_limit"],
+            "time_limit": WORKER_PROFILES[queue]["time_limit"],
+            "acks_late": name in ACKS_LATE_TASKS,
+        }
+        for name, queue in TASK_ROUTES.items()
+    },
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
-    worker_prefetch_multiplier=4,
+    worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
 )
 
 # Celery Beat Schedule (Periodic Tasks)
 celery_app.conf.beat_schedule = {
+    "dispatch-due-ingests": {
+        "task": "backend_tasks.dispatch_due_ingests",
+        "schedule": crontab(minute="*"),  # Every minute; only due experiments are ingested
+    },
     "cleanup-old-responses": {
         "task": "celery_tasks.cleanup_old_responses",
         "schedule": crontab(hour=2, minute=0),  # Run daily at 2 AM
@@ -40,11 +137,39 @@ celery_app.conf.beat_schedule = {
         "task": "celery_tasks.generate_daily_report",
         "schedule": crontab(hour=1, minute=0),  # Run daily at 1 AM
     },
+    "rebuild-survey-sketches": {
+        "task": "celery_tasks.rebuild_survey_sketches",
+        "schedule": crontab(hour=3, minute=0),  # Daily; drops respondents and answers of cleaned-up responses
+    },
     "update-survey-statistics": {
         "task": "celery_tasks.update_survey_statistics",
         "schedule": crontab(minute="*/15"),  # Run every 15 minutes
     },
 }
 
+# Opt-in sampling profiles for flagged tasks (see profiling.py)
+install_celery_hooks()
+
+
+def worker_argv(queue: str) -> list:
+    """`celery worker` arguments for one queue's profile"""
+    profile = WORKER_PROFILES[queue]
+    return [
+        "worker",
+        "--queues", queue,
+        "--hostname", f"{queue}@%h",
+        "--concurrency", str(profile["concurrency"]),
+        "--prefetch-multiplier", str(profile["prefetch_multiplier"]),
+        "--pool", profile["pool"],
+        "--soft-time-limit", str(profile["soft_time_limit"]),
+        "--time-limit", str(profile["time_limit"]),
+        "--loglevel", "info",
+    ]
+
+
 if __name__ == "__main__":
-    celery_app.start()
\ No newline at end of file
+    # `python -m api.celery_worker worker <queue>` starts a worker with that queue's profile
+    if len(sys.argv) == 3 and sys.argv[1] == "worker" and sys.argv[2] in WORKER_PROFILES:
+        celery_app.worker_main(worker_argv(sys.argv[2]))
+    else:
+        celery_app.start()
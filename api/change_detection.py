@@ -0,0 +1,144 @@
+"""
+Change detection for ingested snapshots
+
+Low-traffic videos often return exactly the same counters poll after poll.
+The last written fingerprint per variant lives in Redis; a snapshot whose
+fingerprint matches is not written to metrics_raw / metrics_agg. Suppressed
+polls still record a "seen at" heartbeat (the ingest:seen hash) and bump a
+counter. Variants that are no longer ingested are pruned from both hashes by
+the dispatcher (see SnapshotGate.retain).
+"""
+import hashlib
+import os
+import time
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+FINGERPRINT_KEY = "ingest:fingerprint"
+SEEN_KEY = "ingest:seen"
+COUNTERS_KEY = "ingest:writes"
+
+COUNTER_FIELDS = ("views", "likes", "comments", "shares", "impressions", "clicks", "watch_time_sec")
+
+
+def snapshot_fingerprint(metrics_data: dict, day: date) -> str:
+    """
+    Fingerprint of one variant's counters
+
+    The day is part of the fingerprint so the first poll of each day still
+    writes that day's metrics_agg row.
+    """
+    values = ",".join(str(int(metrics_data.get(field, 0) or 0)) for field in COUNTER_FIELDS)
+    return hashlib.blake2b(f"{day.isoformat()}|{values}".encode(), digest_size=8).hexdigest()
+
+
+class SnapshotGate:
+    """
+    Decides which snapshots are worth writing
+
+    Without a Redis client the state is kept in-process, which is enough for a
+    single worker or a benchmark run.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client
+        self._fingerprints: Dict[str, str] = {}
+        self._seen: Dict[str, float] = {}
+        self._counters = {"written": 0, "suppressed": 0}
+
+    def changed(self, fingerprints: Dict[str, str]) -> Dict[str, str]:
+        """Return the subset of {variant_id: fingerprint} that differs from the last write"""
+        if not fingerprints:
+            return {}
+        keys = list(fingerprints)
+        if self.redis is None:
+            previous = [self._fingerprints.get(k) for k in keys]
+        else:
+            previous = [
+                p.decode() if isinstance(p, bytes) else p
+                for p in self.redis.hmget(FINGERPRINT_KEY, keys)
+            ]
+        return {k: fingerprints[k] for k, old in zip(keys, previous) if old != fingerprints[k]}
+
+    def record(self, written: Dict[str, str], suppressed: Iterable[str]) -> None:
+        """Call after the written snapshots are committed"""
+        suppressed = list(suppressed)
+        now = time.time()
+        seen = dict.fromkeys(list(written) + suppressed, now)
+        if self.redis is None:
+            self._fingerprints.update(written)
+            self._seen.update(seen)
+            self._counters["written"] += len(written)
+            self._counters["suppressed"] += len(suppressed)
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        if written:
+            pipe.hset(FINGERPRINT_KEY, mapping=written)
+        if seen:
+            pipe.hset(SEEN_KEY, mapping=seen)
+        pipe.hincrby(COUNTERS_KEY, "written", len(written))
+        pipe.hincrby(COUNTERS_KEY, "suppressed", len(suppressed))
+        pipe.execute()
+
+    def retain(self, variant_ids: Iterable[str]) -> int:
+        """
+        Drop the state of every variant not in variant_ids
+
+        Called with the variants of running experiments, so stopped experiments
+        and deleted variants do not grow the hashes forever. Returns how many
+        variants were dropped.
+        """
+        keep = {str(v) for v in variant_ids}
+        if self.redis is None:
+            stale = (set(self._fingerprints) | set(self._seen)) - keep
+            for variant_id in stale:
+                self._fingerprints.pop(variant_id, None)
+                self._seen.pop(variant_id, None)
+            return len(stale)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hkeys(FINGERPRINT_KEY)
+        pipe.hkeys(SEEN_KEY)
+        stored = {k.decode() if isinstance(k, bytes) else k for keys in pipe.execute() for k in keys}
+        stale = sorted(stored - keep)
+        for start in range(0, len(stale), 1000):
+            chunk = stale[start:start + 1000]
+            pipe.hdel(FINGERPRINT_KEY, *chunk)
+            pipe.hdel(SEEN_KEY, *chunk)
+        if stale:
+            pipe.execute()
+        return len(stale)
+
+    def stats(self) -> Dict[str, int]:
+        if self.redis is None:
+            counters = dict(self._counters)
+        else:
+            raw = self.redis.hgetall(COUNTERS_KEY)
+            counters = {"written": 0, "suppressed": 0}
+            counters.update({
+                (k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()
+            })
+        total = counters["written"] + counters["suppressed"]
+        counters["suppressed_ratio"] = round(counters["suppressed"] / total, 4) if total else 0.0
+        return counters
+
+
+_gate: Optional[SnapshotGate] = None
+
+
+def get_gate() -> SnapshotGate:
+    global _gate
+    if _gate is None:
+        import redis
+
+        _gate = SnapshotGate(redis.from_url(REDIS_URL))
+    return _gate
+
+
+def set_gate(gate: Optional[SnapshotGate]) -> None:
+    """Install a gate, e.g. an in-process one for benchmarks"""
+    global _gate
+    _gate = gate
@@ -0,0 +1,66 @@
+"""
+Coded storage for choice answers
+
+Radio/dropdown answers are stored as the option's position (answers.choice_index,
+smallint) and checkbox answers as a bitmask of positions (answers.choice_mask,
+bigint), with answer_text/answer_data left NULL. Values that are not among the
+question's options (or questions with more than MAX_MASK_OPTIONS options for
+checkboxes) keep the JSONB form.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+SINGLE_CHOICE_TYPES = ("radio", "dropdown")
+MULTI_CHOICE_TYPES = ("checkbox",)
+# Bit 63 is the sign bit of a bigint
+MAX_MASK_OPTIONS = 63
+
+
+def option_positions(options: Optional[List[str]]) -> Dict[str, int]:
+    """Option label -> stored position (the first one wins for a repeated label)"""
+    positions: Dict[str, int] = {}
+    for i, option in enumerate(options or []):
+        positions.setdefault(option, i)
+    return positions
+
+
+def encode_choice(question_type: str, options: Optional[List[str]], answer_text: Optional[str],
+                  answer_data: Any, positions: Optional[Dict[str, int]] = None
+                  ) -> Tuple[Optional[str], Any, Optional[int], Optional[int]]:
+    """
+    (answer_text, answer_data, choice_index, choice_mask) to store for one answer
+
+    `positions` is option_positions(options), for callers that precompute it.
+    """
+    if not options:
+        return answer_text, answer_data, None, None
+    if positions is None:
+        positions = option_positions(options)
+
+    if question_type in SINGLE_CHOICE_TYPES:
+        selected = answer_data.get("selected") if isinstance(answer_data, dict) else None
+        choice = selected if selected is not None else answer_text
+        if choice in positions:
+            return None, None, positions[choice], None
+
+    elif question_type in MULTI_CHOICE_TYPES and len(options) <= MAX_MASK_OPTIONS:
+        selected = answer_data.get("selected") if isinstance(answer_data, dict) else None
+        if isinstance(selected, list) and all(s in positions for s in selected):
+            mask = 0
+            for s in selected:
+                mask |= 1 << positions[s]
+            return None, None, None, mask
+
+    return answer_text, answer_data, None, None
+
+
+def decode_choice(question_type: str, options: Optional[List[str]], answer_text: Optional[str],
+                  answer_data: Any, choice_index: Optional[int],
+                  choice_mask: Optional[int]) -> Tuple[Optional[str], Any]:
+    """(answer_text, answer_data) in the JSONB form, whichever way the answer is stored"""
+    if choice_index is not None and options and 0 <= choice_index < len(options):
+        choice = options[choice_index]
+        return choice, {"selected": choice}
+    if choice_mask is not None and options:
+        selected = [option for i, option in enumerate(options) if choice_mask >> i & 1]
+        return ", ".join(selected), {"selected": selected}
+    return answer_text, answer_data
@@ -0,0 +1,183 @@
+"""
+Adaptive ingestion scheduler
+
+Every running experiment has a next-poll time in a Redis sorted set. Each beat
+tick only dispatches the experiments that are due; after an ingest the next
+poll time is derived from how fast the experiment's metrics move, how close it
+is to a decision and how old it is.
+"""
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .models import Experiment, MetricsRaw, MetricsAgg, Variant
+from .statistics import calculate_z_test
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SCHEDULE_KEY = "ingest:schedule"
+
+MIN_INTERVAL_SEC = int(os.getenv("INGEST_MIN_INTERVAL_SEC", "60"))
+MAX_INTERVAL_SEC = int(os.getenv("INGEST_MAX_INTERVAL_SEC", str(6 * 3600)))
+# Until an experiment has two snapshots its velocity is unknown
+DEFAULT_INTERVAL_SEC = int(os.getenv("INGEST_DEFAULT_INTERVAL_SEC", "300"))
+# Poll roughly whenever this many new impressions (or views) have accumulated
+TARGET_EVENTS_PER_POLL = int(os.getenv("INGEST_TARGET_EVENTS_PER_POLL", "500"))
+# A claimed experiment is retried after this long if its ingest never reschedules it
+CLAIM_LEASE_SEC = 15 * 60
+
+
+def compute_next_interval(velocity_per_hour: Optional[float], p_value: Optional[float] = None,
+                          total_samples: int = 0, min_samples: Optional[int] = None,
+                          age_hours: float = 0.0, p_threshold: float = 0.05) -> float:
+    """
+    Seconds until an experiment should be polled again
+
+    Args:
+        velocity_per_hour: New impressions (or views) per hour since the previous poll;
+            None while it cannot be measured yet
+        p_value: Latest primary-metric p-value, if there is one
+        total_samples: Impressions across all variants so far
+        min_samples: The experiment's min_samples stop rule
+        age_hours: Hours since the experiment started
+        p_threshold: The experiment's significance threshold
+    """
+    if velocity_per_hour is None:
+        # New experiments: early traffic matters most, so keep polling until it is measured
+        interval = DEFAULT_INTERVAL_SEC
+    elif velocity_per_hour <= 0:
+        interval = MAX_INTERVAL_SEC
+    else:
+        interval = 3600 * TARGET_EVENTS_PER_POLL / velocity_per_hour
+
+    # Close to a decision: poll more often so stop rules fire promptly
+    near_sample_goal = bool(min_samples) and 0.8 * min_samples <= total_samples < 1.2 * min_samples
+    near_threshold = p_value is not None and p_threshold / 4 <= p_value <= p_threshold * 4
+    if near_sample_goal or near_threshold:
+        interval /= 2
+    # Far from significance with plenty of data: extra polls rarely change the outcome
+    elif p_value is not None and p_value > 0.5 and (not min_samples or total_samples >= min_samples):
+        interval *= 2
+
+    # Experiments older than a week slow down logarithmically
+    if age_hours > 24 * 7:
+        interval *= 1 + math.log2(age_hours / (24 * 7))
+
+    return float(min(MAX_INTERVAL_SEC, max(MIN_INTERVAL_SEC, interval)))
+
+
+def experiment_signals(db: Session, experiment: Experiment) -> Dict[str, Optional[float]]:
+    """Velocity, decision and age inputs for compute_next_interval"""
+    velocity = None
+    variant_ids = [v.id for v in db.query(Variant.id).filter(Variant.video_id == experiment.video_id)]
+    for variant_id in variant_ids:
+        latest = db.query(MetricsRaw).filter(
+            MetricsRaw.variant_id == variant_id
+        ).order_by(MetricsRaw.ts.desc()).limit(2).all()
+        if len(latest) == 2:
+            velocity = velocity or 0.0
+            # Measured up to now: unchanged snapshots are not written (see change_detection),
+            # so a quiet variant's velocity decays instead of freezing at its last change
+            previous_ts = latest[1].ts
+            if previous_ts.tzinfo is None:
+                previous_ts = previous_ts.replace(tzinfo=timezone.utc)
+            hours = (datetime.now(timezone.utc) - previous_ts).total_seconds() / 3600
+            if hours > 0:
+                delta = max(
+                    (latest[0].impressions or 0) - (latest[1].impressions or 0),
+                    (latest[0].views or 0) - (latest[1].views or 0),
+                )
+                velocity += max(0, delta) / hours
+
+    totals = []
+    for variant_id in variant_ids[:2]:
+        agg = db.query(MetricsAgg).filter(
+            MetricsAgg.variant_id == variant_id
+        ).order_by(MetricsAgg.date.desc()).first()
+        if agg:
+            totals.append(agg)
+
+    p_value = None
+    if len(totals) == 2:
+        if experiment.primary_metric == "ctr":
+            _, p_value, _, _ = calculate_z_test(
+                totals[0].clicks or 0, totals[0].impressions or 0,
+                totals[1].clicks or 0, totals[1].impressions or 0,
+            )
+        else:
+            _, p_value, _, _ = calculate_z_test(
+                totals[0].likes or 0, totals[0].views or 0,
+                totals[1].likes or 0, totals[1].views or 0,
+            )
+
+    start_at = experiment.start_at
+    if start_at.tzinfo is None:
+        start_at = start_at.replace(tzinfo=timezone.utc)
+    stop_rules = experiment.stop_rules or {}
+    return {
+        "velocity_per_hour": velocity,
+        "p_value": p_value,
+        "total_samples": sum(a.impressions or 0 for a in totals),
+        "min_samples": stop_rules.get("min_samples"),
+        "age_hours": (datetime.now(timezone.utc) - start_at).total_seconds() / 3600,
+        "p_threshold": stop_rules.get("pvalue", 0.05),
+    }
+
+
+class IngestScheduler:
+    """Per-experiment next-poll times kept in a Redis sorted set"""
+
+    # Atomically take due members and push them out by the lease so that
+    # concurrent beat ticks never dispatch the same experiment twice
+    CLAIM_SCRIPT = """
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    for _, member in ipairs(due) do
+        redis.call('ZADD', KEYS[1], ARGV[3], member)
+    end
+    return due
+    """
+
+    def __init__(self, redis_client, key: str = SCHEDULE_KEY):
+        self.redis = redis_client
+        self.key = key
+        self._claim = redis_client.register_script(self.CLAIM_SCRIPT)
+
+    def sync(self, running_ids: Iterable[str]) -> None:
+        """Add new running experiments (due now) and drop ones that stopped"""
+        running = {str(i) for i in running_ids}
+        scheduled = {m.decode() if isinstance(m, bytes) else m for m in self.redis.zrange(self.key, 0, -1)}
+        pipe = self.redis.pipeline()
+        now = time.time()
+        for experiment_id in running - scheduled:
+            pipe.zadd(self.key, {experiment_id: now}, nx=True)
+        stale = scheduled - running
+        if stale:
+            pipe.zrem(self.key, *stale)
+        pipe.execute()
+
+    def claim_due(self, limit: int = 500, now: Optional[float] = None) -> List[str]:
+        now = now or time.time()
+        due = self._claim(keys=[self.key], args=[now, limit, now + CLAIM_LEASE_SEC])
+        return [m.decode() if isinstance(m, bytes) else m for m in due]
+
+    def reschedule(self, experiment_id: str, interval_sec: float) -> None:
+        self.redis.zadd(self.key, {str(experiment_id): time.time() + interval_sec})
+
+
+
+_scheduler: Optional[IngestScheduler] = None
+
+
+def get_scheduler() -> IngestScheduler:
+    global _scheduler
+    if _scheduler is None:
+        import redis
+
+        _scheduler = IngestScheduler(redis.from_url(REDIS_URL))
+    return _scheduler
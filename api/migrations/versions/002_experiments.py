@@ -0,0 +1,120 @@
+"""Experiment tables
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create videos table
+    op.create_table(
+        'videos',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('platform', sa.Text(), nullable=False),
+        sa.Column('external_id', sa.Text(), nullable=False),
+        sa.Column('title', sa.Text(), nullable=False),
+        sa.Column('channel_id', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('external_id')
+    )
+
+    # Create variants table
+    op.create_table(
+        'variants',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('video_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('variant_key', sa.Text(), nullable=False),
+        sa.Column('title', sa.Text(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('thumbnail_url', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_variants_video_id', 'variants', ['video_id'], unique=False)
+
+    # Create experiments table
+    op.create_table(
+        'experiments',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('video_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('primary_metric', sa.Text(), nullable=False),
+        sa.Column('secondary_metrics', sa.JSON(), nullable=True),
+        sa.Column('start_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('end_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('stop_rules', sa.JSON(), nullable=True),
+        sa.Column('status', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_experiments_status', 'experiments', ['status'], unique=False)
+
+    # Create metrics_raw table
+    op.create_table(
+        'metrics_raw',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('video_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('variant_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ts', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('views', sa.Integer(), nullable=True),
+        sa.Column('likes', sa.Integer(), nullable=True),
+        sa.Column('comments', sa.Integer(), nullable=True),
+        sa.Column('shares', sa.Integer(), nullable=True),
+        sa.Column('impressions', sa.Integer(), nullable=True),
+        sa.Column('clicks', sa.Integer(), nullable=True),
+        sa.Column('watch_time_sec', sa.Integer(), nullable=True),
+        sa.Column('source', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id']),
+        sa.ForeignKeyConstraint(['variant_id'], ['variants.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_metrics_raw_variant_id_ts', 'metrics_raw', ['variant_id', 'ts'], unique=False)
+
+    # Create metrics_agg table
+    op.create_table(
+        'metrics_agg',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('video_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('variant_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('views', sa.Integer(), nullable=True),
+        sa.Column('likes', sa.Integer(), nullable=True),
+        sa.Column('comments', sa.Integer(), nullable=True),
+        sa.Column('shares', sa.Integer(), nullable=True),
+        sa.Column('impressions', sa.Integer(), nullable=True),
+        sa.Column('clicks', sa.Integer(), nullable=True),
+        sa.Column('watch_time_sec', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id']),
+        sa.ForeignKeyConstraint(['variant_id'], ['variants.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('video_id', 'variant_id', 'date', name='_video_variant_date_uc')
+    )
+    op.create_index('ix_metrics_agg_variant_id_date', 'metrics_agg', ['variant_id', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_metrics_agg_variant_id_date', table_name='metrics_agg')
+    op.drop_table('metrics_agg')
+
+    op.drop_index('ix_metrics_raw_variant_id_ts', table_name='metrics_raw')
+    op.drop_table('metrics_raw')
+
+    op.drop_index('ix_experiments_status', table_name='experiments')
+    op.drop_table('experiments')
+
+    op.drop_index('ix_variants_video_id', table_name='variants')
+    op.drop_table('variants')
+
+    op.drop_table('videos')
@@ -0,0 +1,122 @@
+"""Coded storage for choice answers
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+# Answers are rewritten in id ranges so each UPDATE's join, sort and WAL stay bounded.
+# Alembic runs the whole upgrade in one transaction: readers never see a half-coded
+# table, and the ACCESS EXCLUSIVE lock taken by ADD COLUMN holds until it commits,
+# so writes to answers wait for the whole migration
+BATCH_SIZE = 50000
+
+# Radio/dropdown: position of the selected option in questions.options; a repeated
+# label maps to its first position, as choice_codes.option_positions does
+ENCODE_SINGLE_SQL = """
+    WITH coded AS (
+        SELECT DISTINCT ON (a.id) a.id, o.ord - 1 AS choice_index
+        FROM answers a
+        JOIN questions q ON q.id = a.question_id
+        CROSS JOIN LATERAL jsonb_array_elements_text(q.options) WITH ORDINALITY AS o(opt, ord)
+        WHERE q.question_type IN ('radio', 'dropdown')
+          AND o.opt = coalesce(a.answer_data->>'selected', a.answer_text)
+          AND a.id BETWEEN :lo AND :hi
+        ORDER BY a.id, o.ord
+    )
+    UPDATE answers a
+    SET choice_index = coded.choice_index, answer_text = NULL, answer_data = NULL
+    FROM coded
+    WHERE a.id = coded.id
+"""
+
+# Checkbox: one bit per selected option (first position of a repeated label), only
+# when every selection is a known option
+ENCODE_MULTI_SQL = """
+    WITH coded AS (
+        SELECT a.id, coalesce(bit_or(1::bigint << (o.ord - 1)::int), 0) AS mask
+        FROM answers a
+        JOIN questions q ON q.id = a.question_id
+        LEFT JOIN LATERAL jsonb_array_elements_text(a.answer_data->'selected') AS s(val) ON true
+        LEFT JOIN LATERAL (
+            SELECT min(e.ord) AS ord
+            FROM jsonb_array_elements_text(q.options) WITH ORDINALITY AS e(opt, ord)
+            WHERE e.opt = s.val
+        ) o ON true
+        WHERE q.question_type = 'checkbox'
+          AND jsonb_typeof(q.options) = 'array'
+          AND jsonb_array_length(q.options) <= 63
+          AND jsonb_typeof(a.answer_data->'selected') = 'array'
+          AND a.id BETWEEN :lo AND :hi
+        GROUP BY a.id, a.answer_data
+        HAVING count(o.ord) = jsonb_array_length(a.answer_data->'selected')
+    )
+    UPDATE answers a
+    SET choice_mask = coded.mask, answer_text = NULL, answer_data = NULL
+    FROM coded
+    WHERE a.id = coded.id
+"""
+
+DECODE_SINGLE_SQL = """
+    UPDATE answers a
+    SET answer_text = q.options->>a.choice_index,
+        answer_data = jsonb_build_object('selected', q.options->>a.choice_index),
+        choice_index = NULL
+    FROM questions q
+    WHERE a.question_id = q.id AND a.choice_index IS NOT NULL
+      AND a.id BETWEEN :lo AND :hi
+"""
+
+DECODE_MULTI_SQL = """
+    WITH decoded AS (
+        SELECT a.id,
+               coalesce(jsonb_agg(o.opt ORDER BY o.ord) FILTER (WHERE o.opt IS NOT NULL), '[]') AS selected,
+               coalesce(string_agg(o.opt, ', ' ORDER BY o.ord), '') AS text
+        FROM answers a
+        JOIN questions q ON q.id = a.question_id
+        LEFT JOIN LATERAL jsonb_array_elements_text(q.options) WITH ORDINALITY AS o(opt, ord)
+            ON a.choice_mask & (1::bigint << (o.ord - 1)::int) <> 0
+        WHERE a.choice_mask IS NOT NULL AND a.id BETWEEN :lo AND :hi
+        GROUP BY a.id
+    )
+    UPDATE answers a
+    SET answer_text = decoded.text,
+        answer_data = jsonb_build_object('selected', decoded.selected),
+        choice_mask = NULL
+    FROM decoded
+    WHERE a.id = decoded.id
+"""
+
+
+def _in_batches(*statements: str) -> None:
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM answers")).scalar()
+    for lo in range(1, max_id + 1, BATCH_SIZE):
+        for statement in statements:
+            bind.execute(sa.text(statement), {"lo": lo, "hi": lo + BATCH_SIZE - 1})
+
+
+def upgrade() -> None:
+    op.add_column('answers', sa.Column('choice_index', sa.SmallInteger(), nullable=True))
+    op.add_column('answers', sa.Column('choice_mask', sa.BigInteger(), nullable=True))
+
+    # Answers that do not match an option (free text, renamed options) keep the JSONB form
+    _in_batches(ENCODE_SINGLE_SQL, ENCODE_MULTI_SQL)
+
+    # The rewritten rows leave dead tuples behind; VACUUM cannot run inside the
+    # migration transaction, so run `VACUUM (ANALYZE) answers` afterwards
+    op.execute("ANALYZE answers")
+
+
+def downgrade() -> None:
+    _in_batches(DECODE_SINGLE_SQL, DECODE_MULTI_SQL)
+    op.drop_column('answers', 'choice_mask')
+    op.drop_column('answers', 'choice_index')
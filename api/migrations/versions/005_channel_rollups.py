@@ -0,0 +1,81 @@
+"""Channel rollups
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Daily increments of each variant's cumulative counters, keyed for per-channel date ranges
+    op.create_table(
+        'channel_variant_daily',
+        sa.Column('variant_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('channel_id', sa.Text(), nullable=False),
+        sa.Column('video_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('variant_key', sa.Text(), nullable=False),
+        sa.Column('views', sa.BigInteger(), nullable=False),
+        sa.Column('likes', sa.BigInteger(), nullable=False),
+        sa.Column('impressions', sa.BigInteger(), nullable=False),
+        sa.Column('clicks', sa.BigInteger(), nullable=False),
+        sa.Column('watch_time_sec', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['variant_id'], ['variants.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('variant_id', 'date')
+    )
+    op.create_index('ix_channel_variant_daily_channel_date', 'channel_variant_daily',
+                    ['channel_id', 'date'], unique=False)
+
+    # One row per experiment: control against its leading variant on the primary metric
+    op.create_table(
+        'channel_experiment_outcomes',
+        sa.Column('experiment_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('channel_id', sa.Text(), nullable=False),
+        sa.Column('video_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('status', sa.Text(), nullable=False),
+        sa.Column('primary_metric', sa.Text(), nullable=False),
+        sa.Column('start_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('variants', sa.Integer(), nullable=False),
+        sa.Column('as_of', sa.Date(), nullable=True),
+        sa.Column('control_key', sa.Text(), nullable=True),
+        sa.Column('control_successes', sa.BigInteger(), nullable=True),
+        sa.Column('control_trials', sa.BigInteger(), nullable=True),
+        sa.Column('leader_variant_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('leader_key', sa.Text(), nullable=True),
+        sa.Column('leader_title', sa.Text(), nullable=True),
+        sa.Column('leader_thumbnail_url', sa.Text(), nullable=True),
+        sa.Column('leader_successes', sa.BigInteger(), nullable=True),
+        sa.Column('leader_trials', sa.BigInteger(), nullable=True),
+        sa.Column('control_rate', sa.Float(), nullable=True),
+        sa.Column('leader_rate', sa.Float(), nullable=True),
+        sa.Column('lift', sa.Float(), nullable=True),
+        sa.Column('z_statistic', sa.Float(), nullable=True),
+        sa.Column('p_value', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['experiment_id'], ['experiments.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('experiment_id')
+    )
+    op.create_index('ix_channel_experiment_outcomes_channel_lift', 'channel_experiment_outcomes',
+                    ['channel_id', sa.text('lift DESC NULLS LAST')], unique=False)
+
+    # Existing history is loaded with `python -m api.rollups --since <first date>`
+
+
+def downgrade() -> None:
+    op.drop_index('ix_channel_experiment_outcomes_channel_lift', table_name='channel_experiment_outcomes')
+    op.drop_table('channel_experiment_outcomes')
+    op.drop_index('ix_channel_variant_daily_channel_date', table_name='channel_variant_daily')
+    op.drop_table('channel_variant_daily')
@@ -0,0 +1,25 @@
+"""Flag repeat responses instead of rejecting them
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # A constant default is a catalog-only change on Postgres 11+; no table rewrite
+    op.add_column('responses', sa.Column('suspected_duplicate', sa.Boolean(), server_default='false', nullable=False))
+    op.add_column('surveys', sa.Column('reject_duplicates', sa.Boolean(), server_default='false', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('surveys', 'reject_duplicates')
+    op.drop_column('responses', 'suspected_duplicate')
@@ -0,0 +1,318 @@
+"""
+On-demand sampling profiler
+
+A background thread snapshots Python stacks with sys._current_frames() every
+PROFILE_INTERVAL_MS and counts them in the collapsed-stack format understood
+by flamegraph.pl and speedscope:
+
+    module:function;module:function;... <samples>
+
+Profiles are opt-in per execution and stored in Redis (`profile:<id>`, kept
+for PROFILE_TTL_SEC, at most PROFILE_KEEP of them), so the API serves the
+profiles of tasks that ran on other hosts too:
+
+    API      send `X-Profile: <PROFILE_TOKEN>`; the response carries X-Profile-Id
+             and the stacks are served by GET /profiles/{profile_id}
+    Celery   send the task with headers={"profile": True}, or list task names in
+             PROFILE_TASKS to profile every run
+
+API profiles sample every thread of the process (the event loop and the
+threadpool running sync endpoints), so on a busy instance concurrent requests
+show up too; task profiles sample only the thread executing the task. Nothing
+is sampled unless PROFILE_TOKEN (API) or a task flag is set.
+"""
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Oldest profiles are deleted beyond this many, and any profile after PROFILE_TTL_SEC
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_TTL_SEC = int(os.getenv("PROFILE_TTL_SEC", str(7 * 24 * 3600)))
+PROFILE_TASKS = {name.strip() for name in os.getenv("PROFILE_TASKS", "").split(",") if name.strip()}
+# Sampling stops by itself after this long (e.g. an SSE stream that never ends)
+PROFILE_MAX_SEC = float(os.getenv("PROFILE_MAX_SEC", "120"))
+PROFILE_MAX_DEPTH = 128
+
+# Sorted set of stored profile ids scored by creation time
+PROFILES_KEY = "profiles"
+PROFILE_ID_RE = re.compile(r"^(req|task)-[0-9a-f]{32}$")
+
+# Leaf frames of threads that are parked (idle thread-pool workers, the event loop
+# waiting in select); their samples say nothing about where time goes
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_name}"
+
+
+def collapse_stack(frame) -> Optional[str]:
+    """Root-first `;`-joined stack for `frame`, or None for an idle thread"""
+    if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Samples the given threads (every thread but its own by default)
+
+    Overhead is one sys._current_frames() call per interval; the profiled code
+    itself is not instrumented.
+    """
+
+    def __init__(self, thread_ids: Optional[List[int]] = None,
+                 interval: float = PROFILE_INTERVAL_MS / 1000, max_duration: float = PROFILE_MAX_SEC):
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.interval = interval
+        self.max_duration = max_duration
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.started_at is not None:
+            self.elapsed = min(time.perf_counter() - self.started_at, self.max_duration)
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        deadline = self.started_at + self.max_duration
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = collapse_stack(frame)
+                if stack:
+                    self.stacks[stack] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def new_profile_id(kind: str) -> str:
+    return f"{kind}-{uuid.uuid4().hex}"
+
+
+def _check_profile_id(profile_id: str) -> None:
+    if not PROFILE_ID_RE.match(profile_id):
+        raise ValueError(f"Invalid profile id: {profile_id}")
+
+
+def _created_at(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class ProfileStore:
+    """
+    Collapsed stacks shared by the API and every worker
+
+    Without a Redis client profiles are kept in-process, which is enough for a
+    single process or tests.
+    """
+
+    def __init__(self, redis_client=None, keep: int = PROFILE_KEEP, ttl: int = PROFILE_TTL_SEC):
+        self.redis = redis_client
+        self.keep = keep
+        self.ttl = ttl
+        self._local: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(profile_id: str) -> str:
+        return f"profile:{profile_id}"
+
+    def save(self, profile_id: str, collapsed: str) -> None:
+        _check_profile_id(profile_id)
+        now = time.time()
+        if self.redis is None:
+            with self._lock:
+                self._local[profile_id] = (now, collapsed)
+                for old in sorted(self._local, key=lambda p: self._local[p][0])[:-self.keep]:
+                    del self._local[old]
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.set(self._key(profile_id), collapsed, ex=self.ttl)
+        pipe.zadd(PROFILES_KEY, {profile_id: now})
+        # Expired profiles leave the index too
+        pipe.zremrangebyscore(PROFILES_KEY, "-inf", now - self.ttl)
+        pipe.zrange(PROFILES_KEY, 0, -self.keep - 1)
+        dropped = pipe.execute()[-1]
+        if dropped:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.zrem(PROFILES_KEY, *dropped)
+            pipe.delete(*(self._key(p.decode() if isinstance(p, bytes) else p) for p in dropped))
+            pipe.execute()
+
+    def load(self, profile_id: str) -> Optional[str]:
+        _check_profile_id(profile_id)
+        if self.redis is None:
+            entry = self._local.get(profile_id)
+            return entry[1] if entry else None
+        data = self.redis.get(self._key(profile_id))
+        return data.decode() if isinstance(data, bytes) else data
+
+    def list(self) -> List[Dict[str, object]]:
+        """Stored profiles, newest first"""
+        if self.redis is None:
+            with self._lock:
+                entries = sorted(self._local.items(), key=lambda item: item[1][0], reverse=True)
+            return [
+                {"profile_id": profile_id, "bytes": len(collapsed.encode()), "created_at": _created_at(ts)}
+                for profile_id, (ts, collapsed) in entries
+            ]
+        entries = self.redis.zrevrangebyscore(PROFILES_KEY, "+inf", time.time() - self.ttl, withscores=True)
+        ids = [m.decode() if isinstance(m, bytes) else m for m, _ in entries]
+        pipe = self.redis.pipeline(transaction=False)
+        for profile_id in ids:
+            pipe.strlen(self._key(profile_id))
+        sizes = pipe.execute() if ids else []
+        return [
+            {"profile_id": profile_id, "bytes": size, "created_at": _created_at(ts)}
+            for profile_id, (_, ts), size in zip(ids, entries, sizes) if size
+        ]
+
+
+_store: Optional[ProfileStore] = None
+
+
+def get_profile_store() -> ProfileStore:
+    global _store
+    if _store is None:
+        import redis
+
+        _store = ProfileStore(redis.from_url(REDIS_URL))
+    return _store
+
+
+def set_profile_store(store: Optional[ProfileStore]) -> None:
+    """Install a store, e.g. an in-process one for tests"""
+    global _store
+    _store = store
+
+
+def save_profile(profile_id: str, profiler: SamplingProfiler) -> None:
+    get_profile_store().save(profile_id, profiler.collapsed())
+
+
+def load_profile(profile_id: str) -> Optional[str]:
+    """Collapsed stacks of a stored profile; ValueError for a malformed id"""
+    return get_profile_store().load(profile_id)
+
+
+def list_profiles() -> List[Dict[str, object]]:
+    """Stored profiles, newest first"""
+    return get_profile_store().list()
+
+
+def token_valid(token: Optional[str]) -> bool:
+    """Profiling is disabled entirely while PROFILE_TOKEN is unset"""
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+# One request profile at a time per process: samples cover every thread, so
+# overlapping profiles would only repeat each other
+_request_profile_lock = threading.Lock()
+_active_request_profile: Optional[SamplingProfiler] = None
+
+
+def try_begin_request_profile() -> Optional[SamplingProfiler]:
+    """Start sampling for a request, or None while another request is being profiled"""
+    global _active_request_profile
+    with _request_profile_lock:
+        if _active_request_profile is not None and _active_request_profile.running:
+            return None
+        _active_request_profile = SamplingProfiler().start()
+        return _active_request_profile
+
+
+def end_request_profile(profile_id: str, profiler: SamplingProfiler) -> None:
+    global _active_request_profile
+    try:
+        profiler.stop()
+        save_profile(profile_id, profiler)
+        logger.info(f"Profile {profile_id}: {profiler.samples} samples over {profiler.elapsed:.3f}s")
+    except Exception as e:
+        logger.warning(f"Could not save profile {profile_id}: {str(e)}")
+    finally:
+        with _request_profile_lock:
+            if _active_request_profile is profiler:
+                _active_request_profile = None
+
+
+# Celery: task id -> running profiler (prefork children run one task at a time)
+_task_profiles: Dict[str, SamplingProfiler] = {}
+
+
+def _task_wants_profile(task) -> bool:
+    if task.name in PROFILE_TASKS:
+        return True
+    # Workers expose custom message headers as request attributes; eager runs keep them in .headers
+    headers = getattr(task.request, "headers", None) or {}
+    return bool(getattr(task.request, "profile", False) or headers.get("profile"))
+
+
+def install_celery_hooks() -> None:
+    """Profile flagged tasks in the thread that executes them"""
+    from celery.signals import task_postrun, task_prerun
+
+    @task_prerun.connect(weak=False)
+    def _start_task_profile(task_id=None, task=None, **kwargs):
+        if task is not None and _task_wants_profile(task):
+            _task_profiles[task_id] = SamplingProfiler([threading.get_ident()]).start()
+
+    @task_postrun.connect(weak=False)
+    def _stop_task_profile(task_id=None, task=None, **kwargs):
+        profiler = _task_profiles.pop(task_id, None)
+        if profiler is None:
+            return
+        # Named after the task id so a task's profile can be found from its result
+        try:
+            profile_id = f"task-{uuid.UUID(str(task_id)).hex}"
+        except ValueError:
+            profile_id = new_profile_id("task")
+        try:
+            save_profile(profile_id, profiler.stop())
+            logger.info(f"Profiled {task.name} [{task_id}]: {profiler.samples} samples as {profile_id}")
+        except Exception as e:
+            logger.warning(f"Could not save profile for {task.name} [{task_id}]: {str(e)}")
@@ -0,0 +1,551 @@
+"""
+Streaming quantile sketches for rating and numeric answers
+
+Numeric answers feed a t-digest per question; ratings, which take a handful of
+integer values, keep an exact histogram instead. Both exist per UTC day bucket
+and as an all-time rollup, so statistics read one key per question however
+many answers there are, and windows of N days merge N buckets.
+
+Submissions append values to a small pending list per day bucket, and the
+bucket to a per-question set; once a list passes COMPACT_THRESHOLD (or on
+read) it is folded into the digests under a lock. Digests are mergeable, so
+buckets, shards and rebuilds combine freely.
+"""
+import logging
+import math
+import os
+import struct
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .backend_models import Answer, Question, Response
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+RATING_QUESTION_TYPES = ("rating",)
+NUMERIC_QUESTION_TYPES = ("number", "numeric", "slider")
+COMPRESSION = int(os.getenv("QUANTILE_COMPRESSION", "100"))
+COMPACT_THRESHOLD = int(os.getenv("QUANTILE_COMPACT_THRESHOLD", "256"))
+# Day buckets older than this expire; the all-time rollup is kept
+BUCKET_TTL_DAYS = int(os.getenv("QUANTILE_BUCKET_TTL_DAYS", "400"))
+HISTOGRAM_BINS = 10
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+_HEADER = struct.Struct("<2sHdddI")
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl) with the arcsine scale function
+
+    Holds at most ~compression centroids; quantile error is smallest at the
+    tails, where p90/p99 live.
+    """
+
+    def __init__(self, compression: int = COMPRESSION):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+        self._buffer: List[Tuple[float, float]] = []
+
+    @property
+    def count(self) -> float:
+        return sum(self.weights) + sum(w for _, w in self._buffer)
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        value = float(value)
+        self._buffer.append((value, weight))
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sum += value * weight
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def update(self, values: Iterable[float]) -> "TDigest":
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._compress()
+        self._buffer.extend(zip(other.means, other.weights))
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sum += other.sum
+        self._compress()
+        return self
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inv(self, k: float) -> float:
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in items)
+
+        means, weights = [], []
+        cur_mean, cur_weight = items[0]
+        done = 0.0
+        limit = self._k_inv(self._k(0.0) + 1) * total
+        for mean, weight in items[1:]:
+            if done + cur_weight + weight <= limit:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                means.append(cur_mean)
+                weights.append(cur_weight)
+                done += cur_weight
+                limit = self._k_inv(self._k(done / total) + 1) * total
+                cur_mean, cur_weight = mean, weight
+        means.append(cur_mean)
+        weights.append(cur_weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.weights:
+            return None
+        if len(self.weights) == 1:
+            return self.means[0]
+        total = sum(self.weights)
+        target = q * total
+        # Centroid i covers [cumulative, cumulative + w); its mean sits at the middle
+        cumulative = 0.0
+        prev_center, prev_mean = 0.0, self.min
+        for mean, weight in zip(self.means, self.weights):
+            center = cumulative + weight / 2
+            if target < center:
+                span = center - prev_center
+                t = (target - prev_center) / span if span else 0.0
+                return prev_mean + t * (mean - prev_mean)
+            prev_center, prev_mean = center, mean
+            cumulative += weight
+        span = total - prev_center
+        t = (target - prev_center) / span if span else 1.0
+        return prev_mean + min(1.0, t) * (self.max - prev_mean)
+
+    def cdf(self, value: float) -> float:
+        self._compress()
+        if not self.weights or value < self.min:
+            return 0.0
+        if value >= self.max:
+            return 1.0
+        total = sum(self.weights)
+        points = [self.min] + self.means + [self.max]
+        ranks = [0.0]
+        cumulative = 0.0
+        for weight in self.weights:
+            ranks.append(cumulative + weight / 2)
+            cumulative += weight
+        ranks.append(total)
+        i = max(1, bisect_left(points, value))
+        x0, x1 = points[i - 1], points[i]
+        t = (value - x0) / (x1 - x0) if x1 > x0 else 1.0
+        return (ranks[i - 1] + t * (ranks[i] - ranks[i - 1])) / total
+
+    def to_bytes(self) -> bytes:
+        """12 bytes per centroid plus a 32-byte header"""
+        self._compress()
+        n = len(self.means)
+        return (
+            _HEADER.pack(b"T1", self.compression, self.min, self.max, self.sum, n)
+            + struct.pack(f"<{n}d", *self.means)
+            + struct.pack(f"<{n}I", *(int(round(w)) for w in self.weights))
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        magic, compression, minimum, maximum, total_sum, n = _HEADER.unpack_from(data)
+        if magic != b"T1":
+            raise ValueError("Not a serialized t-digest")
+        digest = cls(compression)
+        offset = _HEADER.size
+        digest.means = list(struct.unpack_from(f"<{n}d", data, offset))
+        digest.weights = [float(w) for w in struct.unpack_from(f"<{n}I", data, offset + 8 * n)]
+        digest.min, digest.max, digest.sum = minimum, maximum, total_sum
+        return digest
+
+
+def histogram_quantile(histogram: Dict[float, int], q: float) -> Optional[float]:
+    """Exact quantile (nearest rank) from a value -> count histogram"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = max(1, math.ceil(q * total))
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen >= rank:
+            return value
+    return max(histogram)
+
+
+def answer_value(answer_text: Optional[str], answer_data) -> Optional[float]:
+    """Numeric value of a stored rating/number answer, if it has one"""
+    raw = answer_data.get("value") if isinstance(answer_data, dict) else answer_data
+    if raw is None or isinstance(raw, (list, dict, bool)):
+        raw = answer_text
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _bucket(day: date) -> str:
+    return day.strftime("%Y%m%d")
+
+
+def _number(raw) -> float:
+    value = float(raw.decode() if isinstance(raw, bytes) else raw)
+    return int(value) if value.is_integer() else value
+
+
+class QuantileSketches:
+    """
+    Per-question digests and rating histograms, all-time and per day
+
+    Without a Redis client the state is kept in-process, which is enough for
+    a single worker or a benchmark run.
+    """
+
+    def __init__(self, redis_client=None, compression: int = COMPRESSION):
+        self.redis = redis_client
+        self.compression = compression
+        self._digests: Dict[str, TDigest] = {}
+        self._histograms: Dict[str, Dict[float, int]] = {}
+
+    @staticmethod
+    def _key(kind: str, question_id: int, bucket: str = "all") -> str:
+        return f"qsketch:{kind}:{question_id}:{bucket}"
+
+    def _lock(self, question_id: int, blocking_timeout: float = 0):
+        return self.redis.lock(self._key("lock", question_id), timeout=10, blocking_timeout=blocking_timeout)
+
+    def record(self, question_id: int, question_type: str, value: Optional[float],
+               when: Optional[datetime] = None) -> None:
+        """Add one answer; call after the response is committed"""
+        bucket = _bucket((when or datetime.utcnow()).date())
+        try:
+            value = _number(value)
+            if question_type in RATING_QUESTION_TYPES:
+                self._add_histogram(question_id, {bucket: {value: 1}})
+            else:
+                self._add_pending(question_id, bucket, [value])
+        except Exception as e:
+            # The sketch under-counts until the next rebuild
+            logger.warning(f"Could not record answer for question {question_id}: {str(e)}")
+
+    def _add_histogram(self, question_id: int, buckets: Dict[str, Dict[float, int]]) -> None:
+        if self.redis is None:
+            for bucket, counts in buckets.items():
+                for key in (self._key("hist", question_id), self._key("hist", question_id, bucket)):
+                    histogram = self._histograms.setdefault(key, {})
+                    for value, count in counts.items():
+                        histogram[value] = histogram.get(value, 0) + count
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for bucket, counts in buckets.items():
+            day_key = self._key("hist", question_id, bucket)
+            for value, count in counts.items():
+                pipe.hincrby(self._key("hist", question_id), str(value), count)
+                pipe.hincrby(day_key, str(value), count)
+            pipe.expire(day_key, BUCKET_TTL_DAYS * 86400)
+        pipe.execute()
+
+    def _add_pending(self, question_id: int, bucket: str, values: Sequence[float]) -> None:
+        if self.redis is None:
+            for key in (self._key("digest", question_id), self._key("digest", question_id, bucket)):
+                self._digests.setdefault(key, TDigest(self.compression)).update(values)
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.rpush(self._key("pending", question_id, bucket), *values)
+        pipe.sadd(self._key("pending-buckets", question_id), bucket)
+        length, _ = pipe.execute()
+        if length >= COMPACT_THRESHOLD:
+            self.compact(question_id, bucket)
+
+    def compact(self, question_id: int, bucket: str) -> None:
+        """Fold a day's pending values into its digest and the all-time digest"""
+        if self.redis is None:
+            return
+        lock = self._lock(question_id)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            pending = self._key("pending", question_id, bucket)
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.lrange(pending, 0, -1)
+            pipe.delete(pending)
+            pipe.srem(self._key("pending-buckets", question_id), bucket)
+            values, _, _ = pipe.execute()
+            if not values:
+                return
+            values = [float(v) for v in values]
+            day_key, all_key = self._key("digest", question_id, bucket), self._key("digest", question_id)
+            stored = self.redis.mget(day_key, all_key)
+            pipe = self.redis.pipeline(transaction=True)
+            for key, raw in zip((day_key, all_key), stored):
+                digest = TDigest.from_bytes(raw) if raw else TDigest(self.compression)
+                pipe.set(key, digest.update(values).to_bytes())
+            pipe.expire(day_key, BUCKET_TTL_DAYS * 86400)
+            pipe.execute()
+        finally:
+            lock.release()
+
+    def _pending_buckets(self, question_id: int, buckets: Optional[List[str]]) -> List[str]:
+        if buckets is not None:
+            return buckets
+        return [
+            b.decode() if isinstance(b, bytes) else b
+            for b in self.redis.smembers(self._key("pending-buckets", question_id))
+        ]
+
+    def digest(self, question_id: int, buckets: Optional[List[str]] = None) -> TDigest:
+        """All-time digest, or the merge of the given day buckets"""
+        keys = [self._key("digest", question_id, b) for b in buckets] if buckets else [self._key("digest", question_id)]
+        merged = TDigest(self.compression)
+        if self.redis is None:
+            for key in keys:
+                if key in self._digests:
+                    merged.merge(self._digests[key])
+            return merged
+        for bucket in self._pending_buckets(question_id, buckets):
+            self.compact(question_id, bucket)
+        for raw in self.redis.mget(keys):
+            if raw:
+                merged.merge(TDigest.from_bytes(raw))
+        return merged
+
+    def histogram(self, question_id: int, buckets: Optional[List[str]] = None) -> Dict[float, int]:
+        keys = [self._key("hist", question_id, b) for b in buckets] if buckets else [self._key("hist", question_id)]
+        merged: Dict[float, int] = {}
+        for key in keys:
+            if self.redis is None:
+                counts = self._histograms.get(key, {}).items()
+            else:
+                counts = self.redis.hgetall(key).items()
+            for value, count in counts:
+                value = _number(value)
+                merged[value] = merged.get(value, 0) + int(count)
+        return merged
+
+    def summary(self, question_id: int, question_type: str, days: Optional[int] = None,
+                quantiles: Sequence[float] = DEFAULT_QUANTILES) -> Dict[str, object]:
+        """Count, mean, quantiles and histogram for one question"""
+        buckets = None
+        if days:
+            today = datetime.utcnow().date()
+            buckets = [_bucket(today - timedelta(days=i)) for i in range(days)]
+
+        if question_type in RATING_QUESTION_TYPES:
+            histogram = self.histogram(question_id, buckets)
+            count = sum(histogram.values())
+            return {
+                "count": count,
+                "mean": sum(v * c for v, c in histogram.items()) / count if count else None,
+                "percentiles": {f"p{round(q * 100)}": histogram_quantile(histogram, q) for q in quantiles},
+                "histogram": {str(v): histogram[v] for v in sorted(histogram)},
+                "method": "histogram",
+            }
+
+        digest = self.digest(question_id, buckets)
+        count = int(digest.count)
+        histogram = {}
+        if count and digest.max > digest.min:
+            width = (digest.max - digest.min) / HISTOGRAM_BINS
+            edges = [digest.min + i * width for i in range(HISTOGRAM_BINS + 1)]
+            cdf = [digest.cdf(e) for e in edges[:-1]] + [1.0]
+            histogram = {
+                f"{edges[i]:g}-{edges[i + 1]:g}": round((cdf[i + 1] - cdf[i]) * count)
+                for i in range(HISTOGRAM_BINS)
+            }
+        elif count:
+            histogram = {f"{digest.min:g}": count}
+        return {
+            "count": count,
+            "mean": digest.sum / count if count else None,
+            "percentiles": {f"p{round(q * 100)}": digest.quantile(q) for q in quantiles},
+            "histogram": histogram,
+            "method": "tdigest",
+        }
+
+    def _question_keys(self, question_id: int) -> List[str]:
+        """Live keys of a question, leaving out its lock and rebuild keys"""
+        keys = (k.decode() if isinstance(k, bytes) else k
+                for k in self.redis.scan_iter(f"qsketch:*:{question_id}:*", count=500))
+        return [k for k in keys if k != self._key("lock", question_id) and not k.endswith(":rebuild")]
+
+    def reset(self, question_id: int) -> None:
+        if self.redis is None:
+            for store in (self._digests, self._histograms):
+                for key in [k for k in store if k.split(":")[2] == str(question_id)]:
+                    del store[key]
+            return
+        lock = self._lock(question_id, blocking_timeout=10)
+        if not lock.acquire(blocking=True):
+            raise RuntimeError(f"Could not lock the quantile sketches of question {question_id}")
+        try:
+            keys = self._question_keys(question_id)
+            if keys:
+                self.redis.delete(*keys)
+        finally:
+            lock.release()
+
+    def rebuild(self, db: Session, survey_id: int, batch_size: int = 10000) -> int:
+        """
+        Recompute every rating/numeric sketch of a survey from the answers table
+
+        Answers are streamed and folded per question and day, so memory stays
+        bounded by the number of (question, day) digests, not answers. Answers
+        up to the current max response id are written under temporary keys and
+        swapped in under each question's compaction lock, dropping its pending
+        values; answers of responses committed during the scan are then
+        recorded as usual. Returns the answers scanned.
+        """
+        questions = {
+            q.id: q.question_type for q in db.query(Question.id, Question.question_type).filter(
+                Question.survey_id == survey_id,
+                Question.question_type.in_(RATING_QUESTION_TYPES + NUMERIC_QUESTION_TYPES),
+            )
+        }
+        if not questions:
+            return 0
+        max_id = db.query(func.max(Response.id)).filter(Response.survey_id == survey_id).scalar() or 0
+
+        def rows(after: int, upto: Optional[int] = None):
+            query = db.query(Answer.question_id, Answer.answer_text, Answer.answer_data, Response.submitted_at).join(
+                Response, Answer.response_id == Response.id
+            ).filter(Answer.question_id.in_(list(questions)), Response.id > after)
+            if upto is not None:
+                query = query.filter(Response.id <= upto)
+            return query.execution_options(yield_per=batch_size)
+
+        histograms: Dict[int, Dict[str, Dict[float, int]]] = {}
+        digests: Dict[int, Dict[str, TDigest]] = {}
+        scanned = 0
+        for question_id, answer_text, answer_data, submitted_at in rows(0, max_id):
+            value = answer_value(answer_text, answer_data)
+            if value is None:
+                continue
+            scanned += 1
+            value = _number(value)
+            bucket = _bucket(submitted_at.date())
+            if questions[question_id] in RATING_QUESTION_TYPES:
+                counts = histograms.setdefault(question_id, {}).setdefault(bucket, {})
+                counts[value] = counts.get(value, 0) + 1
+            else:
+                digests.setdefault(question_id, {}).setdefault(bucket, TDigest(self.compression)).add(value)
+
+        for question_id in questions:
+            self._replace(question_id, histograms.get(question_id, {}), digests.get(question_id, {}))
+
+        # Answers committed while scanning went to the keys that were just replaced
+        pending: Dict[Tuple[int, str], List[float]] = {}
+        for question_id, answer_text, answer_data, submitted_at in rows(max_id):
+            value = answer_value(answer_text, answer_data)
+            if value is None:
+                continue
+            scanned += 1
+            bucket = _bucket(submitted_at.date())
+            if questions[question_id] in RATING_QUESTION_TYPES:
+                self._add_histogram(question_id, {bucket: {_number(value): 1}})
+            else:
+                pending.setdefault((question_id, bucket), []).append(_number(value))
+        for (question_id, bucket), values in pending.items():
+            self._add_pending(question_id, bucket, values)
+        logger.info(f"Rebuilt quantile sketches for survey {survey_id} from {scanned} answers")
+        return scanned
+
+    def _replace(self, question_id: int, histograms: Dict[str, Dict[float, int]],
+                 digests: Dict[str, TDigest]) -> None:
+        """Swap a question's sketches for rebuilt ones, dropping its pending values"""
+        if self.redis is None:
+            self.reset(question_id)
+            if histograms:
+                self._add_histogram(question_id, histograms)
+            total = TDigest(self.compression)
+            for bucket, digest in digests.items():
+                total.merge(digest)
+                self._digests[self._key("digest", question_id, bucket)] = digest
+            if digests:
+                self._digests[self._key("digest", question_id)] = total
+            return
+
+        ttl = BUCKET_TTL_DAYS * 86400
+        built = []
+        pipe = self.redis.pipeline(transaction=False)
+        if histograms:
+            overall: Dict[float, int] = {}
+            for bucket, counts in histograms.items():
+                key = f"{self._key('hist', question_id, bucket)}:rebuild"
+                pipe.delete(key)
+                pipe.hset(key, mapping={str(v): c for v, c in counts.items()})
+                pipe.expire(key, ttl)
+                built.append(key)
+                for value, count in counts.items():
+                    overall[value] = overall.get(value, 0) + count
+            key = f"{self._key('hist', question_id)}:rebuild"
+            pipe.delete(key)
+            pipe.hset(key, mapping={str(v): c for v, c in overall.items()})
+            built.append(key)
+        if digests:
+            total = TDigest(self.compression)
+            for bucket, digest in digests.items():
+                total.merge(digest)
+                key = f"{self._key('digest', question_id, bucket)}:rebuild"
+                pipe.set(key, digest.to_bytes(), ex=ttl)
+                built.append(key)
+            key = f"{self._key('digest', question_id)}:rebuild"
+            pipe.set(key, total.to_bytes())
+            built.append(key)
+        pipe.execute()
+
+        # Compaction read-modify-writes the digests, so the swap must not interleave with it
+        lock = self._lock(question_id, blocking_timeout=10)
+        if not lock.acquire(blocking=True):
+            if built:
+                self.redis.delete(*built)
+            raise RuntimeError(f"Could not lock the quantile sketches of question {question_id}")
+        try:
+            swap = self.redis.pipeline(transaction=True)
+            stale = self._question_keys(question_id)
+            if stale:
+                swap.delete(*stale)
+            for key in built:
+                swap.rename(key, key[:-len(":rebuild")])
+            swap.execute()
+        finally:
+            lock.release()
+
+
+_quantiles: Optional[QuantileSketches] = None
+
+
+def get_quantile_sketches() -> QuantileSketches:
+    global _quantiles
+    if _quantiles is None:
+        import redis
+
+        _quantiles = QuantileSketches(redis.from_url(REDIS_URL))
+    return _quantiles
+
+
+def set_quantile_sketches(sketches: Optional[QuantileSketches]) -> None:
+    """Install sketches, e.g. in-process ones for benchmarks"""
+    global _quantiles
+    _quantiles = sketches
@@ -0,0 +1,166 @@
+"""
+Server-push experiment results
+
+Ingestion publishes an event on `experiment-updates:<experiment_id>` whenever it
+writes new metrics for an experiment. Each API process holds a single Redis
+pattern subscription; when an experiment changes its results are recomputed
+once and fanned out to every client streaming that experiment.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+UPDATES_CHANNEL_PREFIX = "experiment-updates:"
+# How long a new stream waits for the subscription before going ahead without it
+SUBSCRIBE_TIMEOUT_SEC = float(os.getenv("RESULTS_SUBSCRIBE_TIMEOUT_SEC", "2"))
+
+_publisher: Optional[redis.Redis] = None
+
+
+def publish_experiment_update(experiment_id: str) -> None:
+    """Best-effort notification that an experiment's metrics changed"""
+    global _publisher
+    try:
+        if _publisher is None:
+            _publisher = redis.from_url(REDIS_URL)
+        _publisher.publish(
+            f"{UPDATES_CHANNEL_PREFIX}{experiment_id}", json.dumps({"ts": time.time()})
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish update for experiment {experiment_id}: {str(e)}")
+
+
+# (experiment_id, method) identifies one results payload
+StreamKey = Tuple[str, str]
+
+
+class ResultsBroadcaster:
+    """
+    One pub/sub subscription per process, fanned out to many clients
+
+    Each client gets a queue holding at most one payload: a slow client only
+    ever sees the newest results, never a backlog.
+    """
+
+    def __init__(self, compute: Callable[[str, str], Awaitable[dict]], redis_url: str = REDIS_URL):
+        self.compute = compute
+        self.redis_url = redis_url
+        self._clients: Dict[StreamKey, Set[asyncio.Queue]] = {}
+        self._pending: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+        self._redis = None
+
+    async def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def subscribe(self, experiment_id: str, method: str) -> asyncio.Queue:
+        """
+        Register a client and wait until updates are being received
+
+        Compute the initial payload only after this returns: an update published
+        in between then reaches the queue instead of being lost.
+        """
+        await self.start()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._clients.setdefault((experiment_id, method), set()).add(queue)
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout=SUBSCRIBE_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            logger.warning(f"Results subscription not ready; experiment {experiment_id} may miss updates")
+        return queue
+
+    def unsubscribe(self, experiment_id: str, method: str, queue: asyncio.Queue) -> None:
+        clients = self._clients.get((experiment_id, method))
+        if clients is not None:
+            clients.discard(queue)
+            if not clients:
+                del self._clients[(experiment_id, method)]
+
+    @property
+    def client_count(self) -> int:
+        return sum(len(c) for c in self._clients.values())
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, payload: dict) -> None:
+        # Replace whatever the client has not consumed yet
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+    async def _fan_out(self, experiment_id: str) -> None:
+        """Recompute once per (experiment, method) with listeners and push to all of them"""
+        try:
+            while True:
+                self._dirty.discard(experiment_id)
+                for (key_id, method), clients in list(self._clients.items()):
+                    if key_id != experiment_id or not clients:
+                        continue
+                    payload = await self.compute(experiment_id, method)
+                    for queue in list(clients):
+                        self._offer(queue, payload)
+                # Events that arrived mid-recompute are folded into one more pass
+                if experiment_id not in self._dirty:
+                    break
+        except Exception as e:
+            logger.error(f"Error pushing results for experiment {experiment_id}: {str(e)}")
+        finally:
+            self._pending.discard(experiment_id)
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        while True:
+            try:
+                if self._redis is not None:
+                    await self._redis.aclose()
+                self._redis = aioredis.from_url(self.redis_url)
+                pubsub = self._redis.pubsub()
+                await pubsub.psubscribe(f"{UPDATES_CHANNEL_PREFIX}*")
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    experiment_id = channel[len(UPDATES_CHANNEL_PREFIX):]
+                    if not any(key_id == experiment_id for key_id, _ in self._clients):
+                        continue
+                    if experiment_id in self._pending:
+                        self._dirty.add(experiment_id)
+                        continue
+                    self._pending.add(experiment_id)
+                    task = asyncio.create_task(self._fan_out(experiment_id))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except asyncio.CancelledError:
+                self._subscribed.clear()
+                raise
+            except Exception as e:
+                self._subscribed.clear()
+                logger.warning(f"Results subscription lost ({str(e)}), reconnecting")
+                await asyncio.sleep(1)
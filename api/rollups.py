@@ -0,0 +1,212 @@
+"""
+Channel rollups
+
+Pre-aggregated tables for questions that span a channel's experiments, so
+readers never scan metrics_agg:
+
+    channel_variant_daily        channel x date x variant: that day's increments of
+                                 the cumulative counters (the first stored day of a
+                                 variant counts everything up to it)
+    channel_experiment_outcomes  one row per experiment: its control (first variant)
+                                 against the leading variant on the primary metric,
+                                 with relative lift and the two-proportion z-test
+
+Both are upserted from metrics_agg. After each ingest or backfill only the
+touched videos are refreshed, and only from the earliest date written
+onwards. Videos without a channel_id are left out.
+
+    python -m api.rollups                      refresh today for every channel
+    python -m api.rollups --since 2026-01-01   rebuild history (e.g. after migrating)
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from .models import ChannelExperimentOutcome
+from .statistics import METRIC_COUNTS, calculate_z_tests
+
+logger = logging.getLogger(__name__)
+
+DAILY_COUNTERS = ("views", "likes", "impressions", "clicks", "watch_time_sec")
+# Outcomes upserted per statement on a full rebuild
+OUTCOME_BATCH = 1000
+
+# Counters only grow; a lower reading (API correction) counts as no traffic that day
+REFRESH_DAILY_SQL = f"""
+    INSERT INTO channel_variant_daily (variant_id, date, channel_id, video_id, variant_key,
+                                       {", ".join(DAILY_COUNTERS)}, updated_at)
+    SELECT m.variant_id, m.date, vid.channel_id, m.video_id, v.variant_key,
+           {", ".join(f"GREATEST(coalesce(m.{c}, 0) - coalesce(p.{c}, 0), 0)" for c in DAILY_COUNTERS)},
+           now()
+    FROM metrics_agg m
+    JOIN videos vid ON vid.id = m.video_id
+    JOIN variants v ON v.id = m.variant_id
+    LEFT JOIN LATERAL (
+        SELECT {", ".join(DAILY_COUNTERS)} FROM metrics_agg p
+        WHERE p.video_id = m.video_id AND p.variant_id = m.variant_id AND p.date < m.date
+        ORDER BY p.date DESC
+        LIMIT 1
+    ) p ON true
+    WHERE vid.channel_id IS NOT NULL
+      AND m.date >= :since
+      AND (CAST(:video_ids AS uuid[]) IS NULL OR m.video_id = ANY(CAST(:video_ids AS uuid[])))
+    ON CONFLICT (variant_id, date) DO UPDATE SET
+        channel_id = EXCLUDED.channel_id,
+        variant_key = EXCLUDED.variant_key,
+        {", ".join(f"{c} = EXCLUDED.{c}" for c in DAILY_COUNTERS)},
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Latest cumulative counters per variant, variants in the order the results endpoints use
+OUTCOME_INPUTS_SQL = """
+    SELECT e.id, vid.channel_id, e.video_id, e.name, e.status, e.primary_metric, e.start_at,
+           v.id, v.variant_key, v.title, v.thumbnail_url,
+           l.date, l.views, l.likes, l.impressions, l.clicks
+    FROM experiments e
+    JOIN videos vid ON vid.id = e.video_id
+    LEFT JOIN variants v ON v.video_id = e.video_id
+    LEFT JOIN LATERAL (
+        SELECT m.date, m.views, m.likes, m.impressions, m.clicks FROM metrics_agg m
+        WHERE m.video_id = v.video_id AND m.variant_id = v.id
+        ORDER BY m.date DESC
+        LIMIT 1
+    ) l ON true
+    WHERE vid.channel_id IS NOT NULL
+      AND (CAST(:video_ids AS uuid[]) IS NULL OR e.video_id = ANY(CAST(:video_ids AS uuid[])))
+    ORDER BY e.id, v.created_at, v.variant_key
+"""
+
+
+def _outcome_rows(rows) -> List[Dict[str, object]]:
+    """One outcome per experiment from OUTCOME_INPUTS_SQL rows"""
+    experiments: Dict[str, Dict[str, object]] = {}
+    for (experiment_id, channel_id, video_id, name, status, primary_metric, start_at,
+         variant_id, variant_key, title, thumbnail_url, as_of, views, likes, impressions, clicks) in rows:
+        entry = experiments.get(experiment_id)
+        if entry is None:
+            entry = experiments[experiment_id] = {
+                "experiment_id": experiment_id, "channel_id": channel_id, "video_id": video_id,
+                "name": name, "status": status, "primary_metric": primary_metric, "start_at": start_at,
+                "variants": 0, "as_of": None, "_measured": [],
+            }
+        if variant_id is None:
+            continue
+        entry["variants"] += 1
+        if as_of is None:
+            continue
+        counts = {"views": views or 0, "likes": likes or 0, "impressions": impressions or 0, "clicks": clicks or 0}
+        entry["as_of"] = max(entry["as_of"] or as_of, as_of)
+        entry["_measured"].append((variant_id, variant_key, title, thumbnail_url, counts))
+
+    outcomes = []
+    for entry in experiments.values():
+        measured = entry.pop("_measured")
+        outcome = dict(entry, **{
+            "control_key": None, "control_successes": None, "control_trials": None,
+            "leader_variant_id": None, "leader_key": None, "leader_title": None,
+            "leader_thumbnail_url": None, "leader_successes": None, "leader_trials": None,
+            "control_rate": None, "leader_rate": None, "lift": None, "z_statistic": None, "p_value": None,
+        })
+        outcomes.append(outcome)
+        if entry["primary_metric"] not in METRIC_COUNTS or not measured:
+            continue
+
+        successes_col, trials_col = METRIC_COUNTS[entry["primary_metric"]]
+        rate = lambda counts: counts[successes_col] / counts[trials_col] if counts[trials_col] > 0 else None
+
+        _, control_key, _, _, control = measured[0]
+        outcome.update(control_key=control_key, control_successes=control[successes_col],
+                       control_trials=control[trials_col], control_rate=rate(control))
+        challengers = [m for m in measured[1:] if rate(m[4]) is not None]
+        if not challengers:
+            continue
+        variant_id, variant_key, title, thumbnail_url, leader = max(challengers, key=lambda m: rate(m[4]))
+        outcome.update(leader_variant_id=variant_id, leader_key=variant_key, leader_title=title,
+                       leader_thumbnail_url=thumbnail_url, leader_successes=leader[successes_col],
+                       leader_trials=leader[trials_col], leader_rate=rate(leader))
+        if outcome["control_rate"]:
+            outcome["lift"] = (outcome["leader_rate"] - outcome["control_rate"]) / outcome["control_rate"]
+
+    # One vectorized z-test over every experiment with a control and a leader;
+    # the leader is side A, so z is positive when it beats the control
+    tested = [o for o in outcomes if o["leader_trials"] and o["control_trials"]]
+    if tested:
+        tests = calculate_z_tests(
+            [o["leader_successes"] for o in tested], [o["leader_trials"] for o in tested],
+            [o["control_successes"] for o in tested], [o["control_trials"] for o in tested]
+        )
+        for i, outcome in enumerate(tested):
+            outcome["z_statistic"] = float(tests["z_statistic"][i])
+            outcome["p_value"] = float(tests["p_value"][i])
+    return outcomes
+
+
+def refresh_outcomes(db: Session, video_ids: Optional[Sequence[str]] = None) -> int:
+    """Recompute the outcomes of experiments on `video_ids` (all when None); returns rows upserted"""
+    rows = db.execute(text(OUTCOME_INPUTS_SQL), {"video_ids": list(video_ids) if video_ids is not None else None})
+    outcomes = _outcome_rows(rows.all())
+    for start in range(0, len(outcomes), OUTCOME_BATCH):
+        stmt = insert(ChannelExperimentOutcome).values(outcomes[start:start + OUTCOME_BATCH])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["experiment_id"],
+            set_={
+                **{c: stmt.excluded[c] for c in outcomes[0] if c != "experiment_id"},
+                "updated_at": func.now(),
+            }
+        )
+        db.execute(stmt)
+    return len(outcomes)
+
+
+def refresh_rollups(db: Session, video_ids: Optional[Sequence[str]] = None,
+                    since: Optional[date] = None) -> Dict[str, object]:
+    """
+    Bring both rollup tables up to date and commit
+
+    Args:
+        db: Session on the primary
+        video_ids: Videos whose metrics changed; None refreshes every video
+        since: First metrics_agg date that changed (default: today)
+    """
+    since = since or date.today()
+    started = time.perf_counter()
+    params = {"since": since, "video_ids": list(video_ids) if video_ids is not None else None}
+    daily = db.execute(text(REFRESH_DAILY_SQL), params).rowcount
+    outcomes = refresh_outcomes(db, video_ids)
+    db.commit()
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Rollups refreshed from {since} for {'all' if video_ids is None else len(video_ids)} videos: "
+        f"{daily} daily rows, {outcomes} outcomes in {elapsed:.2f}s"
+    )
+    return {"since": since.isoformat(), "daily_rows": daily, "outcomes": outcomes, "elapsed_sec": round(elapsed, 3)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Refresh the channel rollup tables from metrics_agg")
+    parser.add_argument("--since", type=date.fromisoformat, help="First date to rebuild (default: today)")
+    parser.add_argument("--video", action="append", dest="video_ids", help="Limit to a video id (repeatable)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(refresh_rollups(db, args.video_ids, args.since), indent=2))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Probabilistic sketches for survey responses
+
+Per survey, Redis keeps:
+
+    survey:<id>:respondents   HyperLogLog of respondent identities (PFADD / PFCOUNT)
+    survey:<id>:submitted     Bloom filter bitmap screening repeat submissions
+
+The Bloom filter never misses a previous submitter, so a "not seen" answer
+skips the database entirely; "maybe seen" is confirmed with an indexed lookup.
+Both sketches are derived data and can be rebuilt from the responses table.
+
+    python -m api.sketches rebuild [survey_id ...]
+"""
+import hashlib
+import logging
+import math
+import os
+import sys
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import Text, case, cast, distinct, func, literal
+from sqlalchemy.orm import Session
+
+from .backend_models import Response, Survey
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Sized per survey: ~120 KB of bitmap holds 100k respondents at a 1% false-positive rate
+BLOOM_CAPACITY = int(os.getenv("SKETCH_BLOOM_CAPACITY", "100000"))
+BLOOM_ERROR_RATE = float(os.getenv("SKETCH_BLOOM_ERROR_RATE", "0.01"))
+DUPLICATES_KEY = "sketch:duplicates"
+
+
+def bloom_parameters(capacity: int, error_rate: float) -> tuple:
+    """(bits, hash count) for a Bloom filter of `capacity` items at `error_rate`"""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+def respondent_identity(user_id: Optional[int], ip_address: Optional[str],
+                        user_agent: Optional[str]) -> str:
+    """Signed-in users are counted by id, anonymous ones by IP and user agent"""
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"anon:{ip_address or ''}|{user_agent or ''}"
+
+
+def _respondents_key(survey_id: int) -> str:
+    return f"survey:{survey_id}:respondents"
+
+
+def _submitted_key(survey_id: int) -> str:
+    return f"survey:{survey_id}:submitted"
+
+
+class SurveySketches:
+    """
+    HyperLogLog and Bloom filter per survey
+
+    Without a Redis client the state is kept in-process (exact sets), which is
+    enough for a single worker or a benchmark run.
+    """
+
+    def __init__(self, redis_client=None, capacity: int = BLOOM_CAPACITY,
+                 error_rate: float = BLOOM_ERROR_RATE):
+        self.redis = redis_client
+        self.bits, self.hashes = bloom_parameters(capacity, error_rate)
+        self._respondents: Dict[int, Set[str]] = {}
+        self._submitted: Dict[int, Set[str]] = {}
+        self._duplicates: Dict[int, int] = {}
+
+    def _positions(self, identity: str) -> List[int]:
+        # Double hashing (Kirsch-Mitzenmacher): k positions from one 128-bit digest
+        digest = hashlib.blake2b(identity.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def screen(self, survey_id: int, identity: str) -> bool:
+        """
+        Mark `identity` as having submitted; True if it may have submitted before
+
+        A Redis failure answers True so the caller falls back to the exact check.
+        """
+        if self.redis is None:
+            seen = identity in self._submitted.setdefault(survey_id, set())
+            self._submitted[survey_id].add(identity)
+            return seen
+        try:
+            # SETBIT returns the previous bit: all set means "maybe seen"
+            pipe = self.redis.pipeline(transaction=True)
+            for position in self._positions(identity):
+                pipe.setbit(_submitted_key(survey_id), position, 1)
+            return all(pipe.execute())
+        except Exception as e:
+            logger.warning(f"Bloom screen failed for survey {survey_id}: {str(e)}")
+            return True
+
+    def add_respondent(self, survey_id: int, identity: str) -> None:
+        """Count a stored response's respondent; call after commit"""
+        if self.redis is None:
+            self._respondents.setdefault(survey_id, set()).add(identity)
+            return
+        try:
+            self.redis.pfadd(_respondents_key(survey_id), identity)
+        except Exception as e:
+            # The count drifts low until the next rebuild
+            logger.warning(f"PFADD failed for survey {survey_id}: {str(e)}")
+
+    def record_duplicate(self, survey_id: int) -> None:
+        if self.redis is None:
+            self._duplicates[survey_id] = self._duplicates.get(survey_id, 0) + 1
+            return
+        try:
+            self.redis.hincrby(DUPLICATES_KEY, str(survey_id), 1)
+        except Exception:
+            pass
+
+    def duplicates_seen(self, survey_id: int) -> int:
+        """Submissions confirmed as repeats, whether flagged or rejected"""
+        if self.redis is None:
+            return self._duplicates.get(survey_id, 0)
+        try:
+            value = self.redis.hget(DUPLICATES_KEY, str(survey_id))
+        except Exception:
+            return 0
+        return int(value) if value else 0
+
+    def unique_respondents(self, survey_id: int) -> Optional[int]:
+        """HyperLogLog estimate, or None when the sketch does not exist yet"""
+        if self.redis is None:
+            respondents = self._respondents.get(survey_id)
+            return len(respondents) if respondents is not None else None
+        key = _respondents_key(survey_id)
+        if not self.redis.exists(key):
+            return None
+        return int(self.redis.pfcount(key))
+
+    def _add_rows(self, rows, respondents: str, submitted: str, batch_size: int) -> int:
+        scanned = 0
+        pipe = self.redis.pipeline(transaction=False)
+        batch: List[str] = []
+        for row in rows:
+            identity = respondent_identity(*row)
+            batch.append(identity)
+            for position in self._positions(identity):
+                pipe.setbit(submitted, position, 1)
+            scanned += 1
+            if len(batch) >= batch_size:
+                pipe.pfadd(respondents, *batch)
+                pipe.execute()
+                batch = []
+        if batch:
+            pipe.pfadd(respondents, *batch)
+        pipe.execute()
+        return scanned
+
+    def rebuild(self, db: Session, survey_id: int, batch_size: int = 10000) -> int:
+        """
+        Recompute both sketches from the responses table
+
+        Responses up to the current max id are loaded under temporary keys and
+        swapped in; responses committed during the scan are then re-added to
+        the live keys. Returns the rows scanned.
+        """
+        max_id = db.query(func.max(Response.id)).filter(Response.survey_id == survey_id).scalar() or 0
+
+        def rows(after: int, upto: Optional[int] = None):
+            query = db.query(Response.user_id, Response.ip_address, Response.user_agent).filter(
+                Response.survey_id == survey_id, Response.id > after
+            )
+            if upto is not None:
+                query = query.filter(Response.id <= upto)
+            return query.execution_options(yield_per=batch_size)
+
+        if self.redis is None:
+            identities = [respondent_identity(*row) for row in rows(0)]
+            self._respondents[survey_id] = set(identities)
+            self._submitted[survey_id] = set(identities)
+            return len(identities)
+
+        respondents, submitted = _respondents_key(survey_id), _submitted_key(survey_id)
+        tmp_respondents, tmp_submitted = f"{respondents}:rebuild", f"{submitted}:rebuild"
+        self.redis.delete(tmp_respondents, tmp_submitted)
+
+        scanned = self._add_rows(rows(0, max_id), tmp_respondents, tmp_submitted, batch_size)
+        swap = self.redis.pipeline(transaction=True)
+        # Make sure both keys exist even for a survey without responses
+        swap.pfadd(tmp_respondents)
+        swap.setbit(tmp_submitted, self.bits - 1, 0)
+        swap.rename(tmp_respondents, respondents)
+        swap.rename(tmp_submitted, submitted)
+        swap.execute()
+
+        # Submissions committed while scanning went to the keys that were just replaced
+        scanned += self._add_rows(rows(max_id), respondents, submitted, batch_size)
+        logger.info(f"Rebuilt sketches for survey {survey_id} from {scanned} responses")
+        return scanned
+
+
+def count_unique_respondents(db: Session, survey_id: int,
+                             sketches: Optional[SurveySketches] = None) -> Dict[str, object]:
+    """Unique respondents from the sketch, or an exact count if it was never built"""
+    sketches = sketches or get_sketches()
+    try:
+        estimate = sketches.unique_respondents(survey_id)
+    except Exception as e:
+        logger.warning(f"Could not read respondent sketch for survey {survey_id}: {str(e)}")
+        estimate = None
+    if estimate is not None:
+        return {"unique_respondents": estimate, "unique_respondents_method": "hyperloglog"}
+
+    identity = case(
+        (Response.user_id.isnot(None), literal("user:") + cast(Response.user_id, Text)),
+        else_=literal("anon:") + func.coalesce(Response.ip_address, "") + "|"
+        + func.coalesce(Response.user_agent, ""),
+    )
+    exact = db.query(func.count(distinct(identity))).filter(Response.survey_id == survey_id).scalar()
+    return {"unique_respondents": exact or 0, "unique_respondents_method": "exact"}
+
+
+_sketches: Optional[SurveySketches] = None
+
+
+def get_sketches() -> SurveySketches:
+    global _sketches
+    if _sketches is None:
+        import redis
+
+        _sketches = SurveySketches(redis.from_url(REDIS_URL))
+    return _sketches
+
+
+def set_sketches(sketches: Optional[SurveySketches]) -> None:
+    """Install sketches, e.g. in-process ones for benchmarks"""
+    global _sketches
+    _sketches = sketches
+
+
+def rebuild_surveys(db: Session, survey_ids: Optional[List[int]] = None) -> Dict[int, int]:
+    """Rebuild the given surveys' sketches (all active surveys by default)"""
+    if not survey_ids:
+        survey_ids = [s.id for s in db.query(Survey.id).filter(Survey.is_active == True)]
+    sketches = get_sketches()
+    return {survey_id: sketches.rebuild(db, survey_id) for survey_id in survey_ids}
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "rebuild" or not all(a.isdigit() for a in argv[1:]):
+        print("usage: python -m api.sketches rebuild [survey_id ...]", file=sys.stderr)
+        return 2
+
+    from .database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    db = SessionLocal()
+    try:
+        for survey_id, scanned in rebuild_surveys(db, [int(a) for a in argv[1:]]).items():
+            print(f"survey {survey_id}: {scanned} responses")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
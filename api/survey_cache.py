@@ -0,0 +1,293 @@
+"""
+Cached, compiled survey definitions
+
+A survey's definition (the survey row plus its ordered questions) is read on
+every render and every submission but only changes when someone edits it.
+Definitions are cached at two levels:
+
+    in-process   LRU of CompiledSurvey objects (definition + answer validators)
+    Redis        survey:<id>:version              opaque version token
+                 survey:<id>:definition:<version> JSON definition
+
+Edits call invalidate() after committing, which replaces the version token;
+entries for the old token are never read again. Each process trusts its own
+entry for SURVEY_CACHE_CHECK_SEC before re-reading the token, so other
+workers see an edit within that interval.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .backend_models import Question, Survey
+from .choice_codes import MULTI_CHOICE_TYPES, SINGLE_CHOICE_TYPES, encode_choice, option_positions
+from .quantile_sketch import NUMERIC_QUESTION_TYPES, RATING_QUESTION_TYPES
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+SURVEY_CACHE_SIZE = int(os.getenv("SURVEY_CACHE_SIZE", "512"))
+SURVEY_CACHE_CHECK_SEC = float(os.getenv("SURVEY_CACHE_CHECK_SEC", "1"))
+SURVEY_CACHE_TTL_SEC = int(os.getenv("SURVEY_CACHE_TTL_SEC", str(24 * 3600)))
+
+SURVEY_FIELDS = ("id", "title", "description", "creator_id", "is_active", "start_date", "end_date",
+                 "reject_duplicates", "created_at", "updated_at")
+QUESTION_FIELDS = ("id", "survey_id", "question_text", "question_type", "is_required", "order_index",
+                   "options", "created_at", "updated_at")
+DATETIME_FIELDS = ("start_date", "end_date", "created_at", "updated_at")
+
+
+class AnswerError(ValueError):
+    """An answer payload does not fit the survey's questions"""
+
+
+def _version_key(survey_id: int) -> str:
+    return f"survey:{survey_id}:version"
+
+
+def _definition_key(survey_id: int, version: str) -> str:
+    return f"survey:{survey_id}:definition:{version}"
+
+
+def _new_version() -> str:
+    # Never repeats, even if Redis loses the previous token
+    return f"{time.time_ns():x}"
+
+
+def _row(obj, fields: Tuple[str, ...]) -> Dict[str, Any]:
+    row = {}
+    for field in fields:
+        value = getattr(obj, field)
+        row[field] = value.isoformat() if isinstance(value, datetime) else value
+    return row
+
+
+def load_definition(db: Session, survey_id: int) -> Optional[Dict[str, Any]]:
+    """JSON-ready survey definition from the database, or None if the survey does not exist"""
+    survey = db.get(Survey, survey_id)
+    if survey is None:
+        return None
+    questions = db.query(Question).filter(Question.survey_id == survey_id).order_by(
+        Question.order_index, Question.id
+    )
+    definition = _row(survey, SURVEY_FIELDS)
+    definition["questions"] = [_row(q, QUESTION_FIELDS) for q in questions]
+    return definition
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+Validator = Callable[[Optional[str], Any], Tuple[Optional[str], Any, Optional[int], Optional[int]]]
+
+
+def _compile_question(question: Dict[str, Any]) -> Validator:
+    """
+    Validator turning one submitted answer into its stored form:
+    (answer_text, answer_data, choice_index, choice_mask)
+    """
+    question_id = question["id"]
+    question_type = question["question_type"]
+    options = question["options"] if isinstance(question["options"], list) else None
+    positions = option_positions(options)
+
+    if question_type in MULTI_CHOICE_TYPES:
+        def validate(text, data):
+            selected = data.get("selected") if isinstance(data, dict) else data
+            if not isinstance(selected, list):
+                raise AnswerError(f"Question {question_id} expects a list of options")
+            selected = [str(option) for option in selected]
+            return encode_choice(question_type, options, ", ".join(selected), {"selected": selected}, positions)
+        return validate
+
+    if question_type in SINGLE_CHOICE_TYPES:
+        def validate(text, data):
+            choice = text if text is not None else (data.get("selected") if isinstance(data, dict) else data)
+            if choice is None:
+                raise AnswerError(f"Question {question_id} expects an option")
+            return encode_choice(question_type, options, str(choice), {"selected": str(choice)}, positions)
+        return validate
+
+    if question_type in RATING_QUESTION_TYPES + NUMERIC_QUESTION_TYPES:
+        def validate(text, data):
+            value = data.get("value") if isinstance(data, dict) else (data if data is not None else text)
+            # float() would take True as 1, and "nan"/"inf" which JSONB cannot store
+            if isinstance(value, bool):
+                raise AnswerError(f"Question {question_id} expects a number")
+            try:
+                value = float(value)
+            except (TypeError, ValueError, OverflowError):
+                raise AnswerError(f"Question {question_id} expects a number")
+            if not math.isfinite(value):
+                raise AnswerError(f"Question {question_id} expects a finite number")
+            value = int(value) if value.is_integer() else value
+            return str(value), {"value": value}, None, None
+        return validate
+
+    return lambda text, data: (text, data, None, None)
+
+
+class CompiledSurvey:
+    """A survey definition plus the validators its submissions go through"""
+
+    def __init__(self, definition: Dict[str, Any], version: Optional[str]):
+        self.definition = definition
+        self.version = version
+        self.id = definition["id"]
+        self.is_active = definition["is_active"]
+        self.start_date = _parse_datetime(definition["start_date"])
+        self.end_date = _parse_datetime(definition["end_date"])
+        # Definitions cached before the column existed lack it
+        self.reject_duplicates = bool(definition.get("reject_duplicates"))
+        self.questions = {q["id"]: q for q in definition["questions"]}
+        self.required = [q["id"] for q in definition["questions"] if q["is_required"]]
+        self._validators = {q["id"]: _compile_question(q) for q in definition["questions"]}
+
+    def accepting(self, now: datetime) -> bool:
+        return bool(self.is_active) and not (self.start_date and now < self.start_date) \
+            and not (self.end_date and now > self.end_date)
+
+    def validate(self, answers: Iterable[Tuple[int, Optional[str], Any]]) -> List[tuple]:
+        """(question_id, answer_text, answer_data, choice_index, choice_mask) per answer"""
+        answers = list(answers)
+        unknown = [question_id for question_id, _, _ in answers if question_id not in self.questions]
+        if unknown:
+            raise AnswerError(f"Unknown questions: {unknown}")
+        answered = {question_id for question_id, _, _ in answers}
+        missing = [question_id for question_id in self.required if question_id not in answered]
+        if missing:
+            raise AnswerError(f"Missing required questions: {missing}")
+        return [(question_id, *self._validators[question_id](text, data)) for question_id, text, data in answers]
+
+
+class SurveyCache:
+    """
+    Versioned two-level cache of compiled surveys
+
+    Without a Redis client versions are kept in-process, which is enough for a
+    single worker or a benchmark run.
+    """
+
+    def __init__(self, redis_client=None, max_entries: int = SURVEY_CACHE_SIZE,
+                 check_interval: float = SURVEY_CACHE_CHECK_SEC, ttl: int = SURVEY_CACHE_TTL_SEC):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.ttl = ttl
+        self.stats = {"hits": 0, "redis_hits": 0, "loads": 0, "invalidations": 0}
+        # survey id -> (compiled survey, monotonic time its version was last confirmed)
+        self._entries: "OrderedDict[int, Tuple[CompiledSurvey, float]]" = OrderedDict()
+        self._local_versions: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _current_version(self, survey_id: int) -> str:
+        if self.redis is None:
+            with self._lock:
+                return self._local_versions.setdefault(survey_id, _new_version())
+        key = _version_key(survey_id)
+        version = self.redis.get(key)
+        if version is None:
+            self.redis.set(key, _new_version(), nx=True)
+            version = self.redis.get(key)
+        return version.decode() if isinstance(version, bytes) else version
+
+    def _remember(self, survey: CompiledSurvey) -> None:
+        with self._lock:
+            self._entries[survey.id] = (survey, time.monotonic())
+            self._entries.move_to_end(survey.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, db: Session, survey_id: int) -> Optional[CompiledSurvey]:
+        """
+        Compiled survey, or None if it does not exist
+
+        `db` is only used on a miss and must read from the primary: a lagging
+        replica could otherwise cache a definition older than its version.
+        """
+        with self._lock:
+            entry = self._entries.get(survey_id)
+            if entry is not None:
+                self._entries.move_to_end(survey_id)
+        if entry is not None and time.monotonic() - entry[1] < self.check_interval:
+            self.stats["hits"] += 1
+            return entry[0]
+
+        try:
+            version = self._current_version(survey_id)
+        except Exception as e:
+            logger.warning(f"Survey cache version lookup failed for {survey_id}: {str(e)}")
+            version = None
+        if entry is not None and version is not None and entry[0].version == version:
+            self._remember(entry[0])
+            self.stats["hits"] += 1
+            return entry[0]
+
+        definition = None
+        if version is not None and self.redis is not None:
+            try:
+                cached = self.redis.get(_definition_key(survey_id, version))
+                if cached:
+                    definition = json.loads(cached)
+                    self.stats["redis_hits"] += 1
+            except Exception as e:
+                logger.warning(f"Survey cache read failed for {survey_id}: {str(e)}")
+        if definition is None:
+            definition = load_definition(db, survey_id)
+            self.stats["loads"] += 1
+            if definition is None:
+                return None
+            if version is not None and self.redis is not None:
+                try:
+                    self.redis.set(_definition_key(survey_id, version), json.dumps(definition), ex=self.ttl)
+                except Exception as e:
+                    logger.warning(f"Survey cache write failed for {survey_id}: {str(e)}")
+
+        survey = CompiledSurvey(definition, version)
+        # Without a version the definition cannot be checked later, so it is not kept
+        if version is not None:
+            self._remember(survey)
+        return survey
+
+    def invalidate(self, survey_id: int) -> None:
+        """Call after committing any change to the survey or its questions"""
+        self.stats["invalidations"] += 1
+        with self._lock:
+            self._entries.pop(survey_id, None)
+            if self.redis is None:
+                self._local_versions[survey_id] = _new_version()
+                return
+        try:
+            self.redis.set(_version_key(survey_id), _new_version())
+        except Exception as e:
+            # Other workers keep the old definition until the version can be replaced
+            logger.error(f"Survey cache invalidation failed for {survey_id}: {str(e)}")
+
+
+_cache: Optional[SurveyCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_survey_cache() -> SurveyCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            import redis
+
+            _cache = SurveyCache(redis.from_url(REDIS_URL))
+        return _cache
+
+
+def set_survey_cache(cache: Optional[SurveyCache]) -> None:
+    """Install a cache, e.g. an in-process one for benchmarks"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
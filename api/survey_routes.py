@@ -1,20 +1,22 @@
-from fastapi import APIRouter
+from datetime import datetime
+from typing import Any
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, Response as HTTPResponse
 from pydantic import BaseModel
-from sqlalchemy import MetaData, Table, Column, Integer, String, Text, select, insert
-from .database import engine
-
-metadata = MetaData()
-
-surveys = Table(
-    "surveys",
-    metadata,
-    Column("id", Integer, primary_key=True),
-    Column("title", String(200), nullable=False),
-    Column("description", Text),
+from sqlalchemy import delete, func, select, insert
+from sqlalchemy.orm import Session
+from .database import engine, get_db, get_read_db
+from .backend_models import Survey, Question, Response, Answer
+from .backend_statistics import calculate_survey_statistics
+from .choice_codes import MULTI_CHOICE_TYPES, SINGLE_CHOICE_TYPES
+from .survey_cache import AnswerError, get_survey_cache
+from .sketches import get_sketches, respondent_identity, count_unique_respondents
+from .quantile_sketch import (
+    RATING_QUESTION_TYPES, NUMERIC_QUESTION_TYPES, answer_value, get_quantile_sketches
 )
 
-# 啟動時若表不存在就建立（方便你先測）
-metadata.create_all(engine, checkfirst=True)
+# Schema is managed by Alembic (`make upgrade`); nothing is created at import time
+surveys = Survey.__table__
 
 router = APIRouter(prefix="/surveys", tags=["surveys"])
 
@@ -34,11 +36,204 @@ def create_survey(payload: SurveyIn):
             .returning(surveys.c.id)
         )
         new_id = result.scalar_one()
-        row = conn.execute(select(surveys).where(surveys.c.id == new_id)).mappings().one()
+        row = conn.execute(select(surveys.c.id, surveys.c.title, surveys.c.description).where(surveys.c.id == new_id)).mappings().one()
         return SurveyOut(**row)
 
 @router.get("", response_model=list[SurveyOut])
-def list_surveys():
-    with engine.begin() as conn:
-        rows = conn.execute(select(surveys).order_by(surveys.c.id.desc())).mappings().all()
-        return [SurveyOut(**r) for r in rows]
+def list_surveys(db: Session = Depends(get_read_db)):
+    rows = db.execute(select(surveys.c.id, surveys.c.title, surveys.c.description).order_by(surveys.c.id.desc())).mappings().all()
+    return [SurveyOut(**r) for r in rows]
+
+class SurveyUpdate(BaseModel):
+    title: str | None = None
+    description: str | None = None
+    is_active: bool | None = None
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+    reject_duplicates: bool | None = None
+
+QUESTION_TYPES = ("text",) + SINGLE_CHOICE_TYPES + MULTI_CHOICE_TYPES + RATING_QUESTION_TYPES + NUMERIC_QUESTION_TYPES
+
+class QuestionIn(BaseModel):
+    question_text: str
+    question_type: str
+    is_required: bool = False
+    order_index: int = 0
+    options: list[str] | None = None
+
+def _question_options(payload: QuestionIn) -> list[str] | None:
+    if payload.question_type not in QUESTION_TYPES:
+        raise HTTPException(status_code=400, detail=f"question_type must be one of {list(QUESTION_TYPES)}")
+    if payload.question_type not in SINGLE_CHOICE_TYPES + MULTI_CHOICE_TYPES:
+        return None
+    if not payload.options:
+        raise HTTPException(status_code=400, detail=f"{payload.question_type} questions need options")
+    # Answers are stored as option positions, so labels must be unique
+    if len(set(payload.options)) != len(payload.options):
+        raise HTTPException(status_code=400, detail="Options must be unique")
+    return payload.options
+
+def _get_question(db: Session, survey_id: int, question_id: int) -> Question:
+    question = db.get(Question, question_id)
+    if not question or question.survey_id != survey_id:
+        raise HTTPException(status_code=404, detail="Question not found")
+    return question
+
+@router.get("/{survey_id}")
+def get_survey(survey_id: int, request: Request, db: Session = Depends(get_db)):
+    """Survey with its ordered questions, served from the survey cache"""
+    # Primary session: a cache miss must not fill the cache from a lagging replica
+    survey = get_survey_cache().get(db, survey_id)
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    if survey.version is None:
+        return survey.definition
+    etag = f'"{survey.version}"'
+    if request.headers.get("if-none-match") == etag:
+        return HTTPResponse(status_code=304, headers={"ETag": etag})
+    return JSONResponse(survey.definition, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.put("/{survey_id}")
+def update_survey(survey_id: int, payload: SurveyUpdate, db: Session = Depends(get_db)):
+    survey = db.get(Survey, survey_id)
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    for field, value in payload.model_dump(exclude_unset=True).items():
+        if field in ("title", "reject_duplicates") and value is None:
+            raise HTTPException(status_code=400, detail=f"{field} cannot be null")
+        setattr(survey, field, value)
+    survey.updated_at = func.now()
+    db.commit()
+    cache = get_survey_cache()
+    cache.invalidate(survey_id)
+    return cache.get(db, survey_id).definition
+
+@router.delete("/{survey_id}", status_code=204)
+def delete_survey(survey_id: int, db: Session = Depends(get_db)):
+    # Questions, responses and answers go with it (ON DELETE CASCADE)
+    deleted = db.execute(delete(surveys).where(surveys.c.id == survey_id)).rowcount
+    db.commit()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    get_survey_cache().invalidate(survey_id)
+
+@router.post("/{survey_id}/questions", status_code=201)
+def create_question(survey_id: int, payload: QuestionIn, db: Session = Depends(get_db)):
+    if not db.get(Survey, survey_id):
+        raise HTTPException(status_code=404, detail="Survey not found")
+    question = Question(
+        survey_id=survey_id, question_text=payload.question_text, question_type=payload.question_type,
+        is_required=payload.is_required, order_index=payload.order_index, options=_question_options(payload)
+    )
+    db.add(question)
+    db.commit()
+    get_survey_cache().invalidate(survey_id)
+    return {"id": question.id, "survey_id": survey_id, **payload.model_dump(), "options": question.options}
+
+@router.put("/{survey_id}/questions/{question_id}")
+def update_question(survey_id: int, question_id: int, payload: QuestionIn, db: Session = Depends(get_db)):
+    question = _get_question(db, survey_id, question_id)
+    options = _question_options(payload)
+    answered = db.query(Answer.id).filter(Answer.question_id == question_id).first() is not None
+    if answered:
+        # Stored answers refer to the type and to option positions
+        if payload.question_type != question.question_type:
+            raise HTTPException(status_code=409, detail="The type of an answered question cannot change")
+        existing = question.options or []
+        if (options or [])[:len(existing)] != existing:
+            raise HTTPException(status_code=409, detail="Options of an answered question can only be appended to")
+    question.question_text = payload.question_text
+    question.question_type = payload.question_type
+    question.is_required = payload.is_required
+    question.order_index = payload.order_index
+    question.options = options
+    question.updated_at = func.now()
+    db.commit()
+    get_survey_cache().invalidate(survey_id)
+    return {"id": question_id, "survey_id": survey_id, **payload.model_dump(), "options": options}
+
+@router.delete("/{survey_id}/questions/{question_id}", status_code=204)
+def delete_question(survey_id: int, question_id: int, db: Session = Depends(get_db)):
+    db.delete(_get_question(db, survey_id, question_id))
+    db.commit()
+    get_survey_cache().invalidate(survey_id)
+
+class AnswerIn(BaseModel):
+    question_id: int
+    answer_text: str | None = None
+    answer_data: Any = None
+
+class ResponseIn(BaseModel):
+    answers: list[AnswerIn]
+
+@router.post("/{survey_id}/responses", status_code=201)
+def submit_response(survey_id: int, payload: ResponseIn, request: Request, db: Session = Depends(get_db)):
+    # Definition and validators come from the survey cache; no queries until the duplicate check
+    survey = get_survey_cache().get(db, survey_id)
+    if not survey:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    if not survey.accepting(datetime.utcnow()):
+        raise HTTPException(status_code=400, detail="Survey is not accepting responses")
+    try:
+        answers = survey.validate((a.question_id, a.answer_text, a.answer_data) for a in payload.answers)
+    except AnswerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Bloom screen first: a first-time respondent never touches the duplicate lookup.
+    # IP plus user agent is shared behind NATs and proxies, so a repeat is only
+    # flagged unless the survey opted into rejecting it
+    ip_address = request.client.host if request.client else None
+    user_agent = request.headers.get("user-agent")
+    identity = respondent_identity(None, ip_address, user_agent)
+    sketches = get_sketches()
+    suspected_duplicate = False
+    if sketches.screen(survey_id, identity):
+        suspected_duplicate = db.query(Response.id).filter(
+            Response.survey_id == survey_id,
+            Response.user_id.is_(None),
+            Response.ip_address == ip_address,
+            Response.user_agent == user_agent,
+        ).first() is not None
+        if suspected_duplicate:
+            sketches.record_duplicate(survey_id)
+            if survey.reject_duplicates:
+                raise HTTPException(status_code=409, detail="A response from this respondent already exists")
+
+    response = Response(survey_id=survey_id, ip_address=ip_address, user_agent=user_agent,
+                        suspected_duplicate=suspected_duplicate)
+    db.add(response)
+    db.flush()
+    db.add_all(
+        Answer(response_id=response.id, question_id=question_id, answer_text=text, answer_data=data,
+               choice_index=choice_index, choice_mask=choice_mask)
+        for question_id, text, data, choice_index, choice_mask in answers
+    )
+    db.commit()
+    sketches.add_respondent(survey_id, identity)
+    quantiles = get_quantile_sketches()
+    for question_id, text, data, _, _ in answers:
+        question_type = survey.questions[question_id]["question_type"]
+        if question_type in RATING_QUESTION_TYPES + NUMERIC_QUESTION_TYPES:
+            quantiles.record(question_id, question_type, answer_value(text, data))
+    return {"id": response.id, "survey_id": survey_id, "submitted_at": response.submitted_at,
+            "suspected_duplicate": suspected_duplicate}
+
+@router.get("/{survey_id}/statistics")
+def get_survey_statistics(survey_id: int, days: int | None = None, db: Session = Depends(get_read_db)):
+    """Survey statistics; rating/numeric percentiles come from sketches (last `days` days if given)"""
+    if not db.get(Survey, survey_id):
+        raise HTTPException(status_code=404, detail="Survey not found")
+    if days is not None and not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    stats = calculate_survey_statistics(db, survey_id)
+    quantiles = get_quantile_sketches()
+    for question in stats["question_statistics"]:
+        if question["question_type"] in RATING_QUESTION_TYPES + NUMERIC_QUESTION_TYPES:
+            try:
+                summary = quantiles.summary(question["question_id"], question["question_type"], days)
+            except Exception as e:
+                summary = {"error": f"sketch unavailable: {str(e)}"}
+            question["statistics"].update(summary)
+    stats.update(count_unique_respondents(db, survey_id))
+    stats["suspected_duplicates"] = get_sketches().duplicates_seen(survey_id)
+    return stats
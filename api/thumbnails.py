@@ -0,0 +1,289 @@
+"""
+Content-addressed thumbnail cache
+
+Variant thumbnails are fetched from their origin once and kept on local disk:
+
+    <THUMBNAIL_CACHE_DIR>/blobs/ab/<sha256 of the image bytes>
+    <THUMBNAIL_CACHE_DIR>/urls/cd/<sha256 of the URL>    -> image digest
+
+Identical images behind different URLs share one blob, and a blob's digest is
+its ETag, so the served bytes can be cached by browsers as immutable. The
+blobs' mtimes record last use; once the cache exceeds THUMBNAIL_CACHE_MAX_BYTES
+the least recently used blobs are deleted (a URL whose blob is gone is simply
+fetched again).
+
+Only URLs stored on variants are fetched (see GET /variants/{id}/thumbnail),
+and only from THUMBNAIL_ALLOWED_HOSTS. Redirects are not followed, so a
+stored URL can never make the API fetch from an internal address.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "/tmp/crowdtest-thumbnails")
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Anything larger is not a thumbnail
+THUMBNAIL_MAX_IMAGE_BYTES = int(os.getenv("THUMBNAIL_MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv("THUMBNAIL_FETCH_TIMEOUT", "10"))
+# Exact host names thumbnails may be fetched from (comma-separated)
+THUMBNAIL_ALLOWED_HOSTS = tuple(
+    h.strip().lower() for h in os.getenv("THUMBNAIL_ALLOWED_HOSTS", "i.ytimg.com,img.youtube.com").split(",")
+    if h.strip()
+)
+# Eviction trims the cache to this share of the limit so it does not run on every store
+EVICT_TO_RATIO = 0.9
+SIZE_RESCAN_SEC = 60
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ThumbnailError(Exception):
+    """The origin did not return a usable image"""
+
+
+def sniff_content_type(data: bytes) -> Optional[str]:
+    """Image type from the leading bytes; None for anything that is not an image"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _touch(path: str) -> None:
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ThumbnailCache:
+    """Disk cache shared by every API worker on the host (state lives in the files)"""
+
+    def __init__(self, root: str = THUMBNAIL_CACHE_DIR, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES,
+                 max_image_bytes: int = THUMBNAIL_MAX_IMAGE_BYTES,
+                 timeout: float = THUMBNAIL_FETCH_TIMEOUT, pool_size: int = 10,
+                 allowed_hosts: Tuple[str, ...] = THUMBNAIL_ALLOWED_HOSTS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_image_bytes = max_image_bytes
+        self.timeout = timeout
+        self.allowed_hosts = frozenset(h.lower() for h in allowed_hosts)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.stats = {"hits": 0, "fetches": 0, "deduplicated": 0, "evicted": 0}
+        self._size: Optional[int] = None
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        self._url_locks: Dict[str, threading.Lock] = {}
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _url_path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.root, "urls", key[:2], key)
+
+    def lookup(self, url: str) -> Optional[str]:
+        """Digest of the cached image for `url`, or None if it has to be fetched"""
+        try:
+            with open(self._url_path(url), "rb") as f:
+                digest = f.read().decode()
+        except OSError:
+            return None
+        blob = self._blob_path(digest)
+        if not DIGEST_RE.match(digest) or not os.path.exists(blob):
+            return None
+        _touch(blob)
+        return digest
+
+    def get(self, url: str) -> str:
+        """Digest of the image at `url`, fetching it on a miss"""
+        digest = self.lookup(url)
+        if digest:
+            self.stats["hits"] += 1
+            return digest
+
+        # Concurrent misses for one URL in this process wait for a single fetch
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        try:
+            with url_lock:
+                digest = self.lookup(url)
+                if digest:
+                    self.stats["hits"] += 1
+                    return digest
+                digest = self.store(self._download(url))
+                _write_atomic(self._url_path(url), digest.encode())
+                return digest
+        finally:
+            with self._lock:
+                self._url_locks.pop(url, None)
+
+    def _download(self, url: str) -> bytes:
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https"):
+            raise ThumbnailError(f"Unsupported thumbnail URL: {url}")
+        if (parsed.hostname or "") not in self.allowed_hosts:
+            raise ThumbnailError(f"Thumbnail host not allowed: {url}")
+        self.stats["fetches"] += 1
+        try:
+            # A redirect could point anywhere, so it counts as a failed fetch
+            with self.session.get(url, stream=True, timeout=self.timeout, allow_redirects=False) as response:
+                if response.status_code != 200:
+                    raise ThumbnailError(f"Origin returned {response.status_code} for {url}")
+                chunks, size = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_image_bytes:
+                        raise ThumbnailError(f"Thumbnail at {url} exceeds {self.max_image_bytes} bytes")
+                    chunks.append(chunk)
+        except requests.RequestException as e:
+            raise ThumbnailError(f"Could not fetch {url}: {str(e)}")
+        data = b"".join(chunks)
+        if sniff_content_type(data) is None:
+            raise ThumbnailError(f"{url} did not return an image")
+        return data
+
+    def store(self, data: bytes) -> str:
+        """Add image bytes under their digest; identical images are stored once"""
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self._blob_path(digest)
+        if os.path.exists(blob):
+            self.stats["deduplicated"] += 1
+            _touch(blob)
+            return digest
+        _write_atomic(blob, data)
+        with self._lock:
+            # Other workers add blobs too, so the running total is re-read from disk now and then
+            if self._size is None or time.monotonic() - self._scanned_at > SIZE_RESCAN_SEC:
+                self._scan()
+            else:
+                self._size += len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return digest
+
+    def open(self, digest: str) -> Optional[Tuple[str, str]]:
+        """(path, content type) of a cached image, or None"""
+        if not DIGEST_RE.match(digest):
+            return None
+        blob = self._blob_path(digest)
+        try:
+            with open(blob, "rb") as f:
+                content_type = sniff_content_type(f.read(16))
+        except OSError:
+            return None
+        _touch(blob)
+        return blob, content_type or "application/octet-stream"
+
+    def _blobs(self):
+        blob_root = os.path.join(self.root, "blobs")
+        try:
+            shards = list(os.scandir(blob_root))
+        except FileNotFoundError:
+            return []
+        blobs = []
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if DIGEST_RE.match(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    blobs.append((stat.st_mtime, stat.st_size, entry.path))
+        return blobs
+
+    def _scan(self) -> int:
+        blobs = self._blobs()
+        self._size = sum(size for _, size, _ in blobs)
+        self._scanned_at = time.monotonic()
+        return len(blobs)
+
+    def usage(self) -> Dict[str, int]:
+        count = self._scan()
+        return {"bytes": self._size, "blobs": count, "max_bytes": self.max_bytes}
+
+    def evict(self) -> int:
+        """Delete least recently used blobs until the cache fits; returns blobs removed"""
+        blobs = sorted(self._blobs())
+        total = sum(size for _, size, _ in blobs)
+        target = int(self.max_bytes * EVICT_TO_RATIO)
+        removed = 0
+        for _, size, path in blobs:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._size = total
+            self._scanned_at = time.monotonic()
+        self.stats["evicted"] += removed
+        if removed:
+            logger.info(f"Evicted {removed} thumbnails; cache now {total} bytes")
+        return removed
+
+
+_cache: Optional[ThumbnailCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache()
+        return _cache
+
+
+def set_thumbnail_cache(cache: Optional[ThumbnailCache]) -> None:
+    """Install a cache, e.g. one in a temporary directory for a benchmark"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def prefetch_thumbnail(url: str) -> None:
+    """Warm the cache for a new variant; failures are retried on first view"""
+    started = time.perf_counter()
+    try:
+        digest = get_thumbnail_cache().get(url)
+        logger.info(f"Prefetched thumbnail {digest[:12]} for {url} in {(time.perf_counter() - started) * 1000:.0f}ms")
+    except ThumbnailError as e:
+        logger.warning(f"Thumbnail prefetch failed: {str(e)}")
+    except Exception as e:
+        logger.warning(f"Thumbnail prefetch failed for {url}: {str(e)}")
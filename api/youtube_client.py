@@ -0,0 +1,269 @@
+"""
+YouTube Data API client
+
+- keep-alive connection pooling through one requests.Session per process
+- up to 50 video IDs per videos.list call
+- a Redis token bucket and daily quota counter shared by every worker
+- ETag / If-None-Match so unchanged payloads are served from cache
+- exponential backoff per HTTP request instead of retrying the whole task
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3")
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY", "")
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+YOUTUBE_RATE_PER_SEC = float(os.getenv("YOUTUBE_RATE_PER_SEC", "10"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+MAX_IDS_PER_REQUEST = 50
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# (counter, Data API statistics key)
+STATISTICS_FIELDS = (("views", "viewCount"), ("likes", "likeCount"), ("comments", "commentCount"))
+# YouTube quota resets at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+ETAG_TTL_SEC = 24 * 3600
+
+
+class QuotaExceeded(Exception):
+    """The daily YouTube API quota is used up"""
+
+
+class TokenBucket:
+    """
+    Token bucket shared across processes through Redis
+
+    The refill and take happen in one Lua script so concurrent workers never
+    overdraw the bucket. Without a Redis client the bucket never blocks.
+    """
+
+    SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or ARGV[2])
+    local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or ARGV[3])
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local requested = tonumber(ARGV[4])
+
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= requested then
+        tokens = tokens - requested
+    else
+        wait = (requested - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+    return tostring(wait)
+    """
+
+    def __init__(self, redis_client, key: str, rate: float, capacity: Optional[float] = None):
+        self.redis = redis_client
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._script = redis_client.register_script(self.SCRIPT) if redis_client else None
+
+    def acquire(self, tokens: float = 1, max_wait: float = 30.0) -> None:
+        """Block until `tokens` are available or raise TimeoutError"""
+        if self._script is None:
+            return
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = float(self._script(keys=[self.key], args=[self.rate, self.capacity, time.time(), tokens]))
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise TimeoutError(f"Rate limit bucket {self.key} did not refill within {max_wait}s")
+            time.sleep(wait)
+
+
+class DailyQuota:
+    """
+    Daily API quota units counted in Redis across all workers
+
+    Without a Redis client units are counted in-process.
+    """
+
+    def __init__(self, redis_client, limit: int, key_prefix: str = "youtube:quota"):
+        self.redis = redis_client
+        self.limit = limit
+        self.key_prefix = key_prefix
+        self._local: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _key(self) -> str:
+        return f"{self.key_prefix}:{datetime.now(QUOTA_TIMEZONE).strftime('%Y-%m-%d')}"
+
+    def consume(self, units: int) -> int:
+        """Reserve `units`; raise QuotaExceeded (and give them back) when over the limit"""
+        key = self._key()
+        if self.redis is None:
+            with self._lock:
+                used = self._local.get(key, 0) + units
+                if used > self.limit:
+                    raise QuotaExceeded(f"YouTube daily quota of {self.limit} units exhausted")
+                # Only today's count is kept
+                self._local = {key: used}
+                return used
+        pipe = self.redis.pipeline()
+        pipe.incrby(key, units)
+        pipe.expire(key, 2 * 24 * 3600)
+        used = pipe.execute()[0]
+        if used > self.limit:
+            self.redis.decrby(key, units)
+            raise QuotaExceeded(f"YouTube daily quota of {self.limit} units exhausted")
+        return used
+
+    def used(self) -> int:
+        if self.redis is None:
+            return self._local.get(self._key(), 0)
+        return int(self.redis.get(self._key()) or 0)
+
+
+class YouTubeClient:
+    """Thin client for the YouTube Data API v3 endpoints ingestion needs"""
+
+    def __init__(self, api_key: str = YOUTUBE_API_KEY, base_url: str = YOUTUBE_API_BASE_URL,
+                 redis_client=None, rate_per_sec: float = YOUTUBE_RATE_PER_SEC,
+                 daily_quota: int = YOUTUBE_DAILY_QUOTA, pool_size: int = 10,
+                 max_retries: int = 4, backoff_base: float = 0.5, timeout: float = 10.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.redis = redis_client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # Retries are handled per request below, not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.bucket = TokenBucket(redis_client, "youtube:ratelimit", rate_per_sec)
+        self.quota = DailyQuota(redis_client, daily_quota)
+        self._local_etags: Dict[str, dict] = {}
+
+    # ETag cache: shared in Redis when available so every worker benefits
+    def _cache_get(self, key: str) -> Optional[dict]:
+        if self.redis is None:
+            return self._local_etags.get(key)
+        cached = self.redis.get(f"youtube:etag:{key}")
+        return json.loads(cached) if cached else None
+
+    def _cache_set(self, key: str, etag: str, body: dict) -> None:
+        entry = {"etag": etag, "body": body}
+        if self.redis is None:
+            self._local_etags[key] = entry
+        else:
+            self.redis.set(f"youtube:etag:{key}", json.dumps(entry), ex=ETAG_TTL_SEC)
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> None:
+        delay = self.backoff_base * (2 ** attempt) * (1 + random.random())
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            delay = max(delay, float(response.headers["Retry-After"]))
+        time.sleep(delay)
+
+    def get(self, resource: str, params: dict, cost: int = 1) -> dict:
+        """GET one API resource with rate limiting, quota accounting, ETag and backoff"""
+        params = dict(params, key=self.api_key)
+        url = f"{self.base_url}/{resource}"
+        cache_key = hashlib.sha1(
+            f"{resource}?{sorted((k, v) for k, v in params.items() if k != 'key')}".encode()
+        ).hexdigest()
+        cached = self._cache_get(cache_key)
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            if attempt == 0:
+                # Charged once the request can go out (a bucket timeout costs nothing),
+                # and once per logical request: retries of it are not charged again
+                self.quota.consume(cost)
+            headers = {"If-None-Match": cached["etag"]} if cached else {}
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"YouTube request failed ({e}), retry {attempt + 1}/{self.max_retries}")
+                self._backoff(attempt)
+                continue
+
+            if response.status_code == 304 and cached:
+                return cached["body"]
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                logger.warning(f"YouTube returned {response.status_code}, retry {attempt + 1}/{self.max_retries}")
+                self._backoff(attempt, response)
+                continue
+            if response.status_code == 403 and "quotaExceeded" in response.text:
+                raise QuotaExceeded("YouTube reported quotaExceeded")
+
+            response.raise_for_status()
+            body = response.json()
+            if response.headers.get("ETag"):
+                self._cache_set(cache_key, response.headers["ETag"], body)
+            return body
+
+    def get_video_statistics(self, video_ids: Iterable[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Fetch statistics for many videos, MAX_IDS_PER_REQUEST per call
+
+        The API reports these counters for the whole video; impressions and clicks
+        are not available, and likes or comments a creator hides are missing.
+        Missing counters are left out rather than reported as zero, which would
+        move the cumulative values backwards.
+
+        Returns:
+            {external_id: {"views": .., "likes": .., "comments": ..}} for every video found
+        """
+        ids: List[str] = sorted(set(video_ids))
+        results = {}
+        for start in range(0, len(ids), MAX_IDS_PER_REQUEST):
+            chunk = ids[start:start + MAX_IDS_PER_REQUEST]
+            body = self.get("videos", {"part": "statistics", "id": ",".join(chunk)})
+            for item in body.get("items", []):
+                stats = item.get("statistics", {})
+                results[item["id"]] = {
+                    field: int(stats[key]) for field, key in STATISTICS_FIELDS if stats.get(key) is not None
+                }
+        return results
+
+
+_client: Optional[YouTubeClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> YouTubeClient:
+    """Per-process client, created lazily so each forked worker gets its own pool"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import redis
+
+            _client = YouTubeClient(
+                api_key=os.getenv("YOUTUBE_API_KEY", YOUTUBE_API_KEY),
+                base_url=os.getenv("YOUTUBE_API_BASE_URL", YOUTUBE_API_BASE_URL),
+                redis_client=redis.from_url(REDIS_URL),
+            )
+        return _client
+
+
+def set_client(client: Optional[YouTubeClient]) -> None:
+    """Install a preconfigured client, e.g. one pointed at a local stand-in server"""
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,4 @@
+#!/bin/bash
+# Allow the local streaming replica (docker compose --profile replica) to connect
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -40,12 +40,14 @@ echo "Starting backend server..."
 uvicorn backend_main:app --reload --host 0.0.0.0 --port 8000 &
 BACKEND_PID=$!
 
-echo "Starting Celery worker..."
-celery -A celery_worker worker --loglevel=info &
+echo "Starting Celery workers..."
+python -m api.celery_worker worker ingest &
+INGEST_PID=$!
+celery -A api.celery_worker worker -Q stats,export,maintenance --loglevel=info &
 CELERY_PID=$!
 
 echo "Starting Celery beat..."
-celery -A celery_worker beat --loglevel=info &
+celery -A api.celery_worker beat --loglevel=info &
 BEAT_PID=$!
 
 # Setup frontend
@@ -80,5 +82,5 @@ echo "Press Ctrl+C to stop all services"
 echo "==================================="
 
 # Wait for Ctrl+C
-trap "echo 'Stopping services...'; kill $BACKEND_PID $CELERY_PID $BEAT_PID $FRONTEND_PID 2>/dev/null; exit" INT
+trap "echo 'Stopping services...'; kill $BACKEND_PID $INGEST_PID $CELERY_PID $BEAT_PID $FRONTEND_PID 2>/dev/null; exit" INT
 wait
\ No newline at end of file
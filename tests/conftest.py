@@ -0,0 +1,27 @@
+import os
+
+# The app's modules build engines at import time; the default URL needs psycopg 3.
+# Nothing here connects to it: tests that need tables use the SQLite fixture below.
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://test@localhost/test")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from api.models import Base, Experiment, MetricsAgg, MetricsRaw, Variant, Video
+
+EXPERIMENT_TABLES = [model.__table__ for model in (Video, Variant, Experiment, MetricsAgg, MetricsRaw)]
+
+
+@pytest.fixture
+def experiment_db():
+    """Session on an in-memory SQLite copy of the experiment tables"""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=EXPERIMENT_TABLES)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,70 @@
+import io
+
+import psycopg2.errors
+import pytest
+
+from api.backfill import BackfillError, backfill
+
+
+class FailingCopyConnection:
+    """psycopg2 connection stand-in whose COPY is refused by the server with `error`"""
+
+    def __init__(self, error):
+        self.error = error
+        self.rolled_back = False
+        self.committed = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def copy_expert(self, sql, stream, size=8192):
+        stream.read()
+        raise self.error
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+CSV = "variant_id,ts,views\n" \
+      "6f9619ff-8b86-d011-b42d-00cf4fc964ff,2026-01-01T00:00:00Z,10\n" \
+      "6f9619ff-8b86-d011-b42d-00cf4fc964ff,2026-01-02T00:00:00Z,20,extra\n"
+
+
+def test_malformed_csv_is_a_backfill_error_with_its_line():
+    conn = FailingCopyConnection(psycopg2.errors.BadCopyFileFormat(
+        "extra data after last expected column\n"
+        "CONTEXT:  COPY backfill_staging, line 2: \"6f9619ff-8b86-d011-b42d-00cf4fc964ff,...\"\n"
+    ))
+
+    with pytest.raises(BackfillError, match="line 3: extra data after last expected column"):
+        backfill(io.StringIO(CSV), "csv", conn)
+    assert conn.rolled_back and not conn.committed
+
+
+def test_ndjson_copy_errors_name_the_record():
+    conn = FailingCopyConnection(psycopg2.errors.CharacterNotInRepertoire(
+        "invalid byte sequence for encoding \"UTF8\": 0x00\n"
+        "CONTEXT:  COPY backfill_staging, line 7\n"
+    ))
+
+    with pytest.raises(BackfillError, match="record 7"):
+        backfill(io.StringIO('{"ts": "2026-01-01"}\n'), "ndjson", conn)
+
+
+def test_copy_errors_without_a_line_are_still_backfill_errors():
+    conn = FailingCopyConnection(psycopg2.errors.BadCopyFileFormat("unterminated CSV quoted field"))
+
+    with pytest.raises(BackfillError, match="Malformed CSV file: unterminated CSV quoted field"):
+        backfill(io.StringIO(CSV), "csv", conn)
@@ -0,0 +1,57 @@
+import pytest
+
+import api.backend_tasks  # noqa: F401  (registers the tasks)
+import api.celery_tasks  # noqa: F401
+from api.celery_worker import ACKS_LATE_TASKS, QUEUES, TASK_ROUTES, WORKER_PROFILES, celery_app
+
+
+def route(task_name):
+    return celery_app.amqp.router.route({}, task_name, (), {})["queue"]
+
+
+def test_every_task_has_a_route():
+    registered = {name for name in celery_app.tasks if not name.startswith("celery.")}
+
+    assert registered == set(TASK_ROUTES)
+
+
+@pytest.mark.parametrize("task_name,queue", sorted(TASK_ROUTES.items()))
+def test_tasks_are_published_to_their_queue_only(task_name, queue):
+    routed = route(task_name)
+
+    assert routed.name == queue
+    # The binding a message is published with must match this queue and no other
+    bindings = {(q.exchange.name, q.routing_key): name for name, q in celery_app.amqp.queues.items()}
+    assert bindings[(routed.exchange.name, routed.routing_key)] == queue
+
+
+def test_queue_bindings_are_distinct():
+    queues = celery_app.amqp.queues
+    bindings = {(queues[name].exchange.name, queues[name].routing_key) for name in QUEUES}
+
+    assert len(bindings) == len(QUEUES)
+
+
+def test_unrouted_tasks_fall_back_to_maintenance():
+    assert route("celery_tasks.not_a_task").name == "maintenance"
+
+
+@pytest.mark.parametrize("task_name,queue", sorted(TASK_ROUTES.items()))
+def test_time_limits_follow_the_queue(task_name, queue):
+    annotations = celery_app.conf.task_annotations[task_name]
+
+    assert annotations["time_limit"] == WORKER_PROFILES[queue]["time_limit"]
+    assert annotations["soft_time_limit"] == WORKER_PROFILES[queue]["soft_time_limit"]
+
+
+def test_only_idempotent_long_tasks_are_acked_late():
+    late = {name for name in TASK_ROUTES if celery_app.tasks[name].acks_late}
+
+    assert late == ACKS_LATE_TASKS
+    assert not celery_app.conf.task_acks_late
+    assert not celery_app.conf.task_reject_on_worker_lost
+    assert not any(celery_app.tasks[name].reject_on_worker_lost for name in TASK_ROUTES)
+
+
+def test_every_pool_enforces_time_limits():
+    assert {profile["pool"] for profile in WORKER_PROFILES.values()} == {"prefork"}
@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from api import backend_tasks
+from api.benchmarks.fake_youtube import FakeYouTubeServer
+from api.change_detection import SnapshotGate, set_gate
+from api.models import Experiment, MetricsRaw, Variant, Video
+from api.youtube_client import YouTubeClient, set_client
+
+
+class RecordingSession:
+    """Reads from the SQLite session; writes are recorded instead of executed (they are PostgreSQL UPSERTs)"""
+
+    def __init__(self, db):
+        self.db = db
+        self.added = []
+        self.executed = []
+
+    def query(self, *entities):
+        return self.db.query(*entities)
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    def execute(self, statement):
+        self.executed.append(statement)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def experiment(experiment_db):
+    video = Video(platform="youtube", external_id="vid-1", title="Video")
+    experiment_db.add(video)
+    experiment_db.flush()
+    experiment_db.add_all([Variant(video_id=video.id, variant_key=key) for key in ("A", "B")])
+    experiment = Experiment(name="Thumbnails", video_id=video.id, primary_metric="ctr",
+                            start_at=datetime(2026, 1, 1), status="running")
+    experiment_db.add(experiment)
+    experiment_db.commit()
+    return experiment
+
+
+@pytest.fixture(autouse=True)
+def quiet_side_effects(monkeypatch):
+    monkeypatch.setattr(backend_tasks, "publish_experiment_update", lambda experiment_id: None)
+    monkeypatch.setattr(backend_tasks, "enqueue_rollup_refresh", lambda video_ids, since: None)
+    set_gate(SnapshotGate(redis_client=None))
+    yield
+    set_gate(None)
+
+
+def test_each_variant_keeps_its_own_counters(experiment_db, experiment, monkeypatch):
+    requested = []
+
+    def fetch(keys):
+        requested.extend(keys)
+        return {
+            ("vid-1", "A"): {"views": 100, "impressions": 1000, "clicks": 50},
+            ("vid-1", "B"): {"views": 120, "impressions": 1000, "clicks": 70},
+        }
+
+    monkeypatch.setattr(backend_tasks, "fetch_youtube_metrics_batch", fetch)
+    db = RecordingSession(experiment_db)
+
+    result = backend_tasks._ingest_experiments(db, [experiment])
+
+    assert result["status"] == "success" and result["unattributed"] == 0
+
+    assert sorted(requested) == [("vid-1", "A"), ("vid-1", "B")]
+    raw = {r.variant_id: r for r in db.added if isinstance(r, MetricsRaw)}
+    variants = {v.variant_key: v.id for v in experiment_db.query(Variant)}
+    assert raw[variants["A"]].clicks == 50
+    assert raw[variants["B"]].clicks == 70
+    assert len(db.executed) == 2
+
+
+def test_unreported_counters_are_not_overwritten(experiment_db, experiment, monkeypatch):
+    monkeypatch.setattr(backend_tasks, "fetch_youtube_metrics_batch", lambda keys: {
+        key: {"views": 10 + i, "likes": 1, "comments": 0} for i, key in enumerate(keys)
+    })
+    db = RecordingSession(experiment_db)
+
+    backend_tasks._ingest_experiments(db, [experiment])
+
+    raw = [r for r in db.added if isinstance(r, MetricsRaw)]
+    assert raw and all(r.impressions is None and r.clicks is None for r in raw)
+    sql = str(db.executed[0].compile(dialect=postgresql.dialect()))
+    update = sql.split("DO UPDATE SET", 1)[1]
+    assert "views = excluded.views" in update
+    assert "impressions" not in update and "clicks" not in update
+    # A new day carries unreported counters forward from the previous row
+    assert "SELECT metrics_agg.impressions" in sql.split("ON CONFLICT", 1)[0]
+
+
+def test_video_statistics_only_attributed_to_a_sole_variant(caplog):
+    with FakeYouTubeServer() as server:
+        set_client(YouTubeClient(base_url=server.url, redis_client=None, backoff_base=0.001))
+        try:
+            metrics = backend_tasks.fetch_youtube_metrics_batch(
+                [("solo", "A"), ("pair", "A"), ("pair", "B")]
+            )
+        finally:
+            set_client(None)
+
+    assert set(metrics) == {("solo", "A")}
+    assert set(metrics[("solo", "A")]) == {"views", "likes", "comments"}
+    assert server.stats["requests"] == 1
+    assert "skipped 2 of 3 variant keys on 1 videos" in caplog.text
+
+
+def test_variants_without_a_source_are_reported_unattributed(experiment_db, experiment, monkeypatch, caplog):
+    monkeypatch.setattr(backend_tasks, "fetch_youtube_metrics_batch", lambda keys: {})
+    db = RecordingSession(experiment_db)
+
+    result = backend_tasks._ingest_experiments(db, [experiment])
+
+    assert result["unattributed"] == 2
+    assert not db.added and not db.executed
+    assert "No metrics for any of the 2 variants" in caplog.text
+
+
+def test_dispatch_prunes_change_detection_state_of_stopped_variants(experiment_db, experiment, monkeypatch):
+    class IdleScheduler:
+        def sync(self, running_ids):
+            self.running = list(running_ids)
+
+        def claim_due(self):
+            return []
+
+    gate = SnapshotGate(redis_client=None)
+    set_gate(gate)
+    running = [str(v.id) for v in experiment_db.query(Variant)]
+    gate.record({running[0]: "a", "stopped-variant": "b"}, [running[1], "deleted-variant"])
+    monkeypatch.setattr(backend_tasks, "SessionLocal", lambda: experiment_db)
+    monkeypatch.setattr(backend_tasks, "get_scheduler", IdleScheduler)
+
+    backend_tasks.dispatch_due_ingests()
+
+    assert set(gate._fingerprints) == {running[0]}
+    assert set(gate._seen) == set(running)
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.ingest_scheduler import (
+    DEFAULT_INTERVAL_SEC, MAX_INTERVAL_SEC, MIN_INTERVAL_SEC, TARGET_EVENTS_PER_POLL,
+    compute_next_interval, experiment_signals,
+)
+from api.models import Experiment, MetricsRaw, Variant, Video
+
+
+@pytest.fixture
+def experiment(experiment_db):
+    video = Video(platform="youtube", external_id="vid-1", title="Video")
+    experiment_db.add(video)
+    experiment_db.flush()
+    variants = [Variant(video_id=video.id, variant_key=key) for key in ("A", "B")]
+    experiment_db.add_all(variants)
+    experiment = Experiment(name="Thumbnails", video_id=video.id, primary_metric="ctr",
+                            start_at=datetime.utcnow() - timedelta(hours=1), status="running")
+    experiment_db.add(experiment)
+    experiment_db.commit()
+    return experiment
+
+
+def snapshot(db, experiment, variant_key, hours_ago, impressions, id):
+    variant = db.query(Variant).filter(Variant.variant_key == variant_key).one()
+    db.add(MetricsRaw(id=id, video_id=experiment.video_id, variant_id=variant.id, source="youtube",
+                      ts=datetime.utcnow() - timedelta(hours=hours_ago), impressions=impressions))
+    db.commit()
+
+
+def test_unknown_velocity_polls_at_the_default_interval():
+    assert compute_next_interval(None) == DEFAULT_INTERVAL_SEC
+
+
+def test_measured_zero_velocity_polls_at_the_maximum_interval():
+    assert compute_next_interval(0.0) == MAX_INTERVAL_SEC
+
+
+def test_interval_follows_velocity_within_bounds():
+    assert compute_next_interval(TARGET_EVENTS_PER_POLL) == 3600
+    assert compute_next_interval(1e9) == MIN_INTERVAL_SEC
+
+
+def test_new_experiment_velocity_is_unknown(experiment_db, experiment):
+    assert experiment_signals(experiment_db, experiment)["velocity_per_hour"] is None
+
+    snapshot(experiment_db, experiment, "A", 0.5, 100, id=1)
+
+    assert experiment_signals(experiment_db, experiment)["velocity_per_hour"] is None
+
+
+def test_velocity_is_measured_from_two_snapshots(experiment_db, experiment):
+    snapshot(experiment_db, experiment, "A", 2, 100, id=1)
+    snapshot(experiment_db, experiment, "A", 1, 300, id=2)
+
+    velocity = experiment_signals(experiment_db, experiment)["velocity_per_hour"]
+
+    assert velocity == pytest.approx(100, rel=0.01)
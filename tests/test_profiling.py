@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from api import backend_main, profiling
+from api.profiling import ProfileStore, new_profile_id
+
+
+def test_profiles_saved_by_a_worker_are_served_by_the_api(monkeypatch):
+    store = ProfileStore()
+    profiling.set_profile_store(store)
+    monkeypatch.setattr(backend_main, "token_valid", lambda token: token == "secret")
+    try:
+        # A task profile saved on a worker host lands in the shared store
+        profile_id = new_profile_id("task")
+        store.save(profile_id, "api.backend_tasks:run 3\n")
+
+        client = TestClient(backend_main.app)
+        listed = client.get("/profiles", headers={"X-Profile-Token": "secret"}).json()["profiles"]
+        assert [p["profile_id"] for p in listed] == [profile_id]
+
+        response = client.get(f"/profiles/{profile_id}", headers={"X-Profile-Token": "secret"})
+        assert response.status_code == 200
+        assert response.text == "api.backend_tasks:run 3\n"
+        assert client.get(f"/profiles/{new_profile_id('task')}", headers={"X-Profile-Token": "secret"}).status_code == 404
+        assert client.get("/profiles/..%2Fetc", headers={"X-Profile-Token": "secret"}).status_code == 404
+    finally:
+        profiling.set_profile_store(None)
+
+
+def test_oldest_profiles_are_dropped_beyond_keep():
+    store = ProfileStore(keep=2)
+    ids = [new_profile_id("req") for _ in range(3)]
+    for profile_id in ids:
+        store.save(profile_id, "main 1\n")
+
+    assert store.load(ids[0]) is None
+    assert [p["profile_id"] for p in store.list()] == [ids[2], ids[1]]
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from api import backend_main, database
+from api.models import Variant, Video
+
+# Any read endpoint on get_read_db will do; this one 404s without touching the thumbnail cache
+READ_PATH = "/variants/6f9619ff-8b86-d011-b42d-00cf4fc964ff/thumbnail"
+
+
+class StubReplicaMonitor:
+    def __init__(self):
+        self.lag_ok = True
+
+    def healthy(self):
+        return self.lag_ok
+
+
+def sqlite_sessions():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    for model in (Video, Variant):
+        model.__table__.create(engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """Separate primary and replica databases, with a replica that is healthy unless told otherwise"""
+    monitor = StubReplicaMonitor()
+    monkeypatch.setattr(database, "SessionLocal", sqlite_sessions())
+    monkeypatch.setattr(database, "ReadSessionLocal", sqlite_sessions())
+    monkeypatch.setattr(database, "replica_monitor", monitor)
+    monkeypatch.setattr(backend_main, "replica_monitor", monitor)
+    return monitor
+
+
+@pytest.fixture
+def client(replica):
+    return TestClient(backend_main.app)
+
+
+def test_reads_go_to_a_healthy_replica(client):
+    response = client.get(READ_PATH)
+
+    assert response.status_code == 404
+    assert response.headers["X-DB-Route"] == "replica"
+
+
+def test_reads_after_a_write_stick_to_the_primary(client):
+    written = client.post("/videos", json={"platform": "youtube", "external_id": "abc123", "title": "t"})
+    assert written.status_code == 200
+    assert float(written.cookies[database.STICKY_COOKIE]) > time.time()
+
+    # The client sends the cookie back on its next request, inside the window
+    assert client.get(READ_PATH).headers["X-DB-Route"] == "primary"
+
+    # The write is visible on the primary only: the replica has not caught up
+    with database.SessionLocal() as primary, database.ReadSessionLocal() as replica:
+        assert primary.query(Video).filter(Video.external_id == "abc123").count() == 1
+        assert replica.query(Video).count() == 0
+
+
+def test_stickiness_expires(client):
+    client.cookies.set(database.STICKY_COOKIE, f"{time.time() - 1:.3f}")
+
+    assert client.get(READ_PATH).headers["X-DB-Route"] == "replica"
+
+
+def test_malformed_cookie_is_ignored(client):
+    client.cookies.set(database.STICKY_COOKIE, "soon")
+
+    assert client.get(READ_PATH).headers["X-DB-Route"] == "replica"
+
+
+def test_lagging_replica_falls_back_to_the_primary(client, replica):
+    replica.lag_ok = False
+
+    assert client.get(READ_PATH).headers["X-DB-Route"] == "primary"
+
+
+def test_failed_writes_do_not_pin_reads(client):
+    response = client.post("/videos", json=[])
+
+    assert response.status_code >= 400
+    assert database.STICKY_COOKIE not in response.cookies
@@ -0,0 +1,57 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from api import backend_main
+from api.results_stream import ResultsBroadcaster
+
+
+class SlowListener(ResultsBroadcaster):
+    """Subscribes after a delay, then delivers every update published through `publish`"""
+
+    def __init__(self, compute, delay=0.05):
+        super().__init__(compute)
+        self.delay = delay
+        self.updates: asyncio.Queue = asyncio.Queue()
+
+    def publish(self, experiment_id):
+        self.updates.put_nowait(experiment_id)
+
+    async def _listen(self):
+        await asyncio.sleep(self.delay)
+        self._subscribed.set()
+        while True:
+            experiment_id = await self.updates.get()
+            self._pending.add(experiment_id)
+            await self._fan_out(experiment_id)
+
+
+def test_updates_published_while_the_initial_payload_is_computed_are_delivered():
+    async def scenario():
+        version = {"n": 1}
+
+        async def compute(experiment_id, method):
+            return {"version": version["n"]}
+
+        broadcaster = SlowListener(compute)
+        queue = await broadcaster.subscribe("exp-1", "frequentist")
+        assert broadcaster._subscribed.is_set()
+
+        # Ingest commits and publishes before the stream has computed its first payload
+        version["n"] = 2
+        broadcaster.publish("exp-1")
+        initial = await compute("exp-1", "frequentist")
+        pushed = await asyncio.wait_for(queue.get(), timeout=1)
+        await broadcaster.stop()
+        return initial, pushed
+
+    initial, pushed = asyncio.run(scenario())
+
+    assert pushed == {"version": 2}
+    assert initial == pushed
+
+
+def test_stream_rejects_malformed_experiment_ids():
+    response = TestClient(backend_main.app).get("/experiments/not-a-uuid/stream")
+
+    assert response.status_code == 422
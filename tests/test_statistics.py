@@ -0,0 +1,46 @@
+from datetime import date, datetime
+
+from api.backend_main import compute_experiment_results
+from api.models import Experiment, MetricsAgg, Variant, Video
+from api.statistics import calculate_bayesian_results
+
+
+def test_bayesian_results_favour_the_better_variant():
+    results = calculate_bayesian_results([10, 20], [1000, 1000], draws=5000, seed=1)
+
+    assert len(results) == 2
+    assert results[1]["prob_best"] > 0.9
+    assert abs(sum(r["prob_best"] for r in results) - 1) < 1e-9
+    lower, upper = results[0]["credible_interval"]
+    assert lower < results[0]["posterior_mean"] < upper
+
+
+def test_bayesian_results_are_reproducible_for_a_seed():
+    first = calculate_bayesian_results([3, 4, 5], [40, 40, 40], draws=2000, seed=7)
+    second = calculate_bayesian_results([3, 4, 5], [40, 40, 40], draws=2000, seed=7)
+    assert first == second
+
+
+def test_experiment_results_bayes_method(experiment_db):
+    video = Video(platform="youtube", external_id="vid-1", title="Video")
+    experiment_db.add(video)
+    experiment_db.flush()
+    experiment = Experiment(name="Thumbnails", video_id=video.id, primary_metric="ctr",
+                            start_at=datetime(2026, 1, 1), status="running")
+    experiment_db.add(experiment)
+    for i, (key, clicks) in enumerate((("A", 50), ("B", 90))):
+        variant = Variant(video_id=video.id, variant_key=key)
+        experiment_db.add(variant)
+        experiment_db.flush()
+        experiment_db.add(MetricsAgg(
+            id=i + 1, video_id=video.id, variant_id=variant.id, date=date(2026, 1, 2),
+            views=1000, likes=10, comments=0, shares=0, impressions=1000, clicks=clicks, watch_time_sec=0
+        ))
+    experiment_db.commit()
+
+    results = compute_experiment_results(experiment_db, experiment, "bayes", seed=3, draws=2000)
+
+    assert results["statistical_results"]["method"] == "bayes"
+    assert set(results["statistical_results"]["prob_best"]) == {"A", "B"}
+    assert all("bayes" in variant for variant in results["variants"])
+    assert results["winner"] == "B"
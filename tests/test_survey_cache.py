@@ -0,0 +1,34 @@
+import pytest
+
+from api.quantile_sketch import QuantileSketches
+from api.survey_cache import AnswerError, CompiledSurvey
+
+
+def survey(question_type="number"):
+    return CompiledSurvey({
+        "id": 1, "is_active": True, "start_date": None, "end_date": None,
+        "questions": [{"id": 10, "question_type": question_type, "options": None, "is_required": False}],
+    }, version=None)
+
+
+@pytest.mark.parametrize("value", ["12", 12, 3.5, {"value": "7"}])
+def test_numbers_are_accepted(value):
+    data = value if isinstance(value, dict) else None
+    text = None if data else value
+    (_, answer_text, answer_data, _, _), = survey().validate([(10, text, data)])
+
+    assert float(answer_text) == answer_data["value"]
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-Infinity", "1e999", 10 ** 400, True, False, "ten"])
+def test_non_finite_and_non_numeric_values_are_rejected(value):
+    with pytest.raises(AnswerError):
+        survey("rating").validate([(10, None, {"value": value})])
+
+
+def test_recording_an_answer_without_a_value_never_raises():
+    sketches = QuantileSketches(redis_client=None)
+
+    sketches.record(10, "number", None)
+
+    assert sketches.digest(10).count == 0
@@ -0,0 +1,47 @@
+import pytest
+
+from api.benchmarks.fake_youtube import FakeThumbnailOrigin
+from api.thumbnails import ThumbnailCache, ThumbnailError
+
+
+@pytest.fixture
+def origin():
+    with FakeThumbnailOrigin(distinct_images=4, image_bytes=1024) as origin:
+        yield origin
+
+
+def make_cache(tmp_path, **kwargs):
+    return ThumbnailCache(str(tmp_path), allowed_hosts=("127.0.0.1",), **kwargs)
+
+
+def test_allowed_origin_is_fetched_once(tmp_path, origin):
+    cache = make_cache(tmp_path)
+    url = f"{origin.url}/vi/video1/hqdefault.jpg"
+
+    digest = cache.get(url)
+
+    assert cache.get(url) == digest
+    assert cache.open(digest)[1] == "image/jpeg"
+    assert origin.stats["requests"] == 1
+
+
+def test_hosts_outside_the_allowlist_are_never_contacted(tmp_path, origin):
+    cache = make_cache(tmp_path)
+    # Same server, but reached through a host name that is not allowed
+    url = origin.url.replace("127.0.0.1", "localhost") + "/vi/video1/hqdefault.jpg"
+
+    with pytest.raises(ThumbnailError, match="not allowed"):
+        cache.get(url)
+    assert origin.stats["requests"] == 0
+
+
+def test_redirects_are_not_followed(tmp_path, origin):
+    target = f"{origin.url.replace('127.0.0.1', 'localhost')}/vi/internal/hqdefault.jpg"
+    with FakeThumbnailOrigin(redirect_to=target) as redirecting:
+        cache = make_cache(tmp_path)
+
+        with pytest.raises(ThumbnailError, match="302"):
+            cache.get(f"{redirecting.url}/vi/video1/hqdefault.jpg")
+
+    assert redirecting.stats["requests"] == 1
+    assert origin.stats["requests"] == 0
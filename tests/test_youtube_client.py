@@ -0,0 +1,95 @@
+import pytest
+import requests
+
+from api.benchmarks.fake_youtube import FakeYouTubeServer
+from api.youtube_client import MAX_IDS_PER_REQUEST, QuotaExceeded, YouTubeClient
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    return YouTubeClient(base_url=server.url, redis_client=None, **kwargs)
+
+
+def test_ids_are_batched_per_request():
+    ids = [f"video-{i}" for i in range(MAX_IDS_PER_REQUEST * 2 + 5)]
+    with FakeYouTubeServer() as server:
+        statistics = make_client(server).get_video_statistics(ids + ids[:10])
+
+    assert set(statistics) == set(ids)
+    assert server.stats["requests"] == 3
+    assert set(statistics["video-0"]) == {"views", "likes", "comments"}
+
+
+def test_unchanged_payloads_are_served_from_the_etag_cache():
+    with FakeYouTubeServer(change_rate=0.0) as server:
+        client = make_client(server)
+        first = client.get_video_statistics(["a", "b"])
+        second = client.get_video_statistics(["a", "b"])
+
+    assert first == second
+    assert server.stats == {"requests": 2, "not_modified": 1, "errors": 0}
+
+
+def test_503s_are_retried_with_backoff_and_charged_once():
+    with FakeYouTubeServer() as server:
+        server.fail_next = 2
+        client = make_client(server)
+        statistics = client.get_video_statistics(["a"])
+
+    assert "a" in statistics
+    assert server.stats["errors"] == 2
+    assert server.stats["requests"] == 3
+    assert client.quota.used() == 1
+
+
+def test_persistent_503s_give_up_after_max_retries():
+    with FakeYouTubeServer() as server:
+        server.fail_next = 10
+        client = make_client(server, max_retries=2)
+        with pytest.raises(requests.HTTPError):
+            client.get_video_statistics(["a"])
+
+    assert server.stats["requests"] == 3
+
+
+def test_local_daily_quota_is_enforced():
+    with FakeYouTubeServer() as server:
+        client = make_client(server, daily_quota=2)
+        client.get_video_statistics(["a"])
+        client.get_video_statistics(["b"])
+        with pytest.raises(QuotaExceeded):
+            client.get_video_statistics(["c"])
+
+    assert server.stats["requests"] == 2
+    assert client.quota.used() == 2
+
+
+def test_api_quota_exhaustion_raises():
+    with FakeYouTubeServer(quota_requests=1) as server:
+        client = make_client(server)
+        client.get_video_statistics(["a"])
+        with pytest.raises(QuotaExceeded):
+            client.get_video_statistics(["b"])
+
+
+def test_hidden_counters_are_left_out_not_zeroed():
+    with FakeYouTubeServer(hidden=("likeCount", "commentCount")) as server:
+        statistics = make_client(server).get_video_statistics(["a"])
+
+    assert set(statistics["a"]) == {"views"}
+
+
+class ExhaustedBucket:
+    def acquire(self, tokens=1, max_wait=30.0):
+        raise TimeoutError("bucket did not refill")
+
+
+def test_rate_limit_timeouts_are_not_charged():
+    with FakeYouTubeServer() as server:
+        client = make_client(server)
+        client.bucket = ExhaustedBucket()
+        with pytest.raises(TimeoutError):
+            client.get_video_statistics(["a"])
+
+    assert client.quota.used() == 0
+    assert server.stats["requests"] == 0